@@ -0,0 +1,242 @@
+import base64
+import json
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from route_lod import parse_bbox
+from timeline_store import _NS_PER_DAY, to_epoch_ns
+
+# Predicate masks kept per snapshot; each costs one byte per activity
+MASK_CACHE_SIZE = 64
+MAX_PAGE_SIZE = 5000
+
+
+def _values(args, name):
+    """Every value of a query parameter given repeatedly and/or comma-separated, sorted"""
+    values = set()
+    for raw in args.getlist(name):
+        values.update(value.strip() for value in raw.split(','))
+    values.discard('')
+    return tuple(sorted(values))
+
+
+def _minimum(args, name):
+    value = (args.get(name) or '').strip()
+    if not value:
+        return None
+    number = float(value)
+    if not math.isfinite(number) or number < 0:
+        raise ValueError(f'{name} must be a non-negative number')
+    return number
+
+
+def parse_flag(args, name):
+    """A boolean query parameter: 1/true/yes or 0/false/no, False when absent"""
+    value = (args.get(name) or '').strip().lower()
+    if value in ('', '0', 'false', 'no'):
+        return False
+    if value in ('1', 'true', 'yes'):
+        return True
+    raise ValueError(f'{name} must be true or false')
+
+
+class ActivityQuery:
+    """Filters on activities; a row matches when it passes every predicate given.
+
+    - ``start_ns``/``end_ns``: inclusive range on the start time
+    - ``modes``: any of these activity types
+    - ``countries``: starts or ends in any of these countries
+    - ``bbox``: (min_lng, min_lat, max_lng, max_lat) the activity's line overlaps
+    - ``min_distance``: meters, ``min_duration``: hours
+    - ``exclude_outliers``: drop activities flagged implausible (see geodesic.py)
+    """
+
+    def __init__(self, start_ns=None, end_ns=None, modes=(), countries=(), bbox=None,
+                 min_distance=None, min_duration=None, exclude_outliers=False):
+        self.start_ns = start_ns
+        self.end_ns = end_ns
+        self.modes = tuple(sorted(set(modes)))
+        self.countries = tuple(sorted(set(countries)))
+        self.bbox = tuple(bbox) if bbox is not None else None
+        self.min_distance = min_distance
+        self.min_duration = min_duration
+        self.exclude_outliers = bool(exclude_outliers)
+
+    @classmethod
+    def from_args(cls, args):
+        """Build a query from request arguments; raises ValueError for malformed values"""
+        bounds = []
+        for name in ('start_date', 'end_date'):
+            value = (args.get(name) or '').strip()
+            try:
+                bounds.append(to_epoch_ns(value) if value else None)
+            except (ValueError, TypeError):
+                raise ValueError(f'{name} must be a date')
+        bbox = (args.get('bbox') or '').strip()
+        return cls(
+            start_ns=bounds[0],
+            end_ns=bounds[1],
+            modes=_values(args, 'transport_mode'),
+            countries=_values(args, 'country'),
+            bbox=parse_bbox(bbox) if bbox else None,
+            min_distance=_minimum(args, 'min_distance'),
+            min_duration=_minimum(args, 'min_duration'),
+            exclude_outliers=parse_flag(args, 'exclude_outliers')
+        )
+
+    def key(self):
+        """Canonical form, for cache keys"""
+        return (self.start_ns, self.end_ns, self.modes, self.countries, self.bbox,
+                self.min_distance, self.min_duration, self.exclude_outliers)
+
+    def whole_days(self):
+        """The same query with its date range widened to whole UTC days"""
+        query = ActivityQuery.__new__(ActivityQuery)
+        query.__dict__.update(self.__dict__)
+        if self.start_ns is not None:
+            query.start_ns = self.start_ns // _NS_PER_DAY * _NS_PER_DAY
+        if self.end_ns is not None:
+            query.end_ns = (self.end_ns // _NS_PER_DAY + 1) * _NS_PER_DAY - 1
+        return query
+
+    def with_outliers(self):
+        """The same query without the outlier filter"""
+        query = ActivityQuery.__new__(ActivityQuery)
+        query.__dict__.update(self.__dict__)
+        query.exclude_outliers = False
+        return query
+
+    def dates_only(self):
+        """True when nothing but the date range filters rows"""
+        return not (self.modes or self.countries or self.bbox is not None
+                    or self.min_distance is not None or self.min_duration is not None
+                    or self.exclude_outliers)
+
+
+def encode_cursor(version, position, start_ns):
+    """Opaque cursor pointing at the next row of a paginated query"""
+    raw = json.dumps([version, int(position), int(start_ns)], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(version, position, start_ns) of a cursor; raises ValueError if it was not made by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        version, position, start_ns = json.loads(raw)
+        return str(version), int(position), int(start_ns)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise ValueError('invalid cursor')
+
+
+class ActivityQueryEngine:
+    """Evaluates ActivityQuery filters over one snapshot's ActivityStore.
+
+    The date range is a row range found by binary search (rows are sorted
+    by start time) and the bbox a lookup in the snapshot's grid index over
+    activity lines. Every other predicate is a boolean mask over all rows,
+    built on first use and kept in a small LRU, so repeated filters cost
+    one AND per predicate over the rows in the date range.
+    """
+
+    def __init__(self, activities, version, grid, outliers=None):
+        self.activities = activities
+        self.version = version
+        self.grid = grid
+        # One flag per activity; without it nothing counts as an outlier
+        self.outliers = outliers if outliers is not None else np.zeros(len(activities), dtype=bool)
+        self._masks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _mask(self, key, build):
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+        mask = build()
+        with self._lock:
+            self._masks[key] = mask
+            while len(self._masks) > MASK_CACHE_SIZE:
+                self._masks.popitem(last=False)
+        return mask
+
+    def _category_mask(self, positions_by_code, codes):
+        mask = np.zeros(len(self.activities), dtype=bool)
+        for code in codes:
+            if code is not None and code in positions_by_code:
+                mask[positions_by_code[code]] = True
+        return mask
+
+    def _predicate_masks(self, query):
+        a = self.activities
+        masks = []
+        if query.modes:
+            masks.append(self._mask(('modes', query.modes), lambda: self._category_mask(
+                a.type_positions, [a.type_code(mode) for mode in query.modes])))
+        if query.countries:
+            masks.append(self._mask(('countries', query.countries), lambda: self._category_mask(
+                a.country_positions, [a.country_code(country) for country in query.countries])))
+        if query.min_distance is not None:
+            # Activities without a distance never pass
+            masks.append(self._mask(('min_distance', query.min_distance),
+                                    lambda: a.distance >= query.min_distance))
+        if query.min_duration is not None:
+            masks.append(self._mask(('min_duration', query.min_duration),
+                                    lambda: a.duration_hours >= query.min_duration))
+        if query.exclude_outliers:
+            masks.append(self._mask(('exclude_outliers',), lambda: ~self.outliers))
+        return masks
+
+    def select(self, query=None):
+        """Rows matching the query: a slice when only the date range applies, else sorted positions"""
+        query = query or ActivityQuery()
+        lo, hi = self.activities.time_bounds(query.start_ns, query.end_ns)
+        masks = self._predicate_masks(query)
+        if query.bbox is not None:
+            # Activities whose straight line overlaps the bbox, usually far fewer than the date range
+            positions = self.grid.query(query.bbox)
+            positions = positions[np.searchsorted(positions, lo):np.searchsorted(positions, hi)]
+            for mask in masks:
+                positions = positions[mask[positions]]
+            return positions
+        if not masks:
+            return slice(lo, hi)
+        combined = masks[0][lo:hi].copy()
+        for mask in masks[1:]:
+            combined &= mask[lo:hi]
+        return np.flatnonzero(combined) + lo
+
+    def page(self, query=None, limit=MAX_PAGE_SIZE, cursor=None):
+        """Up to ``limit`` matching rows after the cursor, and the cursor of the next page (None at the end).
+
+        A cursor from an older snapshot resumes at the first row starting at
+        or after its next row's start time, so a page can repeat rows that
+        share that start time but never skips any.
+        """
+        selection = self.select(query)
+        first = 0
+        if cursor:
+            version, position, start_ns = decode_cursor(cursor)
+            if version != self.version:
+                position = int(np.searchsorted(self.activities.start, start_ns, side='left'))
+            first = position
+
+        if isinstance(selection, slice):
+            begin = max(selection.start, first)
+            stop = min(selection.stop, begin + limit)
+            positions = np.arange(begin, max(stop, begin), dtype=np.int64)
+            has_more = stop < selection.stop
+        else:
+            begin = int(np.searchsorted(selection, first))
+            positions = selection[begin:begin + limit]
+            has_more = begin + limit < len(selection)
+
+        next_cursor = None
+        if has_more:
+            following = int(positions[-1]) + 1 if len(positions) else first
+            next_cursor = encode_cursor(self.version, following, self.activities.start[following])
+        return positions, next_cursor
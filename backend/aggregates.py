@@ -0,0 +1,219 @@
+import numpy as np
+import pandas as pd
+
+from timeline_store import _NS_PER_DAY, ActivityStore, VisitStore
+
+GRANULARITIES = ('day', 'week', 'month')
+GROUP_BY = ('mode', 'country')
+
+
+def _reduce(keys, values):
+    """Sum ``values`` (a dict of arrays) over rows with equal key tuples; returns the unique keys and sums"""
+    if not len(keys[0]):
+        return [k[:0] for k in keys], {name: v[:0] for name, v in values.items()}
+    order = np.lexsort(keys[::-1])
+    sorted_keys = [k[order] for k in keys]
+    change = np.zeros(len(order), dtype=bool)
+    change[0] = True
+    for k in sorted_keys:
+        change[1:] |= k[1:] != k[:-1]
+    starts = np.flatnonzero(change)
+    return [k[starts] for k in sorted_keys], {name: np.add.reduceat(v[order], starts) for name, v in values.items()}
+
+
+def _translate(codes, categories, table):
+    """Re-code category codes against a combined table; -1 stays -1"""
+    lookup = {value: i for i, value in enumerate(table)}
+    mapping = np.array([lookup[value] for value in categories] + [-1], dtype=np.int16)
+    return mapping[codes]
+
+
+def bucket_starts(days, granularity):
+    """Map UTC day numbers to the first day of their day, ISO week (Monday) or month"""
+    days = np.asarray(days, dtype=np.int64)
+    if granularity == 'day':
+        return days
+    if granularity == 'week':
+        # Day 0 (1970-01-01) was a Thursday
+        return days - (days + 3) % 7
+    if granularity == 'month':
+        months = days.astype('datetime64[D]').astype('datetime64[M]')
+        return months.astype('datetime64[D]').astype(np.int64)
+    raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+
+
+class DailyRollup:
+    """Activity totals per day x activity type x country, and visit dwell time per day.
+
+    Rows are sparse (only combinations that occur) and sorted by day.
+    Activities count towards the day and country they start in (the end
+    country when the start is unknown); every country an activity starts or
+    ends in is recorded as visited. Types and countries are kept by name so
+    rollups of different loads can be combined without rebuilding them.
+    """
+
+    def __init__(self, activities, visits, positions=None):
+        # ``positions`` restricts the activities to a filtered selection
+        rows = slice(None) if positions is None else positions
+        start_codes = activities.start_country_codes[rows]
+        end_codes = activities.end_country_codes[rows]
+        country = np.where(start_codes >= 0, start_codes, end_codes)
+        (self.day, self.type_codes, self.country_codes), sums = _reduce(
+            [activities.start[rows] // _NS_PER_DAY, activities.type_codes[rows], country],
+            {
+                'distance': np.nan_to_num(activities.distance[rows]),
+                'duration_hours': activities.duration_hours[rows],
+                'count': np.ones(len(country), dtype=np.int64)
+            }
+        )
+        self.distance = sums['distance']
+        self.duration_hours = sums['duration_hours']
+        self.count = sums['count']
+        self.types = np.asarray(activities.types, dtype=object)
+        self.countries = np.asarray(activities.countries, dtype=object)
+        seen = np.union1d(start_codes, end_codes)
+        self.country_seen = np.zeros(len(self.countries), dtype=bool)
+        self.country_seen[seen[seen >= 0]] = True
+
+        (self.visit_day,), visit_sums = _reduce(
+            [visits.start // _NS_PER_DAY],
+            {'dwell_hours': visits.duration_hours, 'count': np.ones(len(visits), dtype=np.int64)}
+        )
+        self.visit_dwell_hours = visit_sums['dwell_hours']
+        self.visit_count = visit_sums['count']
+
+    @classmethod
+    def from_frames(cls, frames):
+        """Rollup of processed frames, e.g. the new segments of an ingestion"""
+        activity_df = frames.get('activities', pd.DataFrame())
+        visit_df = frames.get('visits', pd.DataFrame())
+        if not activity_df.empty:
+            activity_df = activity_df.sort_values('startTime', kind='stable', ignore_index=True)
+        if not visit_df.empty:
+            visit_df = visit_df.sort_values('startTime', kind='stable', ignore_index=True)
+        return cls(ActivityStore(activity_df), VisitStore(visit_df))
+
+    def combine(self, other):
+        """A rollup of both rollups' rows, as if built from all of their segments"""
+        types = np.asarray(list(dict.fromkeys([*self.types, *other.types])), dtype=object)
+        countries = np.asarray(list(dict.fromkeys([*self.countries, *other.countries])), dtype=object)
+        combined = DailyRollup.__new__(DailyRollup)
+        combined.types, combined.countries = types, countries
+
+        (combined.day, combined.type_codes, combined.country_codes), sums = _reduce(
+            [
+                np.concatenate((self.day, other.day)),
+                np.concatenate((_translate(self.type_codes, self.types, types),
+                                _translate(other.type_codes, other.types, types))),
+                np.concatenate((_translate(self.country_codes, self.countries, countries),
+                                _translate(other.country_codes, other.countries, countries)))
+            ],
+            {name: np.concatenate((getattr(self, name), getattr(other, name)))
+             for name in ('distance', 'duration_hours', 'count')}
+        )
+        combined.distance = sums['distance']
+        combined.duration_hours = sums['duration_hours']
+        combined.count = sums['count']
+
+        seen = set(self.countries[self.country_seen]) | set(other.countries[other.country_seen])
+        combined.country_seen = np.array([name in seen for name in countries], dtype=bool)
+
+        (combined.visit_day,), visit_sums = _reduce(
+            [np.concatenate((self.visit_day, other.visit_day))],
+            {
+                'dwell_hours': np.concatenate((self.visit_dwell_hours, other.visit_dwell_hours)),
+                'count': np.concatenate((self.visit_count, other.visit_count))
+            }
+        )
+        combined.visit_dwell_hours = visit_sums['dwell_hours']
+        combined.visit_count = visit_sums['count']
+        return combined
+
+    def _type_mask(self, activity_types):
+        return np.isin(self.type_codes, np.flatnonzero(np.isin(self.types, list(activity_types))))
+
+    def total_count(self):
+        return int(self.count.sum())
+
+    def count_by_type(self, activity_types):
+        return int(self.count[self._type_mask(activity_types)].sum())
+
+    def distance_by_type(self, activity_types):
+        """Total distance in meters over activities of the given types"""
+        return float(self.distance[self._type_mask(activity_types)].sum())
+
+    def most_common_type(self):
+        valid = self.type_codes >= 0
+        counts = np.bincount(self.type_codes[valid], weights=self.count[valid], minlength=len(self.types))
+        return self.types[counts.argmax()] if counts.any() else None
+
+    def country_names(self):
+        """Every country an activity starts or ends in"""
+        return self.countries[self.country_seen].tolist()
+
+    def day_range(self, start_ns=None, end_ns=None):
+        """Activity and visit rows of the UTC days from ``start_ns`` to ``end_ns`` (inclusive), as slices"""
+        start_day = None if start_ns is None else start_ns // _NS_PER_DAY
+        end_day = None if end_ns is None else end_ns // _NS_PER_DAY
+        bounds = []
+        for days in (self.day, self.visit_day):
+            lo = 0 if start_day is None else int(np.searchsorted(days, start_day, side='left'))
+            hi = len(days) if end_day is None else int(np.searchsorted(days, end_day, side='right'))
+            bounds.append(slice(lo, max(hi, lo)))
+        return bounds
+
+    def timeseries(self, granularity='day', group_by=None, start_ns=None, end_ns=None):
+        """Totals per bucket, optionally split by activity type or country.
+
+        Returns (bucket start midnights in epoch ns, series, visits). Works on
+        the rollup rows only, so the cost depends on the number of
+        day x type x country combinations and buckets, not on the number of
+        activities. Buckets run continuously from the first to the last one
+        with data, empty buckets holding zeros.
+        """
+        if group_by not in (None,) + GROUP_BY:
+            raise ValueError(f"group_by must be one of {', '.join(GROUP_BY)}")
+        rows, visit_rows = self.day_range(start_ns, end_ns)
+        bucket = bucket_starts(self.day[rows], granularity)
+        visit_bucket = bucket_starts(self.visit_day[visit_rows], granularity)
+
+        present = np.concatenate((bucket, visit_bucket))
+        if not len(present):
+            return np.empty(0, dtype=np.int64), [], {}
+        # Every bucket start from the first to the last, whatever the granularity
+        all_days = np.arange(present.min(), present.max() + 1)
+        buckets = np.unique(bucket_starts(all_days, granularity))
+        index = np.searchsorted(buckets, bucket)
+        visit_index = np.searchsorted(buckets, visit_bucket)
+
+        if group_by == 'mode':
+            codes, names = self.type_codes[rows], self.types
+        elif group_by == 'country':
+            codes, names = self.country_codes[rows], self.countries
+        else:
+            codes, names = np.zeros(len(index), dtype=np.int16), np.array(['all'], dtype=object)
+        # Missing types or countries are grouped under the last slot
+        groups = np.where(codes >= 0, codes, len(names)).astype(np.int64)
+        size = len(buckets) * (len(names) + 1)
+        cell = groups * len(buckets) + index
+
+        totals = {
+            name: np.bincount(cell, weights=values[rows], minlength=size).reshape(len(names) + 1, len(buckets))
+            for name, values in (('distance', self.distance), ('duration_hours', self.duration_hours),
+                                 ('count', self.count))
+        }
+        series = []
+        labels = list(names) + [None]
+        for group in np.flatnonzero(totals['count'].sum(axis=1)).tolist():
+            series.append({
+                'key': labels[group],
+                'distance': totals['distance'][group],
+                'duration_hours': totals['duration_hours'][group],
+                'count': totals['count'][group].astype(np.int64)
+            })
+
+        visits = {
+            'dwell_hours': np.bincount(visit_index, weights=self.visit_dwell_hours[visit_rows], minlength=len(buckets)),
+            'count': np.bincount(visit_index, weights=self.visit_count[visit_rows], minlength=len(buckets)).astype(np.int64)
+        }
+        return buckets * _NS_PER_DAY, series, visits
@@ -1,18 +1,34 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
-import json
-from datetime import datetime, timedelta
+import hmac
+import threading
+import time
+from datetime import datetime
 import os
 from pathlib import Path
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderServiceError
-import time
-from functools import lru_cache
-import plotly.graph_objects as go
-import plotly.express as px
-import plotly
+from timeline_loader import DATA_DIR, JOURNEY_START
+from processed_cache import CACHE_DIR, file_lock, load_or_build, source_fingerprint
+from response_cache import ResponseCache
+from plotly_figure import figure_json, mapbox_line_traces, plotly_template
+from route_lod import parse_bbox, zoom_for_bbox, zoom_tolerance_km
+from path_encoding import PRECISION, encode_polylines, pack_paths
+from geocoding import create_geocoder, fallback_location
+from geocode_worker import GeocodeWorkerPool
+from timeline_ingest import (
+    additions_dir_for, additions_version, apply_additions, dataset_version, export_version, ingest_export, merge_frames,
+    save_upload, segment_count
+)
+from timeline_snapshot import TimelineSnapshot
+from aggregates import GRANULARITIES, GROUP_BY, DailyRollup
+from activity_query import MAX_PAGE_SIZE, ActivityQuery, ActivityQueryEngine, decode_cursor, parse_flag
+from shared_snapshot import build_lock_for, load_snapshot, remove_stale, save_snapshot, shared_path_for
+from timeline_store import _NS_PER_DAY, as_positions, date_strings, iso_strings
+from waitlist_store import create_waitlist_store
+from journey_registry import JourneyRegistry, valid_journey_id
+from upload_jobs import UploadQueue, public_job, read_job, save_stream
+from metrics import REGISTRY, SIZE_BUCKETS, SamplingProfiler, counter, gauge, histogram, stage
 
 app = Flask(__name__)
 CORS(app, origins=[
@@ -29,173 +45,283 @@ CORS(app, origins=[
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"])
 
 # Path to the Google Timeline data
-TIMELINE_JSON_PATH = Path(__file__).parent / "src" / "data" / "google_timeline.json"
+TIMELINE_JSON_PATH = Path(os.environ.get('TIMELINE_JSON_PATH', DATA_DIR / "google_timeline.json"))
+
+# Upper bound on the vertices in one map response
+MAP_MAX_VERTICES = 5000
+
+# Upper bounds for the spatial stop queries
+MAX_NEAREST_STOPS = 100
+MAX_STOP_RADIUS_KM = 500.0
+
+# Orders /api/places can be listed in
+PLACE_SORTS = ('recent', 'dwell', 'visits')
 
 class TimelineProcessor:
-    def __init__(self, json_path):
+    def __init__(self, json_path, shared=False, background=True, start_date=JOURNEY_START, cache_dir=CACHE_DIR,
+                 additions_dir=None, geocoder=None):
         self.json_path = json_path
-        self.timeline_data = None
-        self.timeline_semantic_df = None
-        self.activity_final = None
-        self.visit_df = None
-        self.geocoder = Nominatim(user_agent="van_journey_app")
-        self._load_and_process_data()
+        # Segments before the start of the journey are dropped
+        self.start_date = start_date
+        self.cache_dir = cache_dir
+        self.additions_dir = additions_dir if additions_dir is not None else additions_dir_for(json_path)
+        # Shared mode maps the stores' arrays from one file per version that every worker reads
+        self.shared = shared
+        self.timeline_loaded = False
+        # Every endpoint reads one snapshot; new data is published by swapping the reference
+        self.snapshot = TimelineSnapshot()
+        # Journeys share one geocoder, and with it the offline place data and the online cache
+        self.geocoder = geocoder or create_geocoder()
+        # Place names are resolved in the background and written into the place store
+        self.geocode_pool = GeocodeWorkerPool(self.geocoder)
+        # Without background work (a preloading master) no threads or geocoder lookups are started
+        self.background = background
+        self._place_lock = threading.Lock()
+        # Loads, reloads and ingestion build snapshots one at a time
+        self._update_lock = threading.Lock()
+        self._base_version = 'empty'
+        self._signature = None
+        self._watcher = None
+        self._closed = threading.Event()
+        with self._update_lock:
+            self._load_and_process_data()
+    
+    @property
+    def dataset_version(self):
+        """Identifies the loaded data; cached responses are keyed by it"""
+        return self.snapshot.version
+    
+    def _source_signature(self):
+        """What the loaded data was built from: the export's mtime and size, and the saved additions"""
+        try:
+            stat = os.stat(self.json_path)
+            export = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            export = None
+        return export, additions_version(self.additions_dir)
     
     def _load_and_process_data(self):
-        """Load and process the Google Timeline JSON data"""
+        """Load processed activity and visit tables, from the on-disk cache when it is fresh"""
+        # Taken first, so a change made while loading is picked up by the next check
+        self._signature = self._source_signature()
         try:
-            with open(self.json_path, 'r') as f:
-                self.timeline_data = json.load(f)
-            
-            # Create semantic segments dataframe
-            self.timeline_semantic_df = pd.DataFrame(self.timeline_data['semanticSegments'])
-            
-            # Add boolean flags for activity types
-            self.timeline_semantic_df['is_path'] = np.where(
-                self.timeline_semantic_df['timelinePath'].notnull(), 1, 0
-            )
-            self.timeline_semantic_df['is_visit'] = np.where(
-                self.timeline_semantic_df['visit'].notnull(), 1, 0
-            )
-            self.timeline_semantic_df['is_activity'] = np.where(
-                self.timeline_semantic_df['activity'].notnull(), 1, 0
-            )
-            
-            # Convert timestamps
-            self.timeline_semantic_df['startTime'] = pd.to_datetime(
-                self.timeline_semantic_df['startTime'], utc=True
-            )
-            self.timeline_semantic_df['endTime'] = pd.to_datetime(
-                self.timeline_semantic_df['endTime'], utc=True
-            )
-            
-            # Filter for entries from June 10th onwards (as in notebook)
-            self.timeline_semantic_df = self.timeline_semantic_df[
-                self.timeline_semantic_df['startTime'] >= pd.to_datetime('2025-06-10', utc=True)
-            ]
-            
-            # Process activities and visits
-            self._process_activities()
-            self._process_visits()
+            fingerprint = source_fingerprint(self.json_path, with_hash=False)
+            self._base_version = export_version(fingerprint)
+            if self.shared:
+                with stage('load.shared'):
+                    snapshot = self._load_shared()
+            else:
+                with stage('load.frames'):
+                    frames = self._load_frames()
+                with stage('load.snapshot'):
+                    snapshot = TimelineSnapshot(frames, self._version())
+            self.timeline_loaded = True
+            with stage('load.publish'):
+                self._publish(snapshot)
             
         except Exception as e:
+            # The current snapshot (empty before the first load) keeps serving
             print(f"Error processing timeline data: {e}")
-            # Initialize empty dataframes as fallback
-            self.timeline_semantic_df = pd.DataFrame()
-            self.activity_final = pd.DataFrame()
-            self.visit_df = pd.DataFrame()
     
-    def _process_activities(self):
-        """Process activity data similar to notebook logic"""
-        activity_df = self.timeline_semantic_df[self.timeline_semantic_df['is_activity'] == 1]
-        
-        if activity_df.empty:
-            self.activity_final = pd.DataFrame()
-            return
-        
-        # Expand activity column
-        activity_expanded = pd.json_normalize(activity_df['activity'])
-        
-        # Extract coordinates from latLng strings
-        if 'start.latLng' in activity_expanded.columns:
-            activity_expanded['start_latitude'] = activity_expanded['start.latLng'].str.extract(r'([\d.-]+)°').astype(float)
-            activity_expanded['start_longitude'] = activity_expanded['start.latLng'].str.extract(r', ([\d.-]+)°').astype(float)
-        
-        if 'end.latLng' in activity_expanded.columns:
-            activity_expanded['end_latitude'] = activity_expanded['end.latLng'].str.extract(r'([\d.-]+)°').astype(float)
-            activity_expanded['end_longitude'] = activity_expanded['end.latLng'].str.extract(r', ([\d.-]+)°').astype(float)
-        
-        if 'parking.location.latLng' in activity_expanded.columns:
-            activity_expanded['parking_latitude'] = activity_expanded['parking.location.latLng'].str.extract(r'([\d.-]+)°').astype(float)
-            activity_expanded['parking_longitude'] = activity_expanded['parking.location.latLng'].str.extract(r', ([\d.-]+)°').astype(float)
-        
-        # Select relevant columns
-        clean_cols = [col for col in [
-            'start_latitude', 'start_longitude', 'end_latitude', 'end_longitude',
-            'distanceMeters', 'probability', 'topCandidate.type', 'parking.startTime',
-            'parking_latitude', 'parking_longitude'
-        ] if col in activity_expanded.columns]
-        
-        # Combine with original activity data
-        self.activity_final = pd.concat([
-            activity_df.reset_index(drop=True),
-            activity_expanded[clean_cols].reset_index(drop=True)
-        ], axis=1)
-    
-    def _process_visits(self):
-        """Process visit data"""
-        self.visit_df = self.timeline_semantic_df[self.timeline_semantic_df['is_visit'] == 1]
-        
-        # Extract visit locations
-        if not self.visit_df.empty:
-            visit_locations = []
-            for _, visit in self.visit_df.iterrows():
-                visit_data = visit.get('visit', {})
-                if isinstance(visit_data, dict):
-                    location = visit_data.get('topCandidate', {}).get('placeLocation', {})
-                    lat_lng = location.get('latLng', '')
-                    if lat_lng:
-                        coords = self._extract_coordinates(lat_lng)
-                        if coords:
-                            visit_locations.append(coords)
-            
-            self.visit_locations = visit_locations
+    def _load_frames(self):
+        """Processed frames of the export plus the segments ingested since it was written"""
+        # The export is only streamed and reprocessed when it changed since the
+        # cache was built; otherwise the typed columns are read straight back
+        frames = load_or_build(self.json_path, self.start_date, self.cache_dir)
+        return apply_additions(frames, self.additions_dir)
+    
+    def _load_shared(self):
+        """Map the shared file for the current version, building it if no worker has yet"""
+        version = self._version()
+        path = shared_path_for(self.json_path, version, self.cache_dir)
+        snapshot = self._map_shared(path)
+        if snapshot is not None:
+            return snapshot
+        # One worker builds the file while the others wait for it
+        with file_lock(build_lock_for(self.json_path, self.cache_dir)):
+            snapshot = self._map_shared(path)
+            if snapshot is not None:
+                return snapshot
+            return self._share(TimelineSnapshot(self._load_frames(), version))
     
-    def _extract_coordinates(self, lat_lng_str):
-        """Extract latitude and longitude from latLng string"""
+    def _map_shared(self, path):
+        """The snapshot in an existing shared file, or None if there is none in the current format"""
+        if not path.exists():
+            return None
         try:
-            import re
-            match = re.search(r'([\d.-]+)°, ([\d.-]+)°', lat_lng_str)
-            if match:
-                lat = float(match.group(1))
-                lng = float(match.group(2))
-                return (lat, lng)
-        except:
-            pass
-        return None
+            return load_snapshot(path)
+        except ValueError as e:
+            print(f"Rebuilding shared snapshot: {e}")
+            return None
     
-    @lru_cache(maxsize=2000)
-    def _reverse_geocode(self, lat, lng):
-        """Get location details from coordinates with caching"""
+    def _share(self, snapshot):
+        """Write a snapshot to its shared file and map it back, so this worker shares the pages too"""
+        path = shared_path_for(self.json_path, snapshot.version, self.cache_dir)
         try:
-            time.sleep(0.15)  # Increased rate limiting for free service
-            location = self.geocoder.reverse(f"{lat}, {lng}", timeout=15, exactly_one=True)
-            if location and location.raw:
-                address = location.raw.get('address', {})
-                country = address.get('country', '')
-                if not country and 'display_name' in location.raw:
-                    # Try to extract country from display_name as fallback
-                    display_parts = location.raw['display_name'].split(', ')
-                    if len(display_parts) > 0:
-                        country = display_parts[-1]
-                
-                return {
-                    'name': location.address,
-                    'city': address.get('city', address.get('town', address.get('village', ''))),
-                    'country': country,
-                    'country_code': address.get('country_code', '').upper(),
-                    'state': address.get('state', ''),
-                    'display_name': location.address
-                }
-        except (GeocoderTimedOut, GeocoderServiceError) as e:
-            print(f"Geocoding timeout/service error for {lat}, {lng}: {e}")
-            time.sleep(1)  # Wait longer after errors
-        except Exception as e:
-            print(f"Geocoding error for {lat}, {lng}: {e}")
+            save_snapshot(path, snapshot)
+            remove_stale(self.json_path, path, self.cache_dir)
+            return load_snapshot(path)
+        except OSError as e:
+            print(f"Could not share timeline snapshot {path}: {e}")
+            return snapshot
+    
+    def reload_if_changed(self):
+        """Rebuild and swap in a new snapshot if the export or its additions changed; True if so"""
+        if self._source_signature() == self._signature:
+            return False
+        with self._update_lock:
+            if self._source_signature() == self._signature:
+                return False
+            started = time.perf_counter()
+            self._load_and_process_data()
+            print(f"Reloaded timeline data as {self.dataset_version} in {time.perf_counter() - started:.2f}s")
+            return True
+    
+    def watch(self, interval):
+        """Check for changed data every ``interval`` seconds in a background thread"""
+        if interval <= 0 or self._watcher is not None:
+            return
         
-        return {
-            'name': f"Location at {lat:.4f}, {lng:.4f}",
-            'city': '',
-            'country': '',
-            'country_code': '',
-            'state': '',
-            'display_name': f"Unknown location at {lat:.4f}, {lng:.4f}"
-        }
+        def run():
+            while not self._closed.wait(interval):
+                try:
+                    self.reload_if_changed()
+                except Exception as e:
+                    print(f"Error reloading timeline data: {e}")
+        
+        self._watcher = threading.Thread(target=run, name='timeline-watcher', daemon=True)
+        self._watcher.start()
+    
+    def start_background(self, poll_seconds, after_fork=False):
+        """Start geocoding and dataset watching, in a worker forked from a preloading master.
+
+        After a fork the geocoder is recreated, so each worker opens its own
+        SQLite connections instead of sharing the master's.
+        """
+        if after_fork:
+            self.geocoder = create_geocoder()
+            self.geocode_pool = GeocodeWorkerPool(self.geocoder)
+            self._watcher = None
+        self.background = True
+        self._start_geocoding(self.snapshot)
+        self.watch(poll_seconds)
+    
+    def close(self):
+        """Stop the watcher and geocoding threads of a processor that is no longer served"""
+        self._closed.set()
+        self.geocode_pool.stop()
+    
+    def _version(self):
+        return dataset_version(self._base_version, self.additions_dir)
+    
+    def _start_geocoding(self, snapshot):
+        places = snapshot.places
+        if not self.background or not len(places):
+            return
+        # Pull any cached online geocodes for the places into memory
+        self.geocoder.prewarm(places.lat, places.lng)
+        # One lookup per place, at its centroid; the offline names are written into the new store
+        # before it is published, and only the online refinements arrive later
+        self.geocode_pool.start(
+            places.lat, places.lng, places.last_end,
+            lambda rows, names, pending: self._store_place_locations(places, rows, names, pending)
+        )
+    
+    def _publish(self, snapshot):
+        """Make a snapshot the one endpoints read"""
+        self._start_geocoding(snapshot)
+        self.snapshot = snapshot
+        return snapshot
+    
+    def ingest(self, upload_path):
+        """Merge the segments of an uploaded export (or delta) that are not loaded yet.
+
+        Only the new segments are processed; the current snapshot keeps
+        serving until the merged one is complete. Returns the number of
+        segments added.
+        """
+        # Catch up first with anything another worker ingested, so it is not ingested twice
+        self.reload_if_changed()
+        with self._update_lock:
+            # Mapped snapshots hold no frames, so they are read back from the caches
+            frames = self.snapshot.frames
+            if frames is None:
+                frames = self._load_frames()
+            new = ingest_export(upload_path, frames, self.additions_dir, self.start_date)
+            if new is None:
+                return 0
+            # Only the new segments are rolled up; the totals so far are reused
+            rollup = self.snapshot.rollup.combine(DailyRollup.from_frames(new))
+            snapshot = TimelineSnapshot(merge_frames(frames, new), self._version(), rollup)
+            if self.shared:
+                snapshot = self._share(snapshot)
+            self._publish(snapshot)
+            self.timeline_loaded = True
+            # This worker already holds the new addition, so the watcher need not reload for it
+            self._signature = self._source_signature()
+            return segment_count(new)
+    
+    def _store_place_locations(self, places, rows, names, pending):
+        """Write names resolved by the geocoding pool into a place store"""
+        with self._place_lock:
+            places.location_name[rows] = names
+            places.location_pending[rows] = pending
     
-    @lru_cache(maxsize=1)
-    def get_dashboard_stats(self):
-        """Calculate dashboard statistics (cached)"""
-        if self.activity_final.empty and self.visit_df.empty:
+    def _query_engine(self, snapshot):
+        """The snapshot's activity query engine, which caches filter masks for that snapshot"""
+        return snapshot.derived('query_engine', lambda: ActivityQueryEngine(
+            snapshot.activities, snapshot.version, snapshot.activity_grid, snapshot.kinematics.outlier
+        ))
+    
+    def get_dashboard_stats(self, query=None):
+        """Calculate dashboard statistics over the activities matching a query (all of them by default).
+
+        The date range covers whole UTC days, and the daily average is taken
+        over the days of the range. The current location is refreshed until
+        its name is resolved.
+        """
+        snapshot = self.snapshot
+        query = (query or ActivityQuery()).whole_days()
+        if query.key() == ActivityQuery().key():
+            stats = snapshot.derived('journey_stats', lambda: self._get_journey_stats(snapshot, snapshot.rollup))
+        else:
+            # Summed from a rollup of the selected rows; outliers are counted among the
+            # rows selected by the other filters
+            engine = self._query_engine(snapshot)
+            positions = as_positions(engine.select(query))
+            outliers = int(engine.outliers[as_positions(engine.select(query.with_outliers()))].sum())
+            stats = self._get_journey_stats(
+                snapshot, DailyRollup(snapshot.activities, snapshot.visits, positions), outliers
+            )
+        stats = dict(stats)
+        if len(snapshot.activities) or len(snapshot.visits):
+            # Calculate days on road from the journey's start date to today, on every request
+            journey_start = pd.to_datetime(self.start_date, utc=True)
+            today = pd.Timestamp.now('UTC')
+            days_on_road = max((today - journey_start).days, 0)
+            
+            # Calculate average vehicle distance per day, over the days of the date range if one is given
+            days = days_on_road
+            if query.start_ns is not None or query.end_ns is not None:
+                first = max(journey_start.value, query.start_ns if query.start_ns is not None else 0)
+                last = min(today.value, query.end_ns if query.end_ns is not None else today.value)
+                days = max((last - first) // _NS_PER_DAY + 1, 0)
+            vehicle_distance = stats.pop('_vehicle_distance')
+            avg_distance_per_day = vehicle_distance / max(days, 1) if days > 0 else 0
+            
+            stats['days_on_road'] = days_on_road
+            stats['avg_distance_per_day'] = round(avg_distance_per_day, 1)
+            stats['current_location'], stats['current_location_pending'] = self._get_current_location(snapshot)
+        stats['journey_start'] = self.start_date
+        return stats
+    
+    def _get_journey_stats(self, snapshot, rollup, outliers=None):
+        """Calculate the dashboard statistics that only depend on the loaded data (cached per snapshot).
+
+        Everything is summed from a per-day rollup (the snapshot's, or one of
+        the selected activities) rather than from individual activities.
+        """
+        if not len(snapshot.activities) and not len(snapshot.visits):
             return {
                 'vehicle_distance': 0,
                 'walking_distance': 0,
@@ -203,222 +329,97 @@ class TimelineProcessor:
                 'countries_visited': 0,
                 'days_on_road': 0,
                 'current_location': 'Unknown',
+                'current_location_pending': False,
                 'total_activities': 0,
                 'avg_distance_per_day': 0,
-                'most_common_activity': 'Unknown'
+                'most_common_activity': 'Unknown',
+                'outlier_activities': 0
             }
         
-        vehicle_distance = 0
-        walking_distance = 0
-        cycling_distance = 0
-        
-        if not self.activity_final.empty and 'distanceMeters' in self.activity_final.columns and 'topCandidate.type' in self.activity_final.columns:
-            # Calculate vehicle distance (IN_PASSENGER_VEHICLE only)
-            vehicle_df = self.activity_final[self.activity_final['topCandidate.type'] == 'IN_PASSENGER_VEHICLE']
-            if not vehicle_df.empty:
-                vehicle_distance = vehicle_df['distanceMeters'].sum() / 1000  # Convert to km
-            
-            # Calculate walking distance
-            walking_df = self.activity_final[self.activity_final['topCandidate.type'].isin(['WALKING', 'ON_FOOT'])]
-            if not walking_df.empty:
-                walking_distance = walking_df['distanceMeters'].sum() / 1000
-            
-            # Calculate cycling distance
-            cycling_df = self.activity_final[self.activity_final['topCandidate.type'] == 'CYCLING']
-            if not cycling_df.empty:
-                cycling_distance = cycling_df['distanceMeters'].sum() / 1000
-        
-        # Calculate days on road from fixed journey start date to today
-        journey_start = pd.to_datetime('2025-06-10', utc=True)
-        today = pd.Timestamp.utcnow()
-        days_on_road = max((today - journey_start).days, 0)
+        # Calculate vehicle distance (IN_PASSENGER_VEHICLE only), walking and cycling distance in km
+        vehicle_distance = self._distance_km(rollup, ['IN_PASSENGER_VEHICLE'])
+        walking_distance = self._distance_km(rollup, ['WALKING', 'ON_FOOT'])
+        cycling_distance = self._distance_km(rollup, ['CYCLING'])
         
         # Get most common activity type
-        most_common_activity = 'Unknown'
-        if not self.activity_final.empty and 'topCandidate.type' in self.activity_final.columns:
-            activity_counts = self.activity_final['topCandidate.type'].value_counts()
-            most_common_activity = activity_counts.index[0] if not activity_counts.empty else 'Unknown'
-        
-        # Calculate average vehicle distance per day
-        avg_distance_per_day = vehicle_distance / max(days_on_road, 1) if days_on_road > 0 else 0
+        most_common_activity = rollup.most_common_type() or 'Unknown'
         
         # Get countries visited from real location data
-        countries_visited = self._get_countries_visited()
-        
-        # Get current location from most recent data
-        current_location = self._get_current_location()
+        countries_visited = self._get_countries_visited(rollup)
         
         return {
             'vehicle_distance': round(vehicle_distance, 1),
             'walking_distance': round(walking_distance, 1),
             'cycling_distance': round(cycling_distance, 1),
             'countries_visited': countries_visited,
-            'days_on_road': days_on_road,
-            'current_location': current_location,
-            'total_activities': len(self.activity_final),
-            'avg_distance_per_day': round(avg_distance_per_day, 1),
-            'most_common_activity': most_common_activity
+            'total_activities': rollup.total_count(),
+            'most_common_activity': most_common_activity,
+            # Activities moving implausibly fast for their type, whether or not they are counted
+            'outlier_activities': int(snapshot.kinematics.outlier.sum()) if outliers is None else outliers,
+            # Unrounded, for the per-day average worked out on each request
+            '_vehicle_distance': vehicle_distance
         }
     
-    def _get_countries_visited(self):
-        """Calculate unique countries visited using geographic bounds for speed"""
-        # Use fast geographic bounds detection instead of expensive geocoding
-        countries = set()
+    def _distance_km(self, rollup, activity_types):
+        """Total distance of the given activity types in km, 0 when there are none"""
+        if not rollup.count_by_type(activity_types):
+            return 0
+        return rollup.distance_by_type(activity_types) / 1000
+    
+    def _get_countries_visited(self, rollup):
+        """Calculate unique countries visited from the precomputed country codes"""
+        countries = rollup.country_names()
         
-        if not self.activity_final.empty:
-            lats = []
-            lngs = []
-            
-            # Collect all coordinates
-            for _, activity in self.activity_final.iterrows():
-                if pd.notna(activity.get('start_latitude')) and pd.notna(activity.get('start_longitude')):
-                    lats.append(float(activity['start_latitude']))
-                    lngs.append(float(activity['start_longitude']))
-                if pd.notna(activity.get('end_latitude')) and pd.notna(activity.get('end_longitude')):
-                    lats.append(float(activity['end_latitude']))
-                    lngs.append(float(activity['end_longitude']))
-            
-            if lats and lngs:
-                # Use the same comprehensive bounds as _get_country_from_coords
-                for lat, lng in zip(lats, lngs):
-                    country = self._get_country_from_coords(lat, lng)
-                    if country:
-                        countries.add(country)
-                
-                print(f"Countries found by geographic bounds: {sorted(list(countries))}")
+        if rollup.total_count():
+            print(f"Countries found by polygon lookup: {sorted(countries)}")
         
         return len(countries)
     
-    def _get_current_location(self):
-        """Get current location from most recent data"""
+    def _get_current_location(self, snapshot):
+        """Get current location from most recent data, as (name, pending)"""
+        activities, visits = snapshot.activities, snapshot.visits
+        candidates = []
         # Try to get from most recent activity
-        if not self.activity_final.empty:
-            latest_activity = self.activity_final.iloc[-1]
-            if pd.notna(latest_activity.get('end_latitude')) and pd.notna(latest_activity.get('end_longitude')):
-                try:
-                    location_info = self._reverse_geocode(
-                        float(latest_activity['end_latitude']),
-                        float(latest_activity['end_longitude'])
-                    )
-                    return location_info['city'] or location_info['country'] or 'Unknown'
-                except:
-                    pass
+        if len(activities):
+            candidates.append((activities.end_lat[-1], activities.end_lng[-1]))
         
         # Try to get from most recent visit
-        if not self.visit_df.empty:
-            latest_visit = self.visit_df.iloc[-1]
-            visit_data = latest_visit.get('visit', {})
-            if isinstance(visit_data, dict):
-                location = visit_data.get('topCandidate', {}).get('placeLocation', {})
-                lat_lng = location.get('latLng', '')
-                if lat_lng:
-                    coords = self._extract_coordinates(lat_lng)
-                    if coords:
-                        try:
-                            location_info = self._reverse_geocode(coords[0], coords[1])
-                            return location_info['city'] or location_info['country'] or 'Unknown'
-                        except:
-                            pass
-        
-        return 'Unknown'
-    
-    def _get_country_from_coords(self, lat, lng):
-        """Enhanced country detection using comprehensive European bounds"""
-        # Comprehensive European country bounds (more accurate)
-        country_bounds = {
-            # Western Europe
-            'Portugal': ((36.8, 42.2), (-9.5, -6.2)),
-            'Spain': ((35.2, 43.8), (-9.3, 4.3)),
-            'Liechtenstein': ((47.0, 47.3), (9.4, 9.6)),
-            'France': ((41.3, 51.1), (-5.1, 9.6)),
-            'Ireland': ((51.4, 55.4), (-10.5, -5.9)),
-            'United Kingdom': ((49.9, 60.8), (-8.2, 1.8)),
-            
-            # Central Europe
-            'Germany': ((47.3, 55.1), (5.9, 15.0)),
-            'Austria': ((46.4, 49.0), (9.5, 17.2)),
-            'Switzerland': ((45.8, 47.8), (5.9, 10.5)),
-            
-            # Benelux
-            'Netherlands': ((50.8, 53.6), (3.4, 7.2)),
-            'Belgium': ((49.5, 51.5), (2.5, 6.4)),
-            'Luxembourg': ((49.4, 50.2), (5.7, 6.5)),
-            
-            # Nordic Countries
-            'Norway': ((57.9, 71.2), (4.6, 31.3)),
-            'Sweden': ((55.3, 69.1), (11.0, 24.2)),
-            'Finland': ((59.8, 70.1), (20.6, 31.6)),
-            'Denmark': ((54.6, 57.8), (8.1, 15.2)),
-            'Iceland': ((63.4, 66.6), (-24.5, -13.5)),
-            
-            # Eastern Europe
-            'Poland': ((49.0, 54.8), (14.1, 24.1)),
-            'Czech Republic': ((48.6, 51.1), (12.1, 18.9)),
-            'Slovakia': ((47.7, 49.6), (16.8, 22.6)),
-            'Hungary': ((45.7, 48.6), (16.1, 22.9)),
-            'Slovenia': ((45.4, 46.9), (13.4, 16.6)),
-            'Croatia': ((42.4, 46.5), (13.5, 19.4)),
-            'Bosnia and Herzegovina': ((42.6, 45.3), (15.7, 19.6)),
-            'Serbia': ((42.2, 46.2), (18.8, 23.0)),
-            'Montenegro': ((41.9, 43.6), (18.4, 20.4)),
-            'North Macedonia': ((40.8, 42.4), (20.4, 23.0)),
-            'Albania': ((39.6, 42.7), (19.1, 21.1)),
-            'Kosovo': ((41.8, 43.3), (20.0, 21.8)),
-            
-            # Southern Europe
-            'Italy': ((35.5, 47.1), (6.6, 18.5)),
-            'San Marino': ((43.9, 43.9), (12.4, 12.5)),
-            'Vatican City': ((41.9, 41.9), (12.4, 12.5)),
-            'Malta': ((35.8, 36.1), (14.2, 14.6)),
-            'Greece': ((34.8, 41.7), (19.4, 29.7)),
-            'Cyprus': ((34.6, 35.7), (32.3, 34.6)),
-            
-            # Baltic States
-            'Estonia': ((57.5, 59.7), (21.8, 28.2)),
-            'Latvia': ((55.7, 58.1), (20.7, 28.2)),
-            'Lithuania': ((53.9, 56.4), (20.9, 26.8)),
-            
-            # Eastern Europe (continued)
-            'Belarus': ((51.3, 56.2), (23.2, 32.8)),
-            'Moldova': ((45.5, 48.5), (26.6, 30.2)),
-            'Ukraine': ((45.0, 52.4), (22.1, 40.2)),
-            'Romania': ((43.7, 48.3), (20.2, 29.7)),
-            'Bulgaria': ((41.2, 44.2), (22.4, 28.6)),
-            
-            # Russia (European part)
-            'Russia': ((41.2, 81.9), (19.6, -169.0)),
-            
-            # Caucasus
-            'Georgia': ((41.1, 43.6), (39.9, 46.7)),
-            'Armenia': ((38.8, 41.3), (43.4, 46.8)),
-            'Azerbaijan': ((38.4, 42.0), (44.8, 50.4)),
-            
-            # Turkey (European part)
-            'Turkey': ((35.8, 42.1), (25.7, 44.8))
-        }
+        if len(visits):
+            candidates.append((visits.lat[-1], visits.lng[-1]))
         
-        # Check each country's bounds
-        for country, ((lat_min, lat_max), (lng_min, lng_max)) in country_bounds.items():
-            if lat_min <= lat <= lat_max and lng_min <= lng <= lng_max:
-                return country
+        for lat, lng in candidates:
+            if not (np.isnan(lat) or np.isnan(lng)):
+                try:
+                    # Never blocks: unresolved points are queued and reported as pending
+                    location_info, pending = self.geocode_pool.lookup(float(lat), float(lng))
+                    return location_info['city'] or location_info['country'] or 'Unknown', pending
+                except Exception as e:
+                    print(f"Geocoding error for {lat}, {lng}: {e}")
         
-        # If no European country matches, return None
-        return None
+        return 'Unknown', False
     
-    def get_map_data(self, start_date=None, end_date=None):
-        """Get map visualization data"""
-        if self.activity_final.empty:
+    def get_map_data(self, query=None, limit=None, cursor=None, snapshot=None):
+        """Get map visualization data; with a limit, one page of it and the cursor of the next page"""
+        snapshot = snapshot or self.snapshot
+        activities = snapshot.activities
+        engine = self._query_engine(snapshot)
+        with stage('map_data.select'):
+            if limit is None:
+                positions, next_cursor = engine.select(query), None
+            else:
+                positions, next_cursor = engine.page(query, limit, cursor)
+        with stage('map_data.rows'):
+            rows = self._map_rows(activities, positions)
+        return rows if limit is None else {'activities': rows, 'next_cursor': next_cursor}
+    
+    def _map_rows(self, activities, positions):
+        """Map data rows of the activities at the positions that have coordinates"""
+        if not len(activities):
             return []
         
-        df_filtered = self.activity_final.copy()
-        
-        # Apply date filters
-        if start_date:
-            start_date = pd.to_datetime(start_date, utc=True)
-            df_filtered = df_filtered[df_filtered['startTime'] >= start_date]
-        if end_date:
-            end_date = pd.to_datetime(end_date, utc=True)
-            df_filtered = df_filtered[df_filtered['startTime'] <= end_date]
+        has_coordinates = activities.has_coordinates[positions]
+        if not has_coordinates.all():
+            positions = as_positions(positions)[has_coordinates]
         
         # Color mapping for activities
         color_map = {
@@ -434,98 +435,196 @@ class TimelineProcessor:
             'FLYING': '#8b4513'
         }
         
-        map_data = []
-        for _, row in df_filtered.iterrows():
-            if pd.notna(row['start_latitude']) and pd.notna(row['end_latitude']):
-                activity_type = row.get('topCandidate.type', 'UNKNOWN')
-                
-                # Use fast geographic bounds to determine country (no API calls)
-                start_country = self._get_country_from_coords(
-                    float(row['start_latitude']),
-                    float(row['start_longitude'])
-                )
-                end_country = self._get_country_from_coords(
-                    float(row['end_latitude']),
-                    float(row['end_longitude'])
-                )
-                
-                map_data.append({
-                    'start_lat': float(row['start_latitude']),
-                    'start_lng': float(row['start_longitude']),
-                    'end_lat': float(row['end_latitude']),
-                    'end_lng': float(row['end_longitude']),
-                    'activity_type': activity_type,
-                    'color': color_map.get(activity_type, '#636363'),
-                    'distance_meters': float(row.get('distanceMeters', 0)),
-                    'start_time': row['startTime'].isoformat(),
-                    'end_time': row['endTime'].isoformat(),
-                    'duration_hours': (row['endTime'] - row['startTime']).total_seconds() / 3600,
-                    'start_location': start_country,
-                    'end_location': end_country
-                })
-        
-        return map_data
+        # Each column is sliced and converted once; rows are only assembled at the end
+        columns = zip(
+            activities.start_lat[positions].tolist(),
+            activities.start_lng[positions].tolist(),
+            activities.end_lat[positions].tolist(),
+            activities.end_lng[positions].tolist(),
+            activities.activity_types(positions),
+            activities.distance[positions].tolist(),
+            iso_strings(activities.start[positions]),
+            iso_strings(activities.end[positions]),
+            activities.duration_hours[positions].tolist(),
+            activities.start_countries(positions),
+            activities.end_countries(positions)
+        )
+        
+        return [{
+            'start_lat': start_lat,
+            'start_lng': start_lng,
+            'end_lat': end_lat,
+            'end_lng': end_lng,
+            'activity_type': activity_type,
+            'color': color_map.get(activity_type, '#636363'),
+            'distance_meters': distance,
+            'start_time': start_time,
+            'end_time': end_time,
+            'duration_hours': duration,
+            'start_location': start_country,
+            'end_location': end_country
+        } for (start_lat, start_lng, end_lat, end_lng, activity_type, distance,
+               start_time, end_time, duration, start_country, end_country) in columns]
     
     def get_recent_stops(self, limit=10):
-        """Get recent stops/visits with geocoded location names"""
-        if self.visit_df.empty:
-            return []
+        """Get recent stops with geocoded place names; consecutive visits to one place are one stop"""
+        places = self.snapshot.places
+        stays = places.latest_stays(limit)
+        place_ids = places.stay_place[stays]
+        coords = list(zip(places.lat[place_ids].tolist(), places.lng[place_ids].tolist()))
+        names, pending = self._place_names(places, place_ids, coords)
         
-        recent_visits = self.visit_df.nlargest(limit, 'startTime')
-        stops = []
-        
-        for _, visit in recent_visits.iterrows():
-            visit_data = visit.get('visit', {})
-            if isinstance(visit_data, dict):
-                location = visit_data.get('topCandidate', {}).get('placeLocation', {})
-                lat_lng = location.get('latLng', '')
-                
-                # Get location name through geocoding
-                location_name = 'Unknown Location'
-                if lat_lng:
-                    coords = self._extract_coordinates(lat_lng)
-                    if coords:
-                        try:
-                            location_info = self._reverse_geocode(coords[0], coords[1])
-                            location_name = location_info['city'] or location_info['name'] or f"Location at {coords[0]:.4f}, {coords[1]:.4f}"
-                        except:
-                            location_name = f"Location at {coords[0]:.4f}, {coords[1]:.4f}"
-                
-                stops.append({
-                    'name': location_name,
-                    'start_time': visit['startTime'].isoformat(),
-                    'end_time': visit['endTime'].isoformat(),
-                    'duration_hours': (visit['endTime'] - visit['startTime']).total_seconds() / 3600,
-                    'coordinates': coords if lat_lng else None
-                })
-        
-        return stops
-    
-    def get_plotly_map(self, country_filter=None, transport_filter=None, start_date=None, end_date=None):
-        """Generate optimized Plotly map with filters"""
-        if self.activity_final.empty:
-            return {"data": [], "layout": {}}
+        return [{
+            'name': name,
+            'start_time': start_time,
+            'end_time': end_time,
+            'duration_hours': duration,
+            'coordinates': coord,
+            'pending': is_pending,
+            'place_id': place_id,
+            'visit_count': visit_count
+        } for name, start_time, end_time, duration, coord, is_pending, place_id, visit_count in zip(
+            names,
+            iso_strings(places.stay_start[stays]),
+            iso_strings(places.stay_end[stays]),
+            places.stay_hours(stays).tolist(),
+            coords,
+            pending,
+            place_ids.tolist(),
+            places.stay_visits[stays].tolist()
+        )]
+    
+    def get_places(self, sort='recent', limit=100):
+        """Places with their visit and stay counts and total dwell time, sorted by one of PLACE_SORTS"""
+        places = self.snapshot.places
+        keys = {'recent': places.last_end, 'dwell': places.dwell_hours, 'visits': places.visit_count}
+        # Largest first; ties keep the most recently first-visited place first
+        place_ids = np.argsort(keys[sort], kind='stable')[::-1][:limit]
+        coords = list(zip(places.lat[place_ids].tolist(), places.lng[place_ids].tolist()))
+        names, pending = self._place_names(places, place_ids, coords)
         
-        df_filtered = self.activity_final.copy()
+        return {
+            'places': [{
+                'place_id': place_id,
+                'name': name,
+                'pending': is_pending,
+                'coordinates': coord,
+                'visit_count': visit_count,
+                'stay_count': stay_count,
+                'dwell_hours': dwell,
+                'first_visit': first_visit,
+                'last_visit': last_visit
+            } for place_id, name, is_pending, coord, visit_count, stay_count, dwell, first_visit, last_visit in zip(
+                place_ids.tolist(),
+                names,
+                pending,
+                coords,
+                places.visit_count[place_ids].tolist(),
+                places.stay_count[place_ids].tolist(),
+                np.round(places.dwell_hours[place_ids], 2).tolist(),
+                iso_strings(places.first_start[place_ids]),
+                iso_strings(places.last_end[place_ids])
+            )],
+            'total': len(places)
+        }
+    
+    def get_nearest_stops(self, lat, lng, k=10):
+        """The k stops nearest to a point, nearest first"""
+        snapshot = self.snapshot
+        positions, distances = snapshot.stop_index.nearest(lat, lng, k)
+        return self._stop_rows(snapshot, positions, distances)
+    
+    def get_stops_within(self, lat, lng, radius_km, limit):
+        """Stops within a radius of a point, nearest first, at most ``limit`` of them"""
+        snapshot = self.snapshot
+        positions, distances = snapshot.stop_index.within(lat, lng, radius_km)
+        return {
+            'stops': self._stop_rows(snapshot, positions[:limit], distances[:limit]),
+            'total': len(positions)
+        }
+    
+    def get_stops_in_bbox(self, bbox, limit):
+        """Stops inside a viewport, most recent first, at most ``limit`` of them"""
+        snapshot = self.snapshot
+        positions = snapshot.visit_grid.query(bbox)
+        return {
+            'stops': self._stop_rows(snapshot, positions[::-1][:limit]),
+            'total': len(positions)
+        }
+    
+    def _place_names(self, places, place_ids, coords):
+        """(names, pending) of places; a placeholder is shown until the background pool names a place"""
+        located = place_ids >= 0
+        names = np.full(len(place_ids), None, dtype=object)
+        pending = np.zeros(len(place_ids), dtype=bool)
+        with self._place_lock:
+            names[located] = places.location_name[place_ids[located]]
+            pending[located] = places.location_pending[place_ids[located]]
+        
+        labels = []
+        for name, coord in zip(names.tolist(), coords):
+            if coord is None:
+                labels.append('Unknown Location')
+            else:
+                labels.append(name or fallback_location(*coord)['name'])
+        return labels, pending.tolist()
+    
+    def _stop_rows(self, snapshot, positions, distances=None):
+        """Stop rows for the visits at the positions, named after their place, with distance_km when distances are given"""
+        visits, places = snapshot.visits, snapshot.places
+        place_ids = places.visit_place[positions]
+        coords = [
+            (lat, lng) if located else None
+            for lat, lng, located in zip(
+                visits.lat[positions].tolist(), visits.lng[positions].tolist(), visits.has_coordinates[positions].tolist()
+            )
+        ]
+        names, pending = self._place_names(places, place_ids, coords)
+        
+        rows = [{
+            'name': name,
+            'start_time': start_time,
+            'end_time': end_time,
+            'duration_hours': duration,
+            'coordinates': coord,
+            'pending': is_pending,
+            'place_id': place_id if place_id >= 0 else None
+        } for name, start_time, end_time, duration, coord, is_pending, place_id in zip(
+            names,
+            iso_strings(visits.start[positions]),
+            iso_strings(visits.end[positions]),
+            visits.duration_hours[positions].tolist(),
+            coords,
+            pending,
+            place_ids.tolist()
+        )]
+        if distances is not None:
+            for row, distance in zip(rows, np.round(distances, 3).tolist()):
+                row['distance_km'] = distance
+        return rows
+    
+    def get_plotly_map(self, query=None, zoom=None, snapshot=None):
+        """Generate optimized Plotly map with filters, simplified for the zoom level or the query's bbox"""
+        snapshot = snapshot or self.snapshot
+        activities = snapshot.activities
+        if not len(activities):
+            return {"data": [], "layout": {}}
         
         # Apply filters
-        if start_date:
-            start_date = pd.to_datetime(start_date, utc=True)
-            df_filtered = df_filtered[df_filtered['startTime'] >= start_date]
-        if end_date:
-            end_date = pd.to_datetime(end_date, utc=True)
-            df_filtered = df_filtered[df_filtered['startTime'] <= end_date]
-        if transport_filter and 'topCandidate.type' in df_filtered.columns:
-            df_filtered = df_filtered[df_filtered['topCandidate.type'] == transport_filter]
-        
-        if df_filtered.empty:
+        with stage('plotly.select'):
+            positions = as_positions(self._query_engine(snapshot).select(query))
+        bbox = query.bbox if query is not None else None
+        
+        if not len(positions):
             return {"data": [], "layout": {}}
         
-        # OPTIMIZATION: Limit to max 200 activities for performance
-        if len(df_filtered) > 200:
-            # Sample evenly across the dataset
-            step = len(df_filtered) // 200
-            df_filtered = df_filtered.iloc[::step].head(200)
+        # Level of detail: drop vertices finer than a pixel at this zoom, and never send more
+        # than MAP_MAX_VERTICES; every selected leg keeps its endpoints
+        if zoom is None and bbox is not None:
+            zoom = zoom_for_bbox(bbox)
+        tolerance = zoom_tolerance_km(zoom) if zoom is not None else 0.0
+        with stage('plotly.simplify'):
+            drawn, vertex_mask = snapshot.route_lod.vertex_mask(positions, tolerance, MAP_MAX_VERTICES)
         
         # Color mapping for activities
         color_map = {
@@ -537,70 +636,155 @@ class TimelineProcessor:
             'SAILING': '#1f77b4'
         }
         
-        # Group activities by type for efficient plotting
-        traces = []
-        activity_types = df_filtered['topCandidate.type'].unique() if 'topCandidate.type' in df_filtered.columns else ['UNKNOWN']
-        
-        for activity_type in activity_types:
-            if pd.notna(activity_type):
-                df_type = df_filtered[df_filtered['topCandidate.type'] == activity_type] if 'topCandidate.type' in df_filtered.columns else df_filtered
-                
-                if df_type.empty:
-                    continue
-                
-                # Collect all coordinates for this activity type
-                lats, lons, hover_texts = [], [], []
-                
-                for _, row in df_type.iterrows():
-                    if pd.notna(row.get('start_latitude')) and pd.notna(row.get('end_latitude')):
-                        lats.extend([row['start_latitude'], row['end_latitude'], None])  # None creates line break
-                        lons.extend([row['start_longitude'], row['end_longitude'], None])
-                        
-                        hover_text = f"{activity_type}<br>Distance: {row.get('distanceMeters', 0):.0f}m<br>Date: {row['startTime'].strftime('%Y-%m-%d')}"
-                        hover_texts.extend([hover_text, hover_text, None])
-                
-                if lats and lons:
-                    traces.append(go.Scattermapbox(
-                        mode="lines",
-                        lon=lons,
-                        lat=lats,
-                        name=activity_type.replace('_', ' '),
-                        line=dict(width=3, color=color_map.get(activity_type, '#636363')),
-                        hovertemplate="%{text}<extra></extra>",
-                        text=hover_texts
-                    ))
-        
-        # Create figure
-        fig = go.Figure(data=traces)
+        # One line trace per activity type, in order of first appearance
+        with stage('plotly.traces'):
+            traces = mapbox_line_traces(activities, drawn, vertex_mask, color_map)
         
         # Calculate center point for map
-        all_lats = df_filtered[['start_latitude', 'end_latitude']].values.flatten()
-        all_lons = df_filtered[['start_longitude', 'end_longitude']].values.flatten()
-        valid_lats = all_lats[~pd.isna(all_lats)]
-        valid_lons = all_lons[~pd.isna(all_lons)]
+        all_lats = np.column_stack((activities.start_lat[positions], activities.end_lat[positions])).ravel()
+        all_lons = np.column_stack((activities.start_lng[positions], activities.end_lng[positions])).ravel()
+        valid_lats = all_lats[~np.isnan(all_lats)]
+        valid_lons = all_lons[~np.isnan(all_lons)]
         
         center_lat = valid_lats.mean() if len(valid_lats) > 0 else 40.0
         center_lon = valid_lons.mean() if len(valid_lons) > 0 else 0.0
+        if bbox is not None:
+            center_lon, center_lat = (bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2
         
-        # Update layout with optimized settings
-        fig.update_layout(
-            mapbox=dict(
-                style="open-street-map",
-                center=dict(lat=center_lat, lon=center_lon),
-                zoom=6
-            ),
-            title=f"Journey Map ({len(df_filtered)} activities)",
-            height=600,
-            margin={"r":0,"t":50,"l":0,"b":0},
-            legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01, bgcolor="rgba(255,255,255,0.8)"),
-            showlegend=True
-        )
+        # Layout with optimized settings, in the form go.Figure.to_dict() produced
+        layout = {
+            'mapbox': {
+                'style': "open-street-map",
+                'center': {'lat': float(center_lat), 'lon': float(center_lon)},
+                'zoom': zoom if zoom is not None else 6
+            },
+            'title': {'text': f"Journey Map ({len(positions)} activities)"},
+            'height': 600,
+            'margin': {"r": 0, "t": 50, "l": 0, "b": 0},
+            'legend': {'yanchor': "top", 'y': 0.99, 'xanchor': "left", 'x': 0.01, 'bgcolor': "rgba(255,255,255,0.8)"},
+            'showlegend': True,
+            'template': plotly_template()
+        }
+        
+        return {'data': traces, 'layout': layout}
+    
+    def get_path_days(self, snapshot=None):
+        """Days that have timelinePath geometry, for fetching it one day at a time"""
+        snapshot = snapshot or self.snapshot
+        days, path_counts, point_counts = snapshot.paths.days()
+        # Great-circle length of each day's paths, point to point
+        first = np.cumsum(path_counts) - path_counts
+        distances = np.add.reduceat(snapshot.kinematics.path_km, first) if len(first) else first
+        return {
+            'days': [
+                {'date': date, 'paths': int(paths), 'points': int(points), 'distance_km': distance}
+                for date, paths, points, distance in zip(
+                    date_strings(days), path_counts, point_counts, np.round(distances, 2).tolist()
+                )
+            ],
+            'precision': PRECISION,
+            'total_points': int(point_counts.sum())
+        }
+    
+    def get_day_path(self, day_ns, snapshot=None):
+        """One UTC day of timelinePath geometry as encoded polylines, one per path"""
+        paths = (snapshot or self.snapshot).paths
+        lo, hi = paths.day_bounds(day_ns)
+        offsets = paths.offsets[lo:hi + 1]
+        points = slice(offsets[0], offsets[-1])
+        polylines = encode_polylines(paths.lat[points], paths.lng[points], offsets - offsets[0])
+        return {
+            'date': date_strings([day_ns])[0],
+            'precision': PRECISION,
+            'paths': [
+                {'start_time': start, 'end_time': end, 'polyline': polyline}
+                for start, end, polyline in zip(
+                    iso_strings(paths.start[lo:hi]), iso_strings(paths.end[lo:hi]), polylines
+                )
+            ]
+        }
+    
+    def get_day_path_binary(self, day_ns, snapshot=None):
+        """One UTC day of timelinePath geometry packed as delta-encoded int32 (see pack_paths)"""
+        paths = (snapshot or self.snapshot).paths
+        lo, hi = paths.day_bounds(day_ns)
+        offsets = paths.offsets[lo:hi + 1]
+        points = slice(offsets[0], offsets[-1])
+        return pack_paths(paths.lat[points], paths.lng[points], offsets)
+    
+    def get_stats_timeseries(self, granularity='day', group_by=None, query=None, snapshot=None):
+        """Distance, time moving, activity counts and visit dwell time per day, week or month.
+
+        Series are split by activity type (group_by='mode') or by the country
+        activities start in (group_by='country'); a series keyed None holds
+        activities whose type or country is unknown. The date range covers
+        whole UTC days and is answered from the snapshot's rollup; other
+        filters roll up the selected activities first. Visits are only
+        filtered by the date range.
+        """
+        snapshot = snapshot or self.snapshot
+        query = (query or ActivityQuery()).whole_days()
+        rollup = snapshot.rollup
+        if not query.dates_only():
+            positions = as_positions(self._query_engine(snapshot).select(query))
+            rollup = DailyRollup(snapshot.activities, snapshot.visits, positions)
+        buckets, series, visits = rollup.timeseries(granularity, group_by, query.start_ns, query.end_ns)
+        return {
+            'granularity': granularity,
+            'group_by': group_by,
+            'buckets': date_strings(buckets),
+            'series': [
+                {
+                    'key': entry['key'],
+                    'distance_km': np.round(entry['distance'] / 1000, 2).tolist(),
+                    'duration_hours': np.round(entry['duration_hours'], 2).tolist(),
+                    'count': entry['count'].tolist()
+                }
+                for entry in series
+            ],
+            'visits': {
+                'dwell_hours': np.round(visits['dwell_hours'], 2).tolist() if visits else [],
+                'count': visits['count'].tolist() if visits else []
+            }
+        }
+    
+    def get_outliers(self, limit=100, snapshot=None):
+        """Activities flagged as implausible for their type, least plausible first"""
+        snapshot = snapshot or self.snapshot
+        activities, kinematics = snapshot.activities, snapshot.kinematics
+        flagged = np.flatnonzero(kinematics.outlier)
+        positions = flagged[np.argsort(kinematics.plausibility[flagged], kind='stable')][:limit]
+        speeds = kinematics.speed_kmh[positions]
         
-        return fig.to_dict()
+        return {
+            'outliers': [{
+                'start_time': start_time,
+                'end_time': end_time,
+                'activity_type': activity_type,
+                'distance_km': distance,
+                'straight_km': straight,
+                'speed_kmh': speed,
+                'plausibility': plausibility
+            } for start_time, end_time, activity_type, distance, straight, speed, plausibility in zip(
+                iso_strings(activities.start[positions]),
+                iso_strings(activities.end[positions]),
+                activities.activity_types(positions),
+                np.round(activities.distance[positions] / 1000, 2).tolist(),
+                np.round(kinematics.straight_km[positions], 2).tolist(),
+                # Distances covered in no time have no finite speed
+                [None if not np.isfinite(speed) else speed for speed in np.round(speeds, 1).tolist()],
+                np.round(kinematics.plausibility[positions], 3).tolist()
+            )],
+            'total': len(flagged)
+        }
     
-    @lru_cache(maxsize=1)
     def get_available_filters(self):
-        """Get available filter options for the frontend (cached)"""
+        """Get available filter options for the frontend"""
+        snapshot = self.snapshot
+        return snapshot.derived('filters', lambda: self._get_available_filters(snapshot))
+    
+    def _get_available_filters(self, snapshot):
+        """Filter options for one snapshot"""
         filters = {
             'countries': [],
             'transport_modes': [],
@@ -610,53 +794,178 @@ class TimelineProcessor:
             }
         }
         
-        if not self.activity_final.empty:
+        activities = snapshot.activities
+        if len(activities):
             # Get available transport modes
-            if 'topCandidate.type' in self.activity_final.columns:
-                transport_modes = self.activity_final['topCandidate.type'].dropna().unique().tolist()
-                filters['transport_modes'] = sorted(transport_modes)
+            filters['transport_modes'] = sorted(activities.types.tolist())
             
             # Get date range
-            if 'startTime' in self.activity_final.columns:
-                min_date = self.activity_final['startTime'].min()
-                max_date = self.activity_final['startTime'].max()
-                if not pd.isna(min_date) and not pd.isna(max_date):
-                    filters['date_range']['min_date'] = min_date.strftime('%Y-%m-%d')
-                    filters['date_range']['max_date'] = max_date.strftime('%Y-%m-%d')
+            min_date, max_date = date_strings([activities.start.min(), activities.start.max()])
+            filters['date_range']['min_date'] = min_date
+            filters['date_range']['max_date'] = max_date
         
             # Get only countries that actually have data
-            countries_with_data = set()
-            if not self.activity_final.empty:
-                for _, activity in self.activity_final.iterrows():
-                    if pd.notna(activity.get('start_latitude')) and pd.notna(activity.get('start_longitude')):
-                        country = self._get_country_from_coords(
-                            float(activity['start_latitude']),
-                            float(activity['start_longitude'])
-                        )
-                        if country:
-                            countries_with_data.add(country)
-                    
-                    if pd.notna(activity.get('end_latitude')) and pd.notna(activity.get('end_longitude')):
-                        country = self._get_country_from_coords(
-                            float(activity['end_latitude']),
-                            float(activity['end_longitude'])
-                        )
-                        if country:
-                            countries_with_data.add(country)
-            
-            filters['countries'] = sorted(list(countries_with_data))
+            filters['countries'] = sorted(activities.country_names())
         
         return filters
 
+# Seconds between checks for a changed export or new additions; 0 turns hot reload off
+DATASET_POLL_SECONDS = float(os.environ.get('DATASET_POLL_SECONDS', 30))
+
+# Map the processed arrays from a file shared by all workers instead of holding a copy in each
+SHARED_ARRAYS = os.environ.get('SHARED_ARRAYS', '0').lower() in ('1', 'true', 'yes')
+# Set by gunicorn_preload.py: the app is imported once in the gunicorn master and each
+# worker starts its background threads after the fork
+PRELOAD = os.environ.get('TIMELINE_PRELOAD', '0').lower() in ('1', 'true', 'yes')
+
 # Initialize the timeline processor
-timeline_processor = TimelineProcessor(TIMELINE_JSON_PATH)
+timeline_processor = TimelineProcessor(TIMELINE_JSON_PATH, shared=SHARED_ARRAYS, background=not PRELOAD)
+if not PRELOAD:
+    timeline_processor.start_background(DATASET_POLL_SECONDS)
+
+# Serialized map responses, reused until the dataset changes
+response_cache = ResponseCache()
+
+# Let ?profile=1 return a sampled profile of the request instead of its response
+PROFILE_REQUESTS = os.environ.get('PROFILE_REQUESTS', '0').lower() in ('1', 'true', 'yes')
+
+REQUEST_SECONDS = histogram('vangon_http_request_duration_seconds', 'Time to answer a request, by route',
+                            ('route', 'method'))
+REQUESTS = counter('vangon_http_requests_total', 'Requests answered, by route and status', ('route', 'method', 'status'))
+RESPONSE_BYTES = histogram('vangon_http_response_size_bytes', 'Size of response bodies, by route', ('route',),
+                           buckets=SIZE_BUCKETS)
+
+gauge('vangon_response_cache_lookups_total', 'Response cache lookups by result', ('result',),
+      lambda: {(result,): response_cache.stats()[result] for result in ('hits', 'misses')}, kind='counter')
+gauge('vangon_response_cache_evictions_total', 'Responses evicted from the cache to stay under its size', (),
+      lambda: {(): response_cache.stats()['evictions']}, kind='counter')
+gauge('vangon_response_cache_entries', 'Responses held in the cache', (),
+      lambda: {(): response_cache.stats()['entries']})
+gauge('vangon_response_cache_bytes', 'Bytes of responses held in the cache', (),
+      lambda: {(): response_cache.stats()['bytes']})
+
+def _geocode_cache_lookups():
+    stats = timeline_processor.geocoder.cache_stats()
+    if stats is None:
+        return {}
+    return {(result,): stats[result] for result in ('hits', 'negative_hits', 'memory_hits', 'misses')}
+
+gauge('vangon_geocode_cache_lookups_total', 'Online geocoder cache lookups by result (none when offline)',
+      ('result',), _geocode_cache_lookups, kind='counter')
+gauge('vangon_geocode_stops', 'Stop coordinates to name, by state', ('state',),
+      lambda: {(state,): timeline_processor.geocode_pool.status()[state] for state in ('total', 'resolved', 'failed')})
+gauge('vangon_geocode_queue_depth', 'Geocoding jobs waiting for a worker thread', (),
+      lambda: {(): timeline_processor.geocode_pool.status()['queue_depth']})
+gauge('vangon_dataset_info', 'Version of the dataset being served', ('version',),
+      lambda: {(timeline_processor.dataset_version,): 1})
+gauge('vangon_dataset_rows', 'Rows in the dataset being served', ('store',),
+      lambda: {(name,): len(getattr(timeline_processor.snapshot, name)) for name in ('activities', 'visits', 'paths')})
+
+@app.before_request
+def _start_request():
+    g.request_start = time.perf_counter()
+    if PROFILE_REQUESTS:
+        try:
+            profile = parse_flag(request.args, 'profile')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if profile:
+            g.profiler = SamplingProfiler().start()
+
+@app.after_request
+def _record_request(response):
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    REQUEST_SECONDS.observe(elapsed, route, request.method)
+    REQUESTS.inc(route, request.method, str(response.status_code))
+    if response.content_length is not None:
+        RESPONSE_BYTES.observe(response.content_length, route)
+
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    # Folded stacks, for flamegraph.pl or speedscope, in place of the response
+    profiler.stop()
+    profile = Response(profiler.folded(), mimetype='text/plain')
+    profile.headers['X-Profile-Samples'] = str(profiler.samples)
+    profile.headers['X-Profile-Seconds'] = f'{elapsed:.6f}'
+    profile.headers['X-Profile-Status'] = str(response.status_code)
+    return profile
+
+def _normalized_filters(names):
+    """Query parameters that affect a response, in a canonical form for cache keys"""
+    filters = []
+    for name in names:
+        value = (request.args.get(name) or '').strip()
+        if not value:
+            continue
+        if name == 'zoom':
+            try:
+                value = str(float(value))
+            except ValueError:
+                pass
+        filters.append((name, value))
+    return tuple(filters)
+
+def _parse_zoom(value):
+    """Parse a web-map zoom level, clamped to the range map tiles exist for"""
+    if not value:
+        return None
+    zoom = float(value)
+    if not np.isfinite(zoom):
+        raise ValueError('zoom must be a number')
+    return min(max(zoom, 0.0), 22.0)
+
+def _processor():
+    """The processor of the journey a request is for; unprefixed routes serve the default journey"""
+    return g.get('processor', timeline_processor)
+
+def _cached_json(route, filter_names, build, serialize=None, mimetype='application/json', query=None):
+    """Serve a payload (JSON unless a mimetype is given) from the response cache, building it on a miss"""
+    # The key and the body come from the same snapshot, even if a newer one is published meanwhile
+    snapshot = _processor().snapshot
+    key = (g.get('journey_id'), route, snapshot.version, _normalized_filters(filter_names),
+           query.key() if query else None)
+    entry = response_cache.get(key)
+    if entry is None:
+        # Stage names leave out per-request parts such as the day of a path
+        name = route.split('/')[0]
+        with stage(f'{name}.build'):
+            payload = build(snapshot)
+        # Serialized exactly as jsonify would, unless the payload has its own encoder
+        with stage(f'{name}.serialize'):
+            body = serialize(payload) if serialize else app.json.response(payload).get_data()
+        entry = response_cache.put(key, body, mimetype)
+    return entry.to_response(request)
+
+def _parse_page(args):
+    """(limit, cursor) of a paginated request; limit is None when the whole result is asked for"""
+    cursor = (args.get('cursor') or '').strip() or None
+    limit = (args.get('limit') or '').strip()
+    if not limit and cursor is None:
+        return None, None
+    limit = int(limit) if limit else MAX_PAGE_SIZE
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    if cursor is not None:
+        decode_cursor(cursor)
+    return limit, cursor
+
+def _parse_day(value):
+    """UTC midnight, in epoch nanoseconds, of a YYYY-MM-DD path"""
+    day = pd.Timestamp(datetime.strptime(value, '%Y-%m-%d'), tz='UTC')
+    return day.as_unit('ns').value
 
 # API Routes
 @app.route('/api/dashboard/stats')
 def get_dashboard_stats():
     """Get dashboard statistics"""
     try:
-        stats = timeline_processor.get_dashboard_stats()
+        try:
+            query = ActivityQuery.from_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        stats = _processor().get_dashboard_stats(query)
         return jsonify(stats)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -665,11 +974,17 @@ def get_dashboard_stats():
 def get_map_data():
     """Get map visualization data"""
     try:
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
+        try:
+            query = ActivityQuery.from_args(request.args)
+            limit, cursor = _parse_page(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        map_data = timeline_processor.get_map_data(start_date, end_date)
-        return jsonify(map_data)
+        return _cached_json(
+            'map_data', ('limit', 'cursor'),
+            lambda snapshot: _processor().get_map_data(query, limit, cursor, snapshot),
+            query=query
+        )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -678,27 +993,170 @@ def get_recent_stops():
     """Get recent stops/visits"""
     try:
         limit = int(request.args.get('limit', 10))
-        stops = timeline_processor.get_recent_stops(limit)
+        stops = _processor().get_recent_stops(limit)
         return jsonify(stops)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _parse_point(args):
+    """(lat, lng) query parameters of a point"""
+    try:
+        lat, lng = float(args['lat']), float(args['lng'])
+    except (KeyError, ValueError):
+        raise ValueError('lat and lng are required numbers')
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('lat must be within [-90, 90] and lng within [-180, 180]')
+    return lat, lng
+
+def _parse_limit(args, name, default, maximum):
+    value = int(args.get(name, default))
+    if not 1 <= value <= maximum:
+        raise ValueError(f'{name} must be between 1 and {maximum}')
+    return value
+
+@app.route('/api/places')
+def get_places():
+    """Get the places stops were clustered into"""
+    try:
+        sort = request.args.get('sort', 'recent')
+        if sort not in PLACE_SORTS:
+            return jsonify({'error': f"sort must be one of {', '.join(PLACE_SORTS)}"}), 400
+        try:
+            limit = _parse_limit(request.args, 'limit', 100, MAX_PAGE_SIZE)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(_processor().get_places(sort, limit))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stats/outliers')
+def get_outliers():
+    """Get the activities left out by exclude_outliers"""
+    try:
+        try:
+            limit = _parse_limit(request.args, 'limit', 100, MAX_PAGE_SIZE)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return _cached_json(
+            'stats_outliers', ('limit',),
+            lambda snapshot: _processor().get_outliers(limit, snapshot)
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stops')
+def get_stops_in_bbox():
+    """Get the stops inside a map viewport"""
+    try:
+        try:
+            if not request.args.get('bbox'):
+                raise ValueError('bbox is required')
+            bbox = parse_bbox(request.args['bbox'])
+            limit = _parse_limit(request.args, 'limit', 1000, MAX_PAGE_SIZE)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(_processor().get_stops_in_bbox(bbox, limit))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stops/nearest')
+def get_nearest_stops():
+    """Get the stops nearest to a point"""
+    try:
+        try:
+            lat, lng = _parse_point(request.args)
+            k = _parse_limit(request.args, 'k', 10, MAX_NEAREST_STOPS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(_processor().get_nearest_stops(lat, lng, k))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stops/within')
+def get_stops_within():
+    """Get the stops within a radius of a point"""
+    try:
+        try:
+            lat, lng = _parse_point(request.args)
+            radius_km = float(request.args.get('radius_km', ''))
+            if not 0 < radius_km <= MAX_STOP_RADIUS_KM:
+                raise ValueError(f'radius_km must be above 0 and at most {MAX_STOP_RADIUS_KM:g}')
+            limit = _parse_limit(request.args, 'limit', 1000, MAX_PAGE_SIZE)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(_processor().get_stops_within(lat, lng, radius_km, limit))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/map/plotly')
 def get_plotly_map():
     """Get Plotly map visualization with filters"""
     try:
-        country_filter = request.args.get('country')
-        transport_filter = request.args.get('transport_mode')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        
-        map_data = timeline_processor.get_plotly_map(
-            country_filter=country_filter,
-            transport_filter=transport_filter,
-            start_date=start_date,
-            end_date=end_date
+        try:
+            zoom = _parse_zoom(request.args.get('zoom'))
+            query = ActivityQuery.from_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid filters: {e}'}), 400
+        
+        return _cached_json(
+            'map_plotly', ('zoom',),
+            lambda snapshot: _processor().get_plotly_map(query=query, zoom=zoom, snapshot=snapshot),
+            serialize=figure_json,
+            query=query
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/paths')
+def get_path_days():
+    """List the days that have route geometry"""
+    try:
+        return _cached_json('path_days', (), _processor().get_path_days)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/paths/<day>')
+def get_day_path(day):
+    """Get one day of route geometry, as encoded polylines or (format=binary) packed int32"""
+    try:
+        try:
+            day_ns = _parse_day(day)
+        except ValueError:
+            return jsonify({'error': 'Day must be YYYY-MM-DD'}), 400
+        
+        output_format = request.args.get('format', 'polyline')
+        if output_format == 'binary':
+            return _cached_json(
+                f'path_binary/{day_ns}', (),
+                lambda snapshot: _processor().get_day_path_binary(day_ns, snapshot),
+                serialize=bytes, mimetype='application/octet-stream'
+            )
+        if output_format != 'polyline':
+            return jsonify({'error': 'format must be polyline or binary'}), 400
+        return _cached_json(f'path/{day_ns}', (), lambda snapshot: _processor().get_day_path(day_ns, snapshot))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stats/timeseries')
+def get_stats_timeseries():
+    """Get journey totals over time, per day, week or month"""
+    try:
+        granularity = request.args.get('granularity', 'day')
+        group_by = request.args.get('group_by') or None
+        if granularity not in GRANULARITIES:
+            return jsonify({'error': f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+        if group_by is not None and group_by not in GROUP_BY:
+            return jsonify({'error': f"group_by must be one of {', '.join(GROUP_BY)}"}), 400
+        try:
+            query = ActivityQuery.from_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return _cached_json(
+            'stats_timeseries', ('granularity', 'group_by'),
+            lambda snapshot: _processor().get_stats_timeseries(granularity, group_by, query, snapshot),
+            query=query
         )
-        return jsonify(map_data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -706,11 +1164,128 @@ def get_plotly_map():
 def get_filters():
     """Get available filter options"""
     try:
-        filters = timeline_processor.get_available_filters()
+        filters = _processor().get_available_filters()
         return jsonify(filters)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _ingest_authorized():
+    """Check the request's bearer token against INGEST_TOKEN; ingestion is off when it is unset"""
+    token = os.environ.get('INGEST_TOKEN')
+    if not token:
+        return False
+    header = request.headers.get('Authorization', '')
+    return header.startswith('Bearer ') and hmac.compare_digest(header[len('Bearer '):], token)
+
+@app.route('/api/timeline/segments', methods=['POST'])
+def ingest_segments():
+    """Add new segments from a newer export or a {"semanticSegments": [...]} delta"""
+    if not _ingest_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    processor = _processor()
+    upload_path = None
+    try:
+        # Written to disk in chunks and streamed by the loader, never held in memory whole
+        upload_path = save_upload(request.stream, processor.additions_dir)
+        added = processor.ingest(upload_path)
+        return jsonify({
+            'added_segments': added,
+            'dataset_version': processor.dataset_version,
+            'activities_count': len(processor.snapshot.activities)
+        }), 201 if added else 200
+    except ValueError as e:
+        return jsonify({'error': f'Invalid timeline export: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if upload_path is not None and upload_path.exists():
+            upload_path.unlink()
+
+# Waitlist signups; opened on the first signup, so every gunicorn worker gets its own connections
+_waitlist = None
+_waitlist_lock = threading.Lock()
+
+def _waitlist_store():
+    global _waitlist
+    with _waitlist_lock:
+        if _waitlist is None:
+            _waitlist = create_waitlist_store()
+        return _waitlist
+
+def _upload_finished(job):
+    """Swap in a processed upload in this worker now; other workers pick it up on their next check"""
+    processor = journeys.peek(job['journey_id'])
+    if job['status'] == 'done' and processor is not None:
+        threading.Thread(target=processor.reload_if_changed, name='upload-reload', daemon=True).start()
+
+uploads = UploadQueue(on_done=_upload_finished)
+
+gauge('vangon_upload_jobs_pending', 'Upload jobs this worker queued that have not finished', (),
+      lambda: {(): uploads.status()['pending']})
+gauge('vangon_upload_jobs_total', 'Upload jobs this worker queued, by how they ended', ('status',),
+      lambda: {(status,): uploads.status()[status] for status in ('submitted', 'duplicates', 'done', 'failed', 'cancelled')},
+      kind='counter')
+
+@app.route('/api/journeys/<journey_id>/upload', methods=['POST'])
+def upload_journey_export(journey_id):
+    """Queue a journey's export (the request body) for processing, creating the journey if it is new"""
+    if not _ingest_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if journey_id in journeys.reserved or not valid_journey_id(journey_id):
+        return jsonify({'error': f'{journey_id} cannot be used as a journey ID'}), 400
+    
+    upload_path = None
+    try:
+        # Hashed while it is written to disk in chunks, never held in memory whole; next to the
+        # journeys, so the finished job can move it into place
+        upload_path, sha256, size = save_stream(request.stream, journeys.journeys_dir)
+        if not size:
+            upload_path.unlink()
+            return jsonify({'error': 'The upload is empty'}), 400
+        try:
+            journey = journeys.create(journey_id, (request.args.get('name') or '').strip() or None,
+                                      (request.args.get('start_date') or '').strip() or None)
+        except ValueError as e:
+            upload_path.unlink()
+            return jsonify({'error': str(e)}), 400
+        # From here the queue owns the file: the job removes it, or submit does for a repeat
+        path, upload_path = upload_path, None
+        try:
+            job, created = uploads.submit(journey, path, sha256, size)
+        except OverflowError as e:
+            return jsonify({'error': str(e)}), 503
+        return jsonify(public_job(job)), 202 if created else 200
+    except Exception as e:
+        if upload_path is not None and upload_path.exists():
+            upload_path.unlink()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>')
+def get_upload_job(job_id):
+    """Status and progress of an upload job"""
+    try:
+        job = read_job(job_id)
+        if job is None:
+            return jsonify({'error': 'Unknown job'}), 404
+        return jsonify(public_job(job))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_upload_job(job_id):
+    """Cancel an upload job that has not finished"""
+    if not _ingest_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        job = uploads.cancel(job_id)
+        if job is None:
+            return jsonify({'error': 'Unknown job'}), 404
+        return jsonify(public_job(job)), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/waitlist', methods=['POST'])
 def add_to_waitlist():
     """Add email to waitlist"""
@@ -725,37 +1300,15 @@ def add_to_waitlist():
         if '@' not in email or '.' not in email.split('@')[1]:
             return jsonify({'error': 'Invalid email format'}), 400
         
-        # Store in a simple JSON file (you can replace this with a database)
-        waitlist_file = Path(__file__).parent / "src" / "data" / "waitlist.json"
-        waitlist_file.parent.mkdir(parents=True, exist_ok=True)
-        
-        # Load existing emails
-        if waitlist_file.exists():
-            with open(waitlist_file, 'r') as f:
-                waitlist = json.load(f)
-        else:
-            waitlist = []
-        
-        # Check if email already exists
-        existing_emails = [entry['email'] for entry in waitlist]
-        if email in existing_emails:
+        # Duplicates are caught by the store, case-insensitively
+        timestamp = datetime.now().isoformat()
+        if not _waitlist_store().add(email, data.get('source', 'homepage'), timestamp):
             return jsonify({'message': 'Email already on waitlist'}), 200
         
-        # Add new email
-        waitlist.append({
-            'email': email,
-            'timestamp': datetime.now().isoformat(),
-            'source': data.get('source', 'homepage')
-        })
-        
-        # Save back to file
-        with open(waitlist_file, 'w') as f:
-            json.dump(waitlist, f, indent=2)
-        
         return jsonify({
             'message': 'Successfully added to waitlist',
             'email': email,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': timestamp
         }), 201
         
     except Exception as e:
@@ -766,9 +1319,82 @@ def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'timeline_loaded': timeline_processor.timeline_data is not None,
-        'activities_count': len(timeline_processor.activity_final) if timeline_processor.activity_final is not None else 0
+        'timeline_loaded': _processor().timeline_loaded,
+        'activities_count': len(_processor().snapshot.activities),
+        'dataset_version': _processor().dataset_version,
+        'geocode_cache': _processor().geocoder.cache_stats(),
+        'geocoding': _processor().geocode_pool.status(),
+        'response_cache': response_cache.stats(),
+        'journeys': journeys.status(),
+        'uploads': uploads.status()
     })
 
+@app.route('/api/journeys')
+def get_journeys():
+    """List the journeys served under /api/<journey_id>/, with whether each is loaded"""
+    try:
+        return jsonify({'journeys': journeys.journeys(), 'default': DEFAULT_JOURNEY_ID, **journeys.status()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/metrics')
+def get_metrics():
+    """Request, pipeline and cache metrics of this worker in the Prometheus text format"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# Journeys other than the default one, each served as /api/<journey_id>/... by the same views
+DEFAULT_JOURNEY_ID = os.environ.get('DEFAULT_JOURNEY_ID', 'default')
+JOURNEY_ENDPOINTS = (
+    'get_dashboard_stats', 'get_map_data', 'get_recent_stops', 'get_places', 'get_outliers', 'get_stops_in_bbox',
+    'get_nearest_stops', 'get_stops_within', 'get_plotly_map', 'get_path_days', 'get_day_path',
+    'get_stats_timeseries', 'get_filters', 'ingest_segments', 'health_check'
+)
+
+def _load_journey(settings):
+    processor = TimelineProcessor(
+        settings['json_path'], shared=SHARED_ARRAYS, start_date=settings['start_date'],
+        cache_dir=settings['cache_dir'], additions_dir=settings['additions_dir'],
+        geocoder=timeline_processor.geocoder
+    )
+    processor.watch(DATASET_POLL_SECONDS)
+    return processor
+
+for rule in list(app.url_map.iter_rules()):
+    if rule.endpoint in JOURNEY_ENDPOINTS:
+        app.add_url_rule('/api/<journey_id>' + rule.rule[len('/api'):], endpoint=rule.endpoint,
+                         methods=sorted(rule.methods - {'HEAD', 'OPTIONS'}))
+
+# Journey IDs that are also the first part of an unprefixed route could shadow it
+journeys = JourneyRegistry(_load_journey, reserved={DEFAULT_JOURNEY_ID} | {
+    rule.rule.split('/')[2] for rule in app.url_map.iter_rules() if rule.rule.startswith('/api/')
+})
+
+gauge('vangon_journeys_loaded', 'Journeys whose data is loaded in this worker, besides the default one', (),
+      lambda: {(): journeys.status()['loaded']})
+gauge('vangon_journeys_loaded_bytes', 'Approximate memory held by the loaded journeys', (),
+      lambda: {(): journeys.status()['loaded_bytes']})
+gauge('vangon_journey_loads_total', 'Journeys loaded or evicted', ('event',),
+      lambda: {(event,): journeys.status()[f'{event}s'] for event in ('load', 'eviction')}, kind='counter')
+
+@app.url_value_preprocessor
+def _take_journey_id(endpoint, values):
+    journey_id = values.pop('journey_id', None) if values and endpoint in JOURNEY_ENDPOINTS else None
+    # /api/default/... is the same journey as the unprefixed routes
+    g.journey_id = None if journey_id == DEFAULT_JOURNEY_ID else journey_id
+
+@app.before_request
+def _resolve_journey():
+    journey_id = g.get('journey_id')
+    if journey_id is None:
+        return None
+    try:
+        processor = journeys.get(journey_id)
+    except Exception as e:
+        print(f"Error loading journey {journey_id}: {e}")
+        return jsonify({'error': f'Could not load journey {journey_id}: {e}'}), 500
+    if processor is None:
+        return jsonify({'error': f'Unknown journey {journey_id}'}), 404
+    g.processor = processor
+
 if __name__ == '__main__':
     app.run(debug=False, host='127.0.0.1', port=5001)
@@ -0,0 +1,237 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from processed_cache import CACHE_DIR
+from timeline_synth import write_timeline
+
+# Endpoints timed at every scale; the first five are what the dashboard loads
+ENDPOINTS = (
+    '/api/dashboard/stats',
+    '/api/map/data',
+    '/api/map/plotly',
+    '/api/filters',
+    '/api/recent-stops',
+    '/api/map/plotly?zoom=10',
+    '/api/map/data?limit=1000',
+    '/api/stats/timeseries?granularity=week&group_by=mode',
+    '/api/places?sort=dwell'
+)
+# Figures compared against a baseline, and the smallest change in each unit that is not noise
+_COMPARED = ('p50_ms', 'cold_load_seconds', 'warm_load_seconds', 'rss_loaded_mb', 'peak_rss_mb')
+_NOISE = {'_ms': 0.5, '_seconds': 0.05, '_mb': 5}
+
+
+def _rss_mb():
+    """Current resident memory in MB (Linux only, None elsewhere)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return round(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024 / (1024 if platform.system() == 'Darwin' else 1), 1)
+
+
+def _timings(client, path, repeat):
+    """Latency of the first request (usually a response cache miss) and of ``repeat`` more, in ms"""
+    start = time.perf_counter()
+    response = client.get(path)
+    first = (time.perf_counter() - start) * 1000
+    if response.status_code != 200:
+        raise RuntimeError(f"{path} answered {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        client.get(path).get_data()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples = np.array(samples) if samples else np.array([first])
+    return {
+        'first_ms': round(first, 2),
+        'mean_ms': round(float(samples.mean()), 3),
+        'p50_ms': round(float(np.percentile(samples, 50)), 3),
+        'p95_ms': round(float(np.percentile(samples, 95)), 3),
+        'bytes': len(response.get_data())
+    }
+
+
+def _measure(json_path, repeat, uncached, results):
+    """Run in a fresh process: load the export through the app, then time every endpoint"""
+    if uncached:
+        # Nothing fits in a cache of 0 bytes, so every request builds its response
+        os.environ['RESPONSE_CACHE_MAX_BYTES'] = '0'
+    try:
+        results.put(_measure_app(json_path, repeat))
+    except Exception as e:
+        results.put({'error': str(e)})
+
+
+def _measure_app(json_path, repeat):
+    os.environ['TIMELINE_JSON_PATH'] = str(json_path)
+    os.environ['DATASET_POLL_SECONDS'] = '0'
+    import flask, pandas, scipy  # noqa: F401 - counted in the memory before loading, not in the load
+    before = _rss_mb()
+
+    # Importing the app loads the export: streamed and processed, as no processed cache exists yet
+    start = time.perf_counter()
+    import app
+    cold = time.perf_counter() - start
+    processor = app.timeline_processor
+    if not processor.timeline_loaded:
+        raise RuntimeError(f"The app could not load {json_path}")
+    loaded = _rss_mb()
+    peak = _peak_rss_mb()
+
+    # Names are resolved in the background; wait so the geocoding threads do not skew the timings
+    deadline = time.time() + 300
+    while processor.geocode_pool.status()['queue_depth'] and time.time() < deadline:
+        time.sleep(0.05)
+
+    # A worker starting later reads the processed cache the first load wrote
+    start = time.perf_counter()
+    app.TimelineProcessor(json_path, background=False)
+    warm = time.perf_counter() - start
+
+    client = app.app.test_client()
+    snapshot = processor.snapshot
+    return {
+        'activities': len(snapshot.activities),
+        'visits': len(snapshot.visits),
+        'paths': len(snapshot.paths),
+        'path_points': len(snapshot.paths.lat),
+        'cold_load_seconds': round(cold, 3),
+        'warm_load_seconds': round(warm, 3),
+        'rss_before_load_mb': before,
+        'rss_loaded_mb': loaded,
+        'peak_rss_mb': peak,
+        'endpoints': {path: _timings(client, path, repeat) for path in ENDPOINTS}
+    }
+
+
+def run_scale(json_path, repeat, uncached=False, clean_up=True):
+    """Benchmark one export in a fresh process, so load time and peak memory start from nothing"""
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=_measure, args=(json_path, repeat, uncached, results))
+    process.start()
+    try:
+        result = results.get()
+    finally:
+        process.join()
+    if clean_up:
+        # The processed cache written for a synthetic export
+        for path in Path(CACHE_DIR).glob(f"{Path(json_path).stem}.*"):
+            path.unlink()
+    if 'error' in result:
+        raise RuntimeError(f"Benchmark of {json_path} failed: {result['error']}")
+    return result
+
+
+def _flatten(result, prefix=''):
+    values = {}
+    for name, value in result.items():
+        if isinstance(value, dict):
+            values.update(_flatten(value, f"{prefix}{name} "))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[f"{prefix}{name}"] = value
+    return values
+
+
+def compare(results, baseline, tolerance):
+    """Print how each timing and memory figure moved against a baseline run; returns the regressions"""
+    if baseline.get('uncached') != results.get('uncached'):
+        print("Only one of the runs had the response cache turned off; endpoint timings are not comparable")
+    previous = {run['segments']: run for run in baseline['runs']}
+    regressions = []
+    for run in results['runs']:
+        if run['segments'] not in previous:
+            continue
+        old, new = _flatten(previous[run['segments']]), _flatten(run)
+        for name, value in new.items():
+            if name not in old or not name.endswith(_COMPARED) or not old[name]:
+                continue
+            # Every figure compared is a time or a size, so larger is worse
+            change = value / old[name] - 1
+            noise = next(floor for unit, floor in _NOISE.items() if name.endswith(unit))
+            flag = ''
+            if change > tolerance and value - old[name] > noise:
+                flag = '  REGRESSION'
+                regressions.append((run['segments'], name, old[name], value))
+            print(f"{run['segments']:>9} {name:<70} {old[name]:>10} -> {value:>10} ({change:+.0%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark load time, memory and endpoint latency "
+                                                 "on synthetic Google Timeline exports")
+    parser.add_argument('--segments', type=int, nargs='+', default=[1_000, 10_000, 100_000],
+                        help="Export sizes to benchmark, in semanticSegments (1k to 1M)")
+    parser.add_argument('--export', help="Benchmark this export instead of generating synthetic ones")
+    parser.add_argument('--repeat', type=int, default=50, help="Requests per endpoint after the first")
+    parser.add_argument('--uncached', action='store_true',
+                        help="Turn the response cache off, so every request builds its response")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--compare', help="Results of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Slowdown against --compare reported as a regression (0.25 is 25%%)")
+    args = parser.parse_args()
+
+    results = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'repeat': args.repeat,
+        'uncached': args.uncached,
+        'runs': []
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        exports = [(None, Path(args.export))] if args.export else [
+            (count, Path(tmp) / f"benchmark_{count}_{args.seed}.json") for count in args.segments
+        ]
+        for count, json_path in exports:
+            run = {'segments': count, 'source': 'export' if count is None else 'synthetic'}
+            if count is not None:
+                start = time.perf_counter()
+                write_timeline(json_path, count, args.seed)
+                run['generate_seconds'] = round(time.perf_counter() - start, 2)
+            run['file_mb'] = round(json_path.stat().st_size / 1024 / 1024, 1)
+            run.update(run_scale(json_path, args.repeat, args.uncached, clean_up=count is not None))
+            results['runs'].append(run)
+            endpoints = ', '.join(f"{path} {timing['p50_ms']} ms" for path, timing in run['endpoints'].items()
+                                  if path in ENDPOINTS[:5])
+            print(f"{count or json_path.name}: cold load {run['cold_load_seconds']} s, "
+                  f"warm load {run['warm_load_seconds']} s, peak {run['peak_rss_mb']} MB; p50 {endpoints}")
+            if count is not None:
+                json_path.unlink()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} figures regressed by more than {args.tolerance:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,371 @@
+import gzip
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from timeline_loader import DATA_DIR
+
+# Simplified Natural Earth country polygons for Europe and its neighbours
+COUNTRIES_PATH = DATA_DIR / "geo" / "countries.geojson.gz"
+# GeoNames places with population >= 1000 across Europe and its neighbours
+CITIES_PATH = DATA_DIR / "geo" / "cities.csv.gz"
+
+# Points at most this far (in degrees) outside every polygon snap to the nearest
+# border, so campsites on a coastline that the simplified shapes cut off still resolve
+COAST_TOLERANCE = 0.05
+
+# Land added to outlines too coarse around places on the route, by ISO code (lng, lat rings)
+PATCHES = {
+    # Both banks of the Bosphorus from Buyukcekmece to Tuzla, joining the European and Anatolian
+    # parts of the 1:110m Turkey outline, which leaves central Istanbul outside both
+    'TR': [[(28.60, 41.04), (28.80, 40.96), (28.93, 40.99), (28.985, 41.005), (29.01, 40.975), (29.06, 40.95),
+            (29.18, 40.88), (29.30, 40.80), (29.45, 40.80), (29.45, 41.20), (29.10, 41.24), (28.90, 41.28),
+            (28.60, 41.20), (28.60, 41.04)]],
+}
+
+# The simplified borders are off by up to a few hundred metres, enough to put towns on a border
+# river (Freilassing, Gorizia, Slubice) in the neighbouring country. Around each GeoNames place the
+# polygons put on the wrong side of a border at most BORDER_ERROR (degrees) away, points they put
+# in the same wrong country take the place's country instead, up to PLACE_RADIUS from it.
+BORDER_ERROR = 0.1
+PLACE_RADIUS = 0.02
+
+# Upper bound on the points x edges matrix built for one crossing test
+_MAX_BLOCK = 2_000_000
+_EMPTY = np.empty(0, dtype=np.int64)
+
+
+class CountryResolver:
+    """Batched point-in-polygon country lookup.
+
+    Polygons are split into parts (an outer ring plus its holes). A uniform
+    grid maps each cell to the parts whose bounding box touches it, and each
+    part's edges are bucketed by grid row so a ray-crossing test only looks
+    at edges that can cross the point's latitude. Parts are tried smallest
+    first, so enclaves and overlapping borders resolve to the smaller country.
+    """
+
+    def __init__(self, path=COUNTRIES_PATH, cell_size=0.5, coast_tolerance=COAST_TOLERANCE, patches=PATCHES,
+                 places_path=CITIES_PATH):
+        self.cell_size = cell_size
+        self.coast_tolerance = coast_tolerance
+        self.n_cols = int(np.ceil(360 / cell_size))
+        self.n_rows = int(np.ceil(180 / cell_size))
+
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            features = json.load(f)['features']
+
+        self.names = np.array([f['properties']['name'] for f in features], dtype=object)
+        self.codes = np.array([f['properties'].get('iso_a2', '') for f in features], dtype=object)
+
+        parts = []
+        for country_id, feature in enumerate(features):
+            geometry = feature['geometry']
+            polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+            for rings in polygons:
+                rings = [_unwrap(np.asarray(ring, dtype=np.float64)) for ring in rings if len(ring) >= 4]
+                if rings:
+                    parts.append((country_id, rings))
+            for ring in patches.get(self.codes[country_id], ()):
+                parts.append((country_id, [np.asarray(ring, dtype=np.float64)]))
+
+        # Smallest parts first
+        parts.sort(key=lambda part: _ring_area(part[1][0]))
+
+        x1, y1, x2, y2, edge_part = [], [], [], [], []
+        part_country = np.empty(len(parts), dtype=np.int32)
+        part_bbox = np.empty((len(parts), 4))
+        for part_id, (country_id, rings) in enumerate(parts):
+            part_country[part_id] = country_id
+            outer = rings[0]
+            part_bbox[part_id] = (outer[:, 0].min(), outer[:, 1].min(), outer[:, 0].max(), outer[:, 1].max())
+            for ring in rings:
+                x1.append(ring[:-1, 0])
+                y1.append(ring[:-1, 1])
+                x2.append(ring[1:, 0])
+                y2.append(ring[1:, 1])
+                edge_part.append(np.full(len(ring) - 1, part_id, dtype=np.int32))
+
+        self.part_country = part_country
+        self.part_bbox = part_bbox
+        self.edge_x1 = np.concatenate(x1)
+        self.edge_y1 = np.concatenate(y1)
+        self.edge_x2 = np.concatenate(x2)
+        self.edge_y2 = np.concatenate(y2)
+        self.edge_part = np.concatenate(edge_part)
+
+        self._build_cell_index()
+        self._build_band_index()
+        self._build_place_fixes(places_path)
+
+    def _build_cell_index(self):
+        """Map each grid cell to the parts whose bounding box overlaps it"""
+        part_ids, cell_keys = self._cells_covering(*self.part_bbox.T)
+        order = np.lexsort((part_ids, cell_keys))
+        # Within a cell part ids stay in priority order
+        self._cell_parts = _group(cell_keys[order], part_ids[order])
+
+        # Cells crossed by a part's border need an exact test; any other cell in the
+        # part's bounding box is either wholly inside or wholly outside it
+        edge_ids, edge_cells = self._cells_covering(
+            np.minimum(self.edge_x1, self.edge_x2), np.minimum(self.edge_y1, self.edge_y2),
+            np.maximum(self.edge_x1, self.edge_x2), np.maximum(self.edge_y1, self.edge_y2)
+        )
+        n_cells = self.n_rows * self.n_cols
+        self._border_cells = set((self.edge_part[edge_ids].astype(np.int64) * n_cells + edge_cells).tolist())
+        self._interior = {}
+
+        # Edges near each cell, for snapping points that fall just outside every polygon
+        tol = self.coast_tolerance
+        edge_ids, edge_cells = self._cells_covering(
+            np.minimum(self.edge_x1, self.edge_x2) - tol, np.minimum(self.edge_y1, self.edge_y2) - tol,
+            np.maximum(self.edge_x1, self.edge_x2) + tol, np.maximum(self.edge_y1, self.edge_y2) + tol
+        )
+        order = np.argsort(edge_cells, kind='stable')
+        self._cell_edges = _group(edge_cells[order], edge_ids[order])
+
+    def _build_place_fixes(self, places_path):
+        """Index the places, marking those the polygons put in another country than GeoNames does near its border"""
+        self._place_tree = None
+        if places_path is None:
+            return
+        places = pd.read_csv(places_path, keep_default_na=False, usecols=['lat', 'lng', 'cc'])
+        country_ids = {code: i for i, code in enumerate(self.codes) if code}
+        lats = places['lat'].to_numpy(dtype=np.float64)
+        lngs = places['lng'].to_numpy(dtype=np.float64)
+        actual = places['cc'].map(country_ids).fillna(-1).to_numpy(dtype=np.int32)
+        resolved = self.resolve_ids(lats, lngs)
+
+        # Radius of the area around each misplaced place that is moved into its country; 0 for the rest
+        radius = np.zeros(len(places))
+        for i in np.flatnonzero((resolved >= 0) & (actual >= 0) & (resolved != actual)).tolist():
+            # How far the place is from its own country's border bounds the area the polygons got wrong
+            edges = np.flatnonzero(self.part_country[self.edge_part] == actual[i])
+            scale = np.cos(np.radians(lats[i]))
+            distance = _segment_distance(
+                lngs[i] * scale, lats[i], self.edge_x1[edges] * scale, self.edge_y1[edges],
+                self.edge_x2[edges] * scale, self.edge_y2[edges]
+            ).min()
+            if distance <= BORDER_ERROR:
+                radius[i] = min(distance + 0.005, PLACE_RADIUS)
+        fixes = np.flatnonzero(radius > 0)
+        if len(fixes) == 0:
+            return
+        self._place_tree = cKDTree(np.column_stack((lngs * np.cos(np.radians(lats)), lats)))
+        self._place_radius = radius
+        self._place_resolved = resolved
+        self._place_country = actual
+        _, cells = self._cells_covering(lngs[fixes] - PLACE_RADIUS * 2, lats[fixes] - PLACE_RADIUS,
+                                        lngs[fixes] + PLACE_RADIUS * 2, lats[fixes] + PLACE_RADIUS)
+        self._fix_cells = np.unique(cells)
+
+    def _fix_near_places(self, lats, lngs, ids):
+        """Move points whose nearest place is a misplaced border place into that place's country.
+
+        Only the nearest place counts, so of two towns facing each other
+        across a border river each keeps its own side.
+        """
+        distance, nearest = self._place_tree.query(np.column_stack((lngs * np.cos(np.radians(lats)), lats)))
+        radius = self._place_radius[nearest]
+        fix = (radius > 0) & (distance <= radius) & (ids == self._place_resolved[nearest])
+        ids[fix] = self._place_country[nearest[fix]]
+        return ids
+
+    def _cells_covering(self, min_x, min_y, max_x, max_y):
+        """Expand bounding boxes into (item index, grid cell key) pairs"""
+        col_lo, col_hi = self._col(min_x), self._col(max_x)
+        row_lo, row_hi = self._row(min_y), self._row(max_y)
+        n_cols = col_hi - col_lo + 1
+        counts = (row_hi - row_lo + 1) * n_cols
+        items = np.repeat(np.arange(len(counts)), counts)
+        offsets = np.arange(len(items)) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = row_lo[items] + offsets // n_cols[items]
+        cols = col_lo[items] + offsets % n_cols[items]
+        return items, rows * self.n_cols + cols
+
+    def _build_band_index(self):
+        """Bucket every edge under each (part, grid row) pair its latitude span touches"""
+        row_lo = self._row(np.minimum(self.edge_y1, self.edge_y2))
+        row_hi = self._row(np.maximum(self.edge_y1, self.edge_y2))
+        spans = row_hi - row_lo + 1
+        edge_ids = np.repeat(np.arange(len(spans)), spans)
+        offsets = np.arange(len(edge_ids)) - np.repeat(np.cumsum(spans) - spans, spans)
+        rows = np.repeat(row_lo, spans) + offsets
+        keys = self.edge_part[edge_ids].astype(np.int64) * self.n_rows + rows
+
+        order = np.argsort(keys, kind='stable')
+        self._bands = _group(keys[order], edge_ids[order])
+
+    def _col(self, lng):
+        return np.clip(np.floor((np.asarray(lng) + 180) / self.cell_size).astype(np.int64), 0, self.n_cols - 1)
+
+    def _row(self, lat):
+        return np.clip(np.floor((np.asarray(lat) + 90) / self.cell_size).astype(np.int64), 0, self.n_rows - 1)
+
+    def _band(self, part_id, row):
+        return self._bands.get(int(part_id) * self.n_rows + int(row), _EMPTY)
+
+    def _cell_inside(self, part_id, cell):
+        """Whether a cell with no border edges of the part lies inside it"""
+        key = (int(part_id), cell)
+        inside = self._interior.get(key)
+        if inside is None:
+            row, col = divmod(cell, self.n_cols)
+            center_lat = np.array([(row + 0.5) * self.cell_size - 90])
+            center_lng = np.array([(col + 0.5) * self.cell_size - 180])
+            inside = bool(self._contains(part_id, row, center_lat, center_lng)[0])
+            self._interior[key] = inside
+        return inside
+
+    def _contains(self, part_id, row, lats, lngs):
+        """Even-odd ray test of points (all in one grid row) against one part"""
+        edges = self._band(part_id, row)
+        if len(edges) == 0:
+            return np.zeros(len(lats), dtype=bool)
+        x1, y1 = self.edge_x1[edges], self.edge_y1[edges]
+        x2, y2 = self.edge_x2[edges], self.edge_y2[edges]
+        inside = np.empty(len(lats), dtype=bool)
+        block = max(1, _MAX_BLOCK // len(edges))
+        for start in range(0, len(lats), block):
+            py = lats[start:start + block, None]
+            px = lngs[start:start + block, None]
+            spans = (y1 > py) != (y2 > py)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x_cross = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            crossings = np.count_nonzero(spans & (px < x_cross), axis=1)
+            inside[start:start + block] = crossings % 2 == 1
+        return inside
+
+    def resolve_ids(self, lats, lngs):
+        """Return the country index for each point, or -1 when it falls outside every polygon"""
+        lats = np.asarray(lats, dtype=np.float64).ravel()
+        lngs = np.asarray(lngs, dtype=np.float64).ravel()
+        result = np.full(len(lats), -1, dtype=np.int32)
+
+        valid = np.flatnonzero(np.isfinite(lats) & np.isfinite(lngs))
+        if len(valid) == 0:
+            return result
+
+        rows = self._row(lats[valid])
+        cell_keys = rows * self.n_cols + self._col(lngs[valid])
+        unique_cells, inverse = np.unique(cell_keys, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(unique_cells) + 1))
+
+        for i, cell in enumerate(unique_cells.tolist()):
+            candidates = self._cell_parts.get(cell)
+            if candidates is None:
+                continue
+            points = valid[order[bounds[i]:bounds[i + 1]]]
+            row = cell // self.n_cols
+            n_cells = self.n_rows * self.n_cols
+            pending = points
+            for part_id in candidates:
+                if int(part_id) * n_cells + cell not in self._border_cells:
+                    if self._cell_inside(part_id, cell):
+                        result[pending] = self.part_country[part_id]
+                        pending = pending[:0]
+                        break
+                    continue
+                min_x, min_y, max_x, max_y = self.part_bbox[part_id]
+                plat, plng = lats[pending], lngs[pending]
+                in_box = (plat >= min_y) & (plat <= max_y) & (plng >= min_x) & (plng <= max_x)
+                if not in_box.any():
+                    continue
+                boxed = pending[in_box]
+                hit = self._contains(part_id, row, lats[boxed], lngs[boxed])
+                result[boxed[hit]] = self.part_country[part_id]
+                pending = pending[result[pending] == -1]
+                if len(pending) == 0:
+                    break
+
+            if len(pending) and self.coast_tolerance:
+                result[pending] = self._snap_to_border(cell, lats[pending], lngs[pending])
+
+        # None while the places themselves are resolved to build it
+        if self._place_tree is not None:
+            near = valid[np.isin(cell_keys, self._fix_cells)]
+            if len(near):
+                result[near] = self._fix_near_places(lats[near], lngs[near], result[near])
+        return result
+
+    def _snap_to_border(self, cell, lats, lngs):
+        """Assign points to the country with the closest border edge within coast_tolerance"""
+        result = np.full(len(lats), -1, dtype=np.int32)
+        edges = self._cell_edges.get(cell)
+        if edges is None:
+            return result
+        scale = np.cos(np.radians(lats))[:, None]
+        block = max(1, _MAX_BLOCK // len(edges))
+        for start in range(0, len(lats), block):
+            sl = slice(start, start + block)
+            dist = _segment_distance(
+                lngs[sl, None] * scale[sl], lats[sl, None],
+                self.edge_x1[edges] * scale[sl], self.edge_y1[edges],
+                self.edge_x2[edges] * scale[sl], self.edge_y2[edges]
+            )
+            nearest = np.argmin(dist, axis=1)
+            close = dist[np.arange(len(nearest)), nearest] <= self.coast_tolerance
+            chunk = result[sl]
+            chunk[close] = self.part_country[self.edge_part[edges[nearest[close]]]]
+        return result
+
+    def resolve(self, lats, lngs):
+        """Return the country name for each point (None when unknown)"""
+        ids = self.resolve_ids(lats, lngs)
+        return np.append(self.names, None)[ids]
+
+    def resolve_codes(self, lats, lngs):
+        """Return the ISO 3166-1 alpha-2 code for each point (None when unknown)"""
+        ids = self.resolve_ids(lats, lngs)
+        return np.append(self.codes, None)[ids]
+
+
+def _group(sorted_keys, values):
+    """Split values into a dict of arrays keyed by their (pre-sorted) keys"""
+    unique_keys, starts = np.unique(sorted_keys, return_index=True)
+    ends = np.append(starts[1:], len(sorted_keys))
+    return {key: values[start:end] for key, start, end in zip(unique_keys.tolist(), starts, ends)}
+
+
+def _unwrap(ring):
+    """Shift the western longitudes of a ring crossing the antimeridian (Russia's) past 180.
+
+    Its edges would otherwise jump across the whole map, and a ray cast from
+    Europe would miss the ring's eastern side and count the point as inside.
+    """
+    if ring[:, 0].max() - ring[:, 0].min() > 180:
+        ring[:, 0] = np.where(ring[:, 0] < 0, ring[:, 0] + 360, ring[:, 0])
+    return ring
+
+
+def _ring_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return abs(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1])) / 2
+
+
+def _segment_distance(px, py, x1, y1, x2, y2):
+    """Planar distance from points to segments (broadcast)"""
+    dx, dy = x2 - x1, y2 - y1
+    length_sq = dx * dx + dy * dy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(length_sq > 0, ((px - x1) * dx + (py - y1) * dy) / length_sq, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_country_resolver():
+    """Return the shared resolver, building it on first use"""
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = CountryResolver()
+    return _resolver
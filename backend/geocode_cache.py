@@ -0,0 +1,300 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from timeline_loader import DATA_DIR
+
+GEOCODE_CACHE_PATH = DATA_DIR / "cache" / "geocode.sqlite3"
+
+# Decimal places kept when snapping coordinates to a cache key (4 is roughly 11 m)
+DEFAULT_PRECISION = 4
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+# Failed lookups are retried sooner than successful ones expire
+DEFAULT_NEGATIVE_TTL_SECONDS = 24 * 3600
+DEFAULT_MAX_ENTRIES = 50_000
+
+# Only refresh an entry's last-access time this often, to keep reads mostly read-only
+_TOUCH_INTERVAL = 3600
+# Check the size bound every this many writes
+_EVICT_EVERY = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS geocode (
+    namespace TEXT NOT NULL,
+    lat_q INTEGER NOT NULL,
+    lng_q INTEGER NOT NULL,
+    payload TEXT,
+    created REAL NOT NULL,
+    expires REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (namespace, lat_q, lng_q)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS geocode_last_access ON geocode (namespace, last_access);
+"""
+
+_RATE_LIMIT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limit (
+    name TEXT PRIMARY KEY,
+    next_slot REAL NOT NULL
+);
+"""
+
+
+def _open(path):
+    conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+class GeocodeCache:
+    """Reverse-geocoding results shared by every worker through one SQLite file.
+
+    Coordinates are quantized to ``precision`` decimals before lookup, so
+    nearby points share an entry. A result of None is cached too (with a
+    shorter TTL) so coordinates the backend cannot name are not retried on
+    every request. Entries expire by TTL and the least recently used are
+    dropped once the table grows past ``max_entries``. A per-process LRU
+    dictionary of at most ``max_entries`` in front of SQLite serves repeated
+    and pre-warmed keys; it is shared by the geocoding threads, so every
+    access to it holds the lock.
+    """
+
+    def __init__(self, path=None, namespace='default', precision=None, ttl=None,
+                 negative_ttl=None, max_entries=None):
+        env = os.environ
+        self.path = str(path or env.get('GEOCODE_CACHE_PATH', GEOCODE_CACHE_PATH))
+        self.namespace = namespace
+        self.precision = int(precision if precision is not None else env.get('GEOCODE_CACHE_PRECISION', DEFAULT_PRECISION))
+        self.ttl = float(ttl if ttl is not None else env.get('GEOCODE_CACHE_TTL', DEFAULT_TTL_SECONDS))
+        self.negative_ttl = float(negative_ttl if negative_ttl is not None
+                                  else env.get('GEOCODE_CACHE_NEGATIVE_TTL', DEFAULT_NEGATIVE_TTL_SECONDS))
+        self.max_entries = int(max_entries if max_entries is not None
+                               else env.get('GEOCODE_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+        self._scale = 10 ** self.precision
+
+        self._local = threading.local()
+        self._memory = OrderedDict()  # key -> (value, expires), least recently used first
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.counters = {'hits': 0, 'misses': 0, 'negative_hits': 0, 'memory_hits': 0, 'writes': 0, 'evictions': 0}
+
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = _open(self.path)
+        return conn
+
+    def key(self, lat, lng):
+        """Quantize a coordinate pair to its integer cache key"""
+        return int(round(lat * self._scale)), int(round(lng * self._scale))
+
+    def key_center(self, key):
+        """The coordinate a cache key stands for"""
+        return key[0] / self._scale, key[1] / self._scale
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def _remember(self, key, value, expires):
+        """Keep an entry in the in-process copy, dropping the least recently used past max_entries"""
+        with self._lock:
+            self._memory[key] = (value, expires)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _recall(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+            return entry
+
+    def get(self, lat, lng):
+        """Return (found, value); value is None for a cached negative result"""
+        key = self.key(lat, lng)
+        now = time.time()
+        entry = self._recall(key)
+        if entry is not None and entry[1] > now:
+            self._count('memory_hits')
+            self._count('negative_hits' if entry[0] is None else 'hits')
+            return True, entry[0]
+
+        row = self._connect().execute(
+            'SELECT payload, expires, last_access FROM geocode WHERE namespace = ? AND lat_q = ? AND lng_q = ?',
+            (self.namespace, key[0], key[1])
+        ).fetchone()
+        if row is None or row[1] <= now:
+            self._count('misses')
+            return False, None
+
+        payload, expires, last_access = row
+        value = json.loads(payload) if payload is not None else None
+        self._remember(key, value, expires)
+        if now - last_access > _TOUCH_INTERVAL:
+            self._connect().execute(
+                'UPDATE geocode SET last_access = ? WHERE namespace = ? AND lat_q = ? AND lng_q = ?',
+                (now, self.namespace, key[0], key[1])
+            )
+        self._count('negative_hits' if value is None else 'hits')
+        return True, value
+
+    def put(self, lat, lng, value):
+        """Store a result; pass None to remember that the backend had no answer"""
+        key = self.key(lat, lng)
+        now = time.time()
+        expires = now + (self.ttl if value is not None else self.negative_ttl)
+        payload = json.dumps(value) if value is not None else None
+        self._connect().execute(
+            'INSERT OR REPLACE INTO geocode (namespace, lat_q, lng_q, payload, created, expires, last_access) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (self.namespace, key[0], key[1], payload, now, expires, now)
+        )
+        self._remember(key, value, expires)
+        self._count('writes')
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % _EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used beyond max_entries"""
+        conn = self._connect()
+        now = time.time()
+        removed = conn.execute(
+            'DELETE FROM geocode WHERE namespace = ? AND expires <= ?', (self.namespace, now)
+        ).rowcount
+        count = conn.execute('SELECT COUNT(*) FROM geocode WHERE namespace = ?', (self.namespace,)).fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            removed += conn.execute(
+                'DELETE FROM geocode WHERE namespace = ? AND (lat_q, lng_q) IN ('
+                'SELECT lat_q, lng_q FROM geocode WHERE namespace = ? ORDER BY last_access LIMIT ?)',
+                (self.namespace, self.namespace, excess)
+            ).rowcount
+        with self._lock:
+            for key in [key for key, entry in self._memory.items() if entry[1] <= now]:
+                del self._memory[key]
+        self._count('evictions', max(removed, 0))
+        return removed
+
+    def prewarm(self, lats, lngs):
+        """Load cached entries for these coordinates into memory.
+
+        Returns the quantized keys that have no live entry yet, so a caller can
+        schedule them for lookup.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        valid = np.isfinite(lats) & np.isfinite(lngs)
+        lat_q = np.round(lats[valid] * self._scale).astype(np.int64)
+        lng_q = np.round(lngs[valid] * self._scale).astype(np.int64)
+        wanted = set(zip(lat_q.tolist(), lng_q.tolist()))
+
+        now = time.time()
+        rows = self._connect().execute(
+            'SELECT lat_q, lng_q, payload, expires FROM geocode WHERE namespace = ? AND expires > ?',
+            (self.namespace, now)
+        )
+        for lat_key, lng_key, payload, expires in rows:
+            key = (lat_key, lng_key)
+            if key in wanted:
+                self._remember(key, json.loads(payload) if payload is not None else None, expires)
+                wanted.discard(key)
+        return sorted(wanted)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['negative_hits']) / lookups, 4) if lookups else None
+        stats['precision'] = self.precision
+        return stats
+
+
+class SharedRateLimiter:
+    """Space calls ``interval`` seconds apart across every process using the same SQLite file.
+
+    Each caller reserves the next free slot in a single write transaction and
+    then sleeps until it, so gunicorn workers queue behind one another instead
+    of each keeping its own one-request-per-second budget.
+    """
+
+    def __init__(self, name, interval, path=None):
+        self.name = name
+        self.interval = float(interval)
+        self.path = str(path or os.environ.get('GEOCODE_CACHE_PATH', GEOCODE_CACHE_PATH))
+        self._local = threading.local()
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._connect().executescript(_RATE_LIMIT_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = _open(self.path)
+        return conn
+
+    def reserve(self):
+        """Claim the next slot and return its wall-clock time"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT next_slot FROM rate_limit WHERE name = ?', (self.name,)).fetchone()
+            slot = max(time.time(), row[0] if row else 0.0)
+            conn.execute('INSERT OR REPLACE INTO rate_limit (name, next_slot) VALUES (?, ?)',
+                         (self.name, slot + self.interval))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return slot
+
+    def wait(self):
+        """Block until this caller may make its request"""
+        delay = self.reserve() - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class CachedGeocoder:
+    """Put a GeocodeCache in front of a geocoding backend"""
+
+    def __init__(self, backend, cache, rate_limiter=None):
+        self.backend = backend
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+
+    def reverse(self, lat, lng):
+        found, value = self.cache.get(lat, lng)
+        if found:
+            return value
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait()
+            # Another worker may have resolved the same key while this one waited for its slot
+            found, value = self.cache.get(lat, lng)
+            if found:
+                return value
+        # Query the point the key stands for, so the cached answer is the same for every point in the cell
+        value = self.backend.reverse(*self.cache.key_center(self.cache.key(lat, lng)))
+        self.cache.put(lat, lng, value)
+        return value
+
+    def prewarm(self, lats, lngs):
+        return self.cache.prewarm(lats, lngs)
+
+    def stats(self):
+        return self.cache.stats()
@@ -0,0 +1,246 @@
+import itertools
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from geocoding import fallback_location
+from metrics import counter, histogram
+
+DEFAULT_WORKERS = 2
+
+# Queue priorities: points asked for by a request jump ahead of the bulk backlog
+_PRIORITY_STOP = -1
+_PRIORITY_REQUEST = 1
+_PRIORITY_BACKLOG = 2
+
+# Coordinates are grouped at this many decimals (about 1 m) before lookup
+_KEY_DECIMALS = 5
+
+GEOCODER_CALLS = counter('vangon_geocoder_calls_total', 'Geocoder lookups by backend and outcome',
+                         ('backend', 'result'))
+GEOCODER_SECONDS = histogram('vangon_geocoder_call_duration_seconds',
+                             'Time per geocoder call (one offline call names a whole batch)', ('backend',))
+
+
+def location_label(location):
+    """The short name shown for a stop"""
+    return location['city'] or location['name']
+
+
+class GeocodeWorkerPool:
+    """Name stops with the offline geocoder up front and refine them online in background threads.
+
+    ``start`` names every distinct stop coordinate with the offline
+    geocoder in one local batch before it returns, so a snapshot is
+    published with its names. When an online backend is set, each
+    coordinate is then queued for enrichment, most recent stops first, and
+    stays ``pending`` until the online backend answers; only those lookups
+    run in the worker threads, so requests never wait on the network.
+    Results are handed to ``on_update(rows, labels, pending)`` (parallel
+    lists). The online backend is expected to do its own rate limiting.
+    """
+
+    def __init__(self, geocoder, workers=None):
+        self.geocoder = geocoder
+        self.workers = int(workers if workers is not None else os.environ.get('GEOCODE_WORKERS', DEFAULT_WORKERS))
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._threads = []
+
+        self._rows = {}        # key -> visit rows at that coordinate
+        self._results = {}     # key -> final location dict
+        self._provisional = {} # key -> offline location while the online answer is pending
+        self._queued = set()
+        self._on_update = None
+        self.counters = {'total': 0, 'resolved': 0, 'failed': 0}
+
+    @staticmethod
+    def key(lat, lng):
+        return round(float(lat), _KEY_DECIMALS), round(float(lng), _KEY_DECIMALS)
+
+    @property
+    def online(self):
+        return self.geocoder.online is not None
+
+    def _ensure_threads(self):
+        if self._threads:
+            return
+        for i in range(max(self.workers, 1)):
+            thread = threading.Thread(target=self._run, name=f"geocode-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _put(self, priority, job):
+        self._queue.put((priority, next(self._order), job))
+
+    def start(self, lats, lngs, start_times, on_update):
+        """Name every stop (place) coordinate offline and queue the online lookups; rows are reported back by position.
+
+        Calling it again for a new set of stops points every coordinate at
+        its new rows, reports the names already known straight away and only
+        looks up the coordinates seen for the first time.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        # Most recent stops first, since those are the ones the dashboard shows
+        order = np.argsort(np.asarray(start_times), kind='stable')[::-1]
+
+        rows = {}
+        for row in order.tolist():
+            if not (np.isfinite(lats[row]) and np.isfinite(lngs[row])):
+                continue
+            rows.setdefault(self.key(lats[row], lngs[row]), []).append(row)
+
+        with self._lock:
+            self._on_update = on_update
+            self._rows = rows
+            known = [key for key in rows if key in self._results or key in self._provisional]
+            keys = [key for key in rows if key not in self._results and key not in self._provisional]
+            self.counters['total'] = len(rows)
+            self.counters['resolved'] = sum(1 for key in rows if key in self._results)
+
+        self._publish(known)
+        self._resolve_offline(keys)
+
+    def lookup(self, lat, lng):
+        """Return (location, pending) without blocking on the network.
+
+        Unknown coordinates are named offline straight away and, with an
+        online backend, queued ahead of the backlog; until it answers the
+        offline name (or a placeholder) is returned as pending.
+        """
+        key = self.key(lat, lng)
+        with self._lock:
+            location = self._results.get(key)
+            if location is not None:
+                return location, False
+            location = self._provisional.get(key)
+
+        if location is None:
+            location = self.geocoder.offline.reverse(*key) or fallback_location(lat, lng)
+            if not self.online:
+                with self._lock:
+                    self._results[key] = location
+                return location, False
+            with self._lock:
+                self._provisional[key] = location
+        self._enqueue(key)
+        return location, True
+
+    def _enqueue(self, key):
+        with self._lock:
+            if key in self._queued or key in self._results:
+                return
+            self._queued.add(key)
+        self._ensure_threads()
+        self._put(_PRIORITY_REQUEST, ('point', key))
+
+    def _run(self):
+        while True:
+            _, _, (kind, payload) = self._queue.get()
+            if kind == 'stop':
+                self._queue.task_done()
+                return
+            try:
+                self._resolve_online(payload)
+            except Exception as e:
+                print(f"Background geocoding error: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _resolve_offline(self, keys):
+        if not keys:
+            return
+        lats, lngs = zip(*keys)
+        start = time.perf_counter()
+        locations = self.geocoder.offline.reverse_batch(lats, lngs)
+        GEOCODER_SECONDS.observe(time.perf_counter() - start, 'offline')
+        found = sum(location is not None for location in locations)
+        GEOCODER_CALLS.inc('offline', 'found', amount=found)
+        GEOCODER_CALLS.inc('offline', 'not_found', amount=len(locations) - found)
+
+        with self._lock:
+            for key, location in zip(keys, locations):
+                location = location or fallback_location(*key)
+                if key in self._results:
+                    continue
+                if self.online:
+                    self._provisional[key] = location
+                else:
+                    self._results[key] = location
+                    self.counters['resolved'] += 1
+        self._publish(keys)
+
+        if self.online:
+            with self._lock:
+                backlog = [key for key in keys if key not in self._queued]
+                self._queued.update(backlog)
+            self._ensure_threads()
+            for key in backlog:
+                self._put(_PRIORITY_BACKLOG, ('point', key))
+
+    def _resolve_online(self, key):
+        with self._lock:
+            if key in self._results:
+                return
+        start = time.perf_counter()
+        try:
+            location = self.geocoder.online.reverse(*key)
+            GEOCODER_CALLS.inc('online', 'not_found' if location is None else 'found')
+        except Exception as e:
+            print(f"Geocoding error for {key[0]}, {key[1]}: {e}")
+            GEOCODER_CALLS.inc('online', 'error')
+            location = None
+        GEOCODER_SECONDS.observe(time.perf_counter() - start, 'online')
+        if location is None:
+            with self._lock:
+                self.counters['failed'] += 1
+                location = self._provisional.get(key)
+            location = location or self.geocoder.offline.reverse(*key) or fallback_location(*key)
+
+        with self._lock:
+            if key in self._results:
+                return
+            self._results[key] = location
+            self._provisional.pop(key, None)
+            if key in self._rows:
+                self.counters['resolved'] += 1
+        self._publish([key])
+
+    def _publish(self, keys):
+        # Held across the callback so two workers never write the same rows out of order
+        with self._lock:
+            rows, labels, pending = [], [], []
+            for key in keys:
+                location = self._results.get(key)
+                final = location is not None
+                location = location or self._provisional.get(key)
+                if location is None:
+                    continue
+                for row in self._rows.get(key, ()):
+                    rows.append(row)
+                    labels.append(location_label(location))
+                    pending.append(not final)
+            if self._on_update is not None and rows:
+                self._on_update(rows, labels, pending)
+
+    def stop(self):
+        """Let the worker threads exit once they finish the job in hand; queued jobs are dropped"""
+        with self._lock:
+            self._on_update = None
+        for _ in self._threads:
+            self._put(_PRIORITY_STOP, ('stop', None))
+        self._threads = []
+
+    def status(self):
+        with self._lock:
+            status = dict(self.counters)
+        status['queue_depth'] = self._queue.qsize()
+        status['workers'] = len(self._threads)
+        status['online'] = self.online
+        status['progress'] = round(status['resolved'] / status['total'], 4) if status['total'] else 1.0
+        return status
@@ -0,0 +1,248 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from country_lookup import CITIES_PATH, get_country_resolver
+from geocode_cache import CachedGeocoder, GeocodeCache, SharedRateLimiter
+from timeline_loader import DATA_DIR
+
+COUNTRY_NAMES_PATH = DATA_DIR / "geo" / "country_names.csv"
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Places further than this from the query point are not reported as its city
+MAX_CITY_DISTANCE_KM = 40.0
+
+# Neighbours considered when the nearest place lies across a border
+_NEIGHBOURS = 8
+
+
+def fallback_location(lat, lng):
+    """Placeholder returned when no backend can name a coordinate"""
+    return {
+        'name': f"Location at {lat:.4f}, {lng:.4f}",
+        'city': '',
+        'country': '',
+        'country_code': '',
+        'state': '',
+        'display_name': f"Unknown location at {lat:.4f}, {lng:.4f}"
+    }
+
+
+def unit_vectors(lats, lngs):
+    """Points on the unit sphere, where straight-line (chord) distance orders like great-circle distance"""
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lng = np.radians(np.asarray(lngs, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)))
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+class OfflineGeocoder:
+    """Reverse geocoder backed by a KD-tree over the bundled places table.
+
+    Places are indexed as 3D unit vectors, so Euclidean nearest neighbours
+    are great-circle nearest neighbours. The country comes from the polygon
+    resolver when the point is inside a known country; the reported city is
+    then the nearest place in that same country.
+    """
+
+    def __init__(self, cities_path=CITIES_PATH, country_names_path=COUNTRY_NAMES_PATH,
+                 max_city_distance_km=MAX_CITY_DISTANCE_KM, country_resolver=None):
+        places = pd.read_csv(cities_path, keep_default_na=False, dtype={'name': str, 'admin1': str, 'cc': str})
+        names = pd.read_csv(country_names_path, keep_default_na=False)
+
+        self.lats = places['lat'].to_numpy(dtype=np.float64)
+        self.lngs = places['lng'].to_numpy(dtype=np.float64)
+        self.names = places['name'].to_numpy(dtype=object)
+        self.states = places['admin1'].to_numpy(dtype=object)
+        self.country_codes = places['cc'].to_numpy(dtype=object)
+        self.country_names = dict(zip(names['cc'], names['name']))
+        self.max_city_distance_km = max_city_distance_km
+        self.country_resolver = country_resolver or get_country_resolver()
+        self.tree = cKDTree(unit_vectors(self.lats, self.lngs))
+
+    def nearest(self, lats, lngs, point_codes=None):
+        """Return (place index, distance in km) per point; index -1 when nothing is in range"""
+        lats = np.asarray(lats, dtype=np.float64).ravel()
+        lngs = np.asarray(lngs, dtype=np.float64).ravel()
+        if point_codes is None:
+            point_codes = self.country_resolver.resolve_codes(lats, lngs)
+        index = np.full(len(lats), -1, dtype=np.int64)
+        distance = np.full(len(lats), np.inf)
+
+        valid = np.flatnonzero(np.isfinite(lats) & np.isfinite(lngs))
+        if len(valid) == 0:
+            return index, distance
+
+        k = min(_NEIGHBOURS, len(self.lats))
+        chords, candidates = self.tree.query(unit_vectors(lats[valid], lngs[valid]), k=k)
+        chords = chords.reshape(len(valid), k)
+        candidates = candidates.reshape(len(valid), k)
+
+        # Prefer the nearest place inside the country the point actually falls in
+        codes = point_codes[valid]
+        same_country = self.country_codes[candidates] == codes[:, None]
+        has_match = same_country.any(axis=1) & pd.notna(codes)
+        pick = np.where(has_match, same_country.argmax(axis=1), 0)
+
+        rows = np.arange(len(valid))
+        km = chord_to_km(chords[rows, pick])
+        in_range = km <= self.max_city_distance_km
+        index[valid[in_range]] = candidates[rows, pick][in_range]
+        distance[valid] = km
+        return index, distance
+
+    def reverse_batch(self, lats, lngs):
+        """Reverse geocode many points in one vectorized lookup"""
+        lats = np.asarray(lats, dtype=np.float64).ravel()
+        lngs = np.asarray(lngs, dtype=np.float64).ravel()
+        point_codes = self.country_resolver.resolve_codes(lats, lngs)
+        index, _ = self.nearest(lats, lngs, point_codes)
+
+        results = []
+        for lat, lng, i, code in zip(lats.tolist(), lngs.tolist(), index.tolist(), point_codes.tolist()):
+            if not np.isfinite(lat) or not np.isfinite(lng):
+                results.append(None)
+                continue
+            if code is None and i >= 0:
+                code = self.country_codes[i]
+            if i < 0 and code is None:
+                results.append(fallback_location(lat, lng))
+                continue
+            city = self.names[i] if i >= 0 else ''
+            state = self.states[i] if i >= 0 else ''
+            country = self.country_names.get(code, code)
+            name = ', '.join(part for part in (city, state, country) if part)
+            results.append({
+                'name': name,
+                'city': city,
+                'country': country,
+                'country_code': code,
+                'state': state,
+                'display_name': name
+            })
+        return results
+
+    def reverse(self, lat, lng):
+        return self.reverse_batch([lat], [lng])[0]
+
+
+class NominatimGeocoder:
+    """Online reverse geocoding through OpenStreetMap Nominatim"""
+
+    # Nominatim's usage policy allows at most one request per second
+    min_interval = 1.0
+
+    def __init__(self, user_agent="van_journey_app", timeout=15):
+        from geopy.geocoders import Nominatim
+
+        self.client = Nominatim(user_agent=user_agent)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._last_request = 0.0
+
+    def reverse(self, lat, lng):
+        """Return a location dict, or None when the service has no answer"""
+        from geopy.exc import GeocoderServiceError, GeocoderTimedOut
+
+        with self._lock:
+            wait = self._last_request + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_request = time.monotonic()
+
+        try:
+            location = self.client.reverse(f"{lat}, {lng}", timeout=self.timeout, exactly_one=True)
+        except (GeocoderTimedOut, GeocoderServiceError) as e:
+            print(f"Geocoding timeout/service error for {lat}, {lng}: {e}")
+            return None
+        except Exception as e:
+            print(f"Geocoding error for {lat}, {lng}: {e}")
+            return None
+
+        if not location or not location.raw:
+            return None
+        address = location.raw.get('address', {})
+        country = address.get('country', '')
+        if not country and 'display_name' in location.raw:
+            # Try to extract country from display_name as fallback
+            display_parts = location.raw['display_name'].split(', ')
+            if len(display_parts) > 0:
+                country = display_parts[-1]
+
+        return {
+            'name': location.address,
+            'city': address.get('city', address.get('town', address.get('village', ''))),
+            'country': country,
+            'country_code': address.get('country_code', '').upper(),
+            'state': address.get('state', ''),
+            'display_name': location.address
+        }
+
+
+class ReverseGeocoder:
+    """Offline lookups, optionally enriched by an online backend"""
+
+    def __init__(self, offline=None, online=None):
+        self._offline = offline
+        self._offline_lock = threading.Lock()
+        self.online = online
+
+    @property
+    def offline(self):
+        # Built on first use so worker startup does not pay for the KD-tree
+        if self._offline is None:
+            with self._offline_lock:
+                if self._offline is None:
+                    self._offline = OfflineGeocoder()
+        return self._offline
+
+    def reverse(self, lat, lng):
+        if self.online is not None:
+            enriched = self.online.reverse(lat, lng)
+            if enriched is not None:
+                return enriched
+        return self.offline.reverse(lat, lng)
+
+    def prewarm(self, lats, lngs):
+        """Warm the online backend's cache for these coordinates; returns keys still unresolved"""
+        if self.online is None or not hasattr(self.online, 'prewarm'):
+            return []
+        return self.online.prewarm(lats, lngs)
+
+    def cache_stats(self):
+        if self.online is None or not hasattr(self.online, 'stats'):
+            return None
+        return self.online.stats()
+
+    def reverse_batch(self, lats, lngs):
+        results = self.offline.reverse_batch(lats, lngs)
+        if self.online is None:
+            return results
+        for i, (lat, lng) in enumerate(zip(lats, lngs)):
+            if results[i] is not None:
+                results[i] = self.online.reverse(lat, lng) or results[i]
+        return results
+
+
+def create_geocoder(backend=None):
+    """Build the geocoder selected by GEOCODER_BACKEND ('offline' or 'nominatim')"""
+    backend = (backend or os.environ.get('GEOCODER_BACKEND', 'offline')).lower()
+    online = None
+    if backend == 'nominatim':
+        # Online answers are shared across workers and restarts through the SQLite cache,
+        # and requests from every worker share Nominatim's one-per-second budget
+        online = CachedGeocoder(
+            NominatimGeocoder(),
+            GeocodeCache(namespace='nominatim'),
+            SharedRateLimiter('nominatim', NominatimGeocoder.min_interval)
+        )
+    return ReverseGeocoder(online=online)
@@ -0,0 +1,94 @@
+import os
+
+import numpy as np
+
+from geocoding import EARTH_RADIUS_KM
+
+# Fastest speed (km/h) an activity of each type plausibly averages start to finish; types
+# not listed here use DEFAULT_MAX_SPEED_KMH
+MAX_SPEED_KMH = {
+    'WALKING': 8,
+    'ON_FOOT': 8,
+    'RUNNING': 20,
+    'CYCLING': 35,
+    'IN_PASSENGER_VEHICLE': 140,
+    'IN_VEHICLE': 140,
+    'IN_BUS': 110,
+    'MOTORCYCLING': 150,
+    'IN_TRAM': 70,
+    'IN_SUBWAY': 80,
+    'IN_TRAIN': 320,
+    'IN_FERRY': 60,
+    'SAILING': 40,
+    'SKIING': 80,
+    'FLYING': 950
+}
+DEFAULT_MAX_SPEED_KMH = 950
+# Activities scoring below this are outliers: at the default of 0.5 they moved more than
+# twice as fast as their type allows, like a flight recorded as IN_PASSENGER_VEHICLE
+MIN_PLAUSIBILITY = float(os.environ.get('MIN_PLAUSIBILITY', 0.5))
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km between paired points; NaN where a coordinate is missing"""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def step_km(lats, lngs, offsets):
+    """Distance in km from each point to the next one of its path; 0 for the last point of a path"""
+    steps = np.zeros(len(lats))
+    if len(lats) > 1:
+        steps[:-1] = haversine_km(lats[:-1], lngs[:-1], lats[1:], lngs[1:])
+        # Paths are back to back, so the step from a path's last point leads into the next path
+        ends = offsets[1:] - 1
+        steps[ends[ends >= 0]] = 0
+    return steps
+
+
+def speed_kmh(km, hours):
+    """Implied speed; infinite for a distance covered in no time and 0 when nothing moved"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = km / hours
+    return np.where(km > 0, np.where(hours > 0, speed, np.inf), 0.0)
+
+
+class KinematicsStore:
+    """Geodesic distances, implied speeds and plausibility of every activity and path, built once per snapshot.
+
+    An activity's speed is the longer of its reported distance and the
+    great-circle distance between its endpoints, over its duration; its
+    plausibility is the type's MAX_SPEED_KMH over that speed, capped at 1.
+    Activities without coordinates or distance score 1. Paths get their
+    length along every point and the fastest hop between two points, which
+    shows GPS jumps.
+    """
+
+    def __init__(self, activities, paths):
+        self.straight_km = haversine_km(activities.start_lat, activities.start_lng,
+                                        activities.end_lat, activities.end_lng)
+        travelled_km = np.fmax(np.nan_to_num(activities.distance) / 1000, np.nan_to_num(self.straight_km))
+        self.speed_kmh = speed_kmh(travelled_km, activities.duration_hours)
+        limits = np.array([MAX_SPEED_KMH.get(name, DEFAULT_MAX_SPEED_KMH) for name in activities.types]
+                          + [DEFAULT_MAX_SPEED_KMH], dtype=np.float64)
+        with np.errstate(divide='ignore'):
+            self.plausibility = np.minimum(limits[activities.type_codes] / self.speed_kmh, 1.0)
+        self.outlier = self.plausibility < MIN_PLAUSIBILITY
+
+        steps = step_km(paths.lat, paths.lng, paths.offsets)
+        hops = np.zeros(len(steps), dtype=np.int64)
+        if len(steps) > 1:
+            hops[:-1] = np.diff(paths.time)
+        hop_speed = speed_kmh(steps, hops / 3.6e12)
+        starts = paths.offsets[:-1]
+        has_points = starts < paths.offsets[1:]
+        self.path_km = np.zeros(len(paths))
+        self.path_max_speed_kmh = np.zeros(len(paths))
+        if has_points.any():
+            # Empty paths would break reduceat, so only the others are reduced
+            self.path_km[has_points] = np.add.reduceat(steps, starts[has_points])
+            self.path_max_speed_kmh[has_points] = np.maximum.reduceat(hop_speed, starts[has_points])
+
+    def __len__(self):
+        return len(self.outlier)
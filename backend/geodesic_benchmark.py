@@ -0,0 +1,77 @@
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from geodesic import MAX_SPEED_KMH, KinematicsStore, haversine_km
+from timeline_store import ActivityStore, PathStore
+
+
+def _track(rng, size):
+    """A wandering track of ``size`` points over Europe, about a minute apart"""
+    lat = np.clip(48 + np.cumsum(rng.normal(0, 0.002, size)), 35, 70)
+    lng = np.clip(10 + np.cumsum(rng.normal(0, 0.003, size)), -10, 40)
+    times = np.datetime64('2025-06-01T00:00:00', 'ns') + np.cumsum(rng.integers(30, 90, size)).astype('timedelta64[s]')
+    return lat, lng, times
+
+
+def synthetic_stores(points, path_points=10, seed=0):
+    """(ActivityStore, PathStore) over one track: an activity between every two consecutive points, and paths
+    of ``path_points`` points each along the same track"""
+    rng = np.random.default_rng(seed)
+    lat, lng, times = _track(rng, points)
+    activities = ActivityStore(pd.DataFrame({
+        'startTime': times[:-1],
+        'endTime': times[1:],
+        'start_latitude': lat[:-1],
+        'start_longitude': lng[:-1],
+        'end_latitude': lat[1:],
+        'end_longitude': lng[1:],
+        'distanceMeters': haversine_km(lat[:-1], lng[:-1], lat[1:], lng[1:]) * 1000 * rng.uniform(1, 1.5, points - 1),
+        'topCandidate.type': rng.choice(list(MAX_SPEED_KMH), points - 1),
+        'start_country': None,
+        'end_country': None
+    }))
+    starts = np.arange(0, points, path_points)
+    paths = PathStore(
+        pd.DataFrame({'startTime': times[starts], 'endTime': times[np.minimum(starts + path_points, points) - 1],
+                      'points': np.diff(np.append(starts, points))}),
+        pd.DataFrame({'latitude': lat, 'longitude': lng, 'time': times})
+    )
+    return activities, paths
+
+
+def _best_ms(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(min(timings), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the vectorized geodesic computations on synthetic data")
+    parser.add_argument('--points', type=int, default=1_000_000, help="Track points (activities are one fewer)")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per measurement; the best one is reported")
+    args = parser.parse_args()
+
+    activities, paths = synthetic_stores(args.points)
+    lat, lng = paths.lat, paths.lng
+    results = {
+        'points': args.points,
+        'haversine_ms': _best_ms(lambda: haversine_km(lat[:-1], lng[:-1], lat[1:], lng[1:]), args.repeat),
+        'kinematics_ms': _best_ms(lambda: KinematicsStore(activities, paths), args.repeat)
+    }
+    kinematics = KinematicsStore(activities, paths)
+    results['outliers'] = int(kinematics.outlier.sum())
+    print(f"{args.points} points: haversine {results['haversine_ms']} ms, "
+          f"speeds and plausibility of {len(activities)} activities and {len(paths)} paths "
+          f"{results['kinematics_ms']} ms")
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
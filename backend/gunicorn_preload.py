@@ -0,0 +1,22 @@
+# Gunicorn settings for running many workers on one copy of the processed data:
+#
+#     gunicorn -c gunicorn_preload.py app:app
+#
+# The app is imported once in the master (preload_app), which loads or builds the
+# shared snapshot file; every forked worker maps the same file read-only. Background
+# threads (geocoding, dataset watching) only start in the workers, after the fork.
+import multiprocessing
+import os
+
+os.environ.setdefault('SHARED_ARRAYS', '1')
+os.environ.setdefault('TIMELINE_PRELOAD', '1')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5001')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+timeout = 120
+preload_app = True
+
+
+def post_fork(server, worker):
+    from app import DATASET_POLL_SECONDS, timeline_processor
+    timeline_processor.start_background(DATASET_POLL_SECONDS, after_fork=True)
@@ -0,0 +1,189 @@
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+from processed_cache import file_lock
+from timeline_loader import DATA_DIR, JOURNEY_START
+
+# One directory per journey: its export, an optional journey.json and its own caches
+JOURNEYS_DIR = Path(os.environ.get('JOURNEYS_DIR', DATA_DIR / "journeys"))
+EXPORT_NAME = 'timeline.json'
+SETTINGS_NAME = 'journey.json'
+
+# Journeys kept loaded at once, and the memory their data may take together
+MAX_LOADED_JOURNEYS = int(os.environ.get('MAX_LOADED_JOURNEYS', 16))
+JOURNEY_MEMORY_MB = float(os.environ.get('JOURNEY_MEMORY_MB', 1024))
+
+_JOURNEY_ID = re.compile(r'^[a-z0-9][a-z0-9_-]{0,63}$')
+
+
+def valid_journey_id(journey_id):
+    """Lower-case letters, digits, '-' and '_', so an ID is safe in URLs and as a directory name"""
+    return bool(_JOURNEY_ID.match(journey_id or ''))
+
+
+def journey_settings(journey_id, journeys_dir=None):
+    """Where a journey's data lives and when it started, or None if there is no such journey.
+
+    journey.json may set ``start_date`` (YYYY-MM-DD, segments before it are
+    dropped) and a display ``name``; both are optional.
+    """
+    if not valid_journey_id(journey_id):
+        return None
+    directory = Path(journeys_dir or JOURNEYS_DIR) / journey_id
+    if not directory.is_dir():
+        return None
+    settings = {}
+    settings_path = directory / SETTINGS_NAME
+    if settings_path.exists():
+        with open(settings_path, 'r') as f:
+            settings = json.load(f)
+    start_date = settings.get('start_date') or JOURNEY_START
+    # Raises ValueError for anything but a YYYY-MM-DD date
+    datetime.strptime(start_date, '%Y-%m-%d')
+    return {
+        'id': journey_id,
+        'name': settings.get('name') or journey_id,
+        'start_date': start_date,
+        'json_path': directory / EXPORT_NAME,
+        'cache_dir': directory / 'cache',
+        'additions_dir': directory / 'additions'
+    }
+
+
+class JourneyRegistry:
+    """Timeline processors for many journeys, loaded on first use and evicted least recently used first.
+
+    ``factory(settings)`` builds a journey's processor, which reads its
+    processed cache when the export has not changed since it was written.
+    Past ``max_loaded`` journeys, or once the loaded journeys hold more than
+    ``max_bytes`` of data, the least recently requested ones are closed and
+    dropped; their next request loads them again from the cache. A journey
+    loading does not hold up requests for the others.
+    """
+
+    def __init__(self, factory, journeys_dir=None, max_loaded=None, max_bytes=None, reserved=()):
+        self.factory = factory
+        self.journeys_dir = Path(journeys_dir or JOURNEYS_DIR)
+        self.max_loaded = max(int(max_loaded if max_loaded is not None else MAX_LOADED_JOURNEYS), 1)
+        self.max_bytes = max_bytes if max_bytes is not None else JOURNEY_MEMORY_MB * 1024 * 1024
+        # IDs that would clash with other routes
+        self.reserved = frozenset(reserved)
+        self._loaded = OrderedDict()  # journey id -> processor, least recently used first
+        self._loading = {}            # journey id -> lock held while it loads
+        self._lock = threading.Lock()
+        self.counters = {'loads': 0, 'evictions': 0}
+
+    def settings(self, journey_id):
+        if journey_id in self.reserved:
+            return None
+        return journey_settings(journey_id, self.journeys_dir)
+
+    def create(self, journey_id, name=None, start_date=None):
+        """Settings of a journey, creating its directory and journey.json if it does not exist yet.
+
+        Raises ValueError for an ID that cannot be used, or for a start date
+        that differs from the one an existing journey has.
+        """
+        if journey_id in self.reserved or not valid_journey_id(journey_id):
+            raise ValueError(f'{journey_id} cannot be used as a journey ID')
+        if start_date is not None:
+            datetime.strptime(start_date, '%Y-%m-%d')
+        directory = self.journeys_dir / journey_id
+        with file_lock(directory.with_suffix('.lock')):
+            settings = self.settings(journey_id)
+            if settings is None:
+                directory.mkdir(parents=True, exist_ok=True)
+                with open(directory / SETTINGS_NAME, 'w') as f:
+                    json.dump({'name': name or journey_id, 'start_date': start_date or JOURNEY_START}, f, indent=2)
+                return self.settings(journey_id)
+        # Loaded data and the processed caches were all built for the start date it has
+        if start_date is not None and start_date != settings['start_date']:
+            raise ValueError(f"Journey {journey_id} starts on {settings['start_date']}; edit its journey.json to change it")
+        return settings
+
+    def peek(self, journey_id):
+        """The processor of a journey if it is loaded, without loading it or counting it as used"""
+        with self._lock:
+            return self._loaded.get(journey_id)
+
+    def get(self, journey_id):
+        """The processor of a journey, loading it if needed; None if there is no such journey"""
+        with self._lock:
+            processor = self._loaded.get(journey_id)
+            if processor is not None:
+                self._loaded.move_to_end(journey_id)
+                return processor
+            load_lock = self._loading.setdefault(journey_id, threading.Lock())
+
+        with load_lock:
+            # Another request may have loaded it while this one waited
+            with self._lock:
+                processor = self._loaded.get(journey_id)
+                if processor is not None:
+                    self._loaded.move_to_end(journey_id)
+                    return processor
+            processor, evicted = None, []
+            try:
+                settings = self.settings(journey_id)
+                if settings is not None:
+                    processor = self.factory(settings)
+            finally:
+                # Published together with dropping the lock, so no request starts a second load
+                with self._lock:
+                    self._loading.pop(journey_id, None)
+                    if processor is not None:
+                        self._loaded[journey_id] = processor
+                        self.counters['loads'] += 1
+                        evicted = self._evict()
+        for evicted_id, stale in evicted:
+            print(f"Evicted journey {evicted_id}")
+            stale.close()
+        return processor
+
+    def _evict(self):
+        """Drop least recently used journeys until the limits hold; the newest one always stays"""
+        evicted = []
+        while len(self._loaded) > 1:
+            if len(self._loaded) <= self.max_loaded and self._bytes() <= self.max_bytes:
+                break
+            evicted.append(self._loaded.popitem(last=False))
+            self.counters['evictions'] += 1
+        return evicted
+
+    def _bytes(self):
+        return sum(processor.snapshot.nbytes() for processor in self._loaded.values())
+
+    def loaded(self):
+        with self._lock:
+            return list(self._loaded)
+
+    def journeys(self):
+        """Settings of every journey on disk, by ID, with whether it is loaded"""
+        if not self.journeys_dir.is_dir():
+            return []
+        loaded = set(self.loaded())
+        journeys = []
+        for entry in sorted(os.scandir(self.journeys_dir), key=lambda entry: entry.name):
+            try:
+                settings = self.settings(entry.name) if entry.is_dir() else None
+            except (OSError, ValueError) as e:
+                print(f"Skipping journey {entry.name}: {e}")
+                continue
+            if settings is not None:
+                journeys.append({'id': settings['id'], 'name': settings['name'],
+                                 'start_date': settings['start_date'], 'loaded': settings['id'] in loaded})
+        return journeys
+
+    def status(self):
+        with self._lock:
+            status = dict(self.counters)
+            status['loaded'] = len(self._loaded)
+            status['loaded_bytes'] = self._bytes()
+        status['max_loaded'] = self.max_loaded
+        status['max_bytes'] = int(self.max_bytes)
+        return status
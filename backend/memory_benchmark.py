@@ -0,0 +1,91 @@
+import argparse
+import json
+import multiprocessing
+import os
+
+import numpy as np
+
+from processed_cache import DEFAULT_TIMELINE_PATH
+
+# Fields of /proc/<pid>/smaps_rollup, in kB: Pss splits shared pages between the processes
+# mapping them, Private_* is what the process holds alone
+_FIELDS = ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty')
+
+
+def memory_kb(pid='self'):
+    """Rss, Pss and private memory of a process in kB (Linux only)"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, rest = line.partition(':')
+            if name in _FIELDS:
+                values[name] = int(rest.split()[0])
+    values['Private'] = values.pop('Private_Clean', 0) + values.pop('Private_Dirty', 0)
+    return values
+
+
+def _worker(json_path, mode, ready, done):
+    # Imported here so the parent never loads the data itself
+    from app import TimelineProcessor
+    if mode != 'baseline':
+        processor = TimelineProcessor(json_path, shared=mode == 'shared', background=False)
+        # Read every page of every array, as serving requests eventually would, without
+        # counting the short-lived response objects requests build
+        snapshot = processor.snapshot
+        for store in (snapshot.activities, snapshot.visits, snapshot.route_lod, snapshot.paths, snapshot.kinematics,
+                      snapshot.rollup, snapshot.activity_grid, snapshot.visit_grid, snapshot.places):
+            for value in vars(store).values():
+                arrays = value.values() if isinstance(value, dict) else [value]
+                for array in arrays:
+                    if isinstance(array, np.ndarray) and array.dtype != object:
+                        array.view(np.uint8).sum()
+    ready.set()
+    done.wait()
+
+
+def measure(json_path, mode, workers):
+    """Start ``workers`` processes in a mode and return their memory once all are loaded.
+
+    'baseline' only imports the app, 'in-memory' loads the dataset into each
+    worker and 'shared' maps the shared snapshot file.
+    """
+    context = multiprocessing.get_context('spawn')
+    done = context.Event()
+    readies = [context.Event() for _ in range(workers)]
+    processes = [context.Process(target=_worker, args=(json_path, mode, ready, done)) for ready in readies]
+    for process in processes:
+        process.start()
+    for ready in readies:
+        ready.wait()
+    usage = [memory_kb(process.pid) for process in processes]
+    done.set()
+    for process in processes:
+        process.join()
+    return usage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-worker memory with and without shared arrays")
+    parser.add_argument('json_path', nargs='?', default=str(DEFAULT_TIMELINE_PATH),
+                        help="Google Timeline export to load")
+    parser.add_argument('--workers', type=int, default=4, help="Worker processes to start")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.json_path):
+        print(f"No timeline export at {args.json_path}, nothing to measure")
+        return
+
+    results = {}
+    for label in ('baseline', 'in-memory', 'shared'):
+        usage = measure(args.json_path, label, args.workers)
+        results[label] = {
+            field: round(sum(u[field] for u in usage) / len(usage) / 1024, 1)
+            for field in ('Rss', 'Pss', 'Private')
+        }
+        print(f"{label:>9}: {args.workers} workers, per worker "
+              + ', '.join(f"{field} {value} MB" for field, value in results[label].items()))
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+
+# Seconds; spans a cached response (well under a millisecond) to a cold load of a large export
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Bytes, from a small JSON object to an unsimplified map
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(10))
+
+# Seconds between stack samples of a profiled request
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL_MS', 2)) / 1000
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count per label combination"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.label_names = name, help_text, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield self.name, _labels(self.label_names, labels), value
+
+
+class Histogram:
+    """Observations counted into cumulative buckets per label combination, with their sum"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help_text, tuple(labels)
+        self.bounds = tuple(buckets) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.bounds), 0.0]
+            for i, bound in enumerate(self.bounds):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds, counts):
+                cumulative += count
+                yield f'{self.name}_bucket', _labels(self.label_names, labels, [('le', _number(bound))]), cumulative
+            yield f'{self.name}_sum', _labels(self.label_names, labels), total
+            yield f'{self.name}_count', _labels(self.label_names, labels), cumulative
+
+
+class Gauge:
+    """Values read when metrics are scraped, from a callback returning {label values: value}.
+
+    With ``kind='counter'`` it reports totals another component already
+    keeps (the caches' hit counts, say) without counting them twice.
+    """
+
+    def __init__(self, name, help_text, labels, read, kind='gauge'):
+        self.name, self.help, self.label_names = name, help_text, tuple(labels)
+        self.read = read
+        self.kind = kind
+
+    def samples(self):
+        try:
+            values = self.read() or {}
+        except Exception as e:
+            print(f"Could not read metric {self.name}: {e}")
+            return
+        for labels, value in sorted(values.items(), key=lambda item: str(item[0])):
+            if value is not None:
+                yield self.name, _labels(self.label_names, labels), value
+
+
+class Registry:
+    """Metrics of this process, rendered in the Prometheus text format.
+
+    Every gunicorn worker keeps its own registry, so a scrape sees the
+    worker that answered it; the ``pid`` in ``vangon_process_info`` tells
+    them apart.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name}{labels} {_number(value)}' for name, labels, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text, labels=()):
+    return REGISTRY.register(Counter(name, help_text, labels))
+
+
+def histogram(name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, help_text, labels, buckets))
+
+
+def gauge(name, help_text, labels, read, kind='gauge'):
+    return REGISTRY.register(Gauge(name, help_text, labels, read, kind))
+
+
+STAGE_SECONDS = histogram('vangon_stage_duration_seconds',
+                          'Time spent in one stage of loading data or building a response', ('stage',))
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as a stage, whether or not it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, name)
+
+
+_START_TIME = time.time()
+gauge('vangon_process_info', 'The process reporting these metrics (one per gunicorn worker)', ('pid',),
+      lambda: {(os.getpid(),): 1})
+gauge('vangon_process_start_time_seconds', 'Unix time the process imported its metrics', (),
+      lambda: {(): _START_TIME})
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread every ``interval`` seconds from a helper thread.
+
+    Meant for profiling a single request: the result is in the folded
+    format (``outer;inner count`` per line) read by flamegraph.pl and
+    speedscope. Sampling only reads the target's current frame, so the
+    profiled code runs unmodified.
+    """
+
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks = _Tally()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name='request-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
@@ -0,0 +1,56 @@
+import numpy as np
+
+# Coordinates are rounded to 1e-5 degrees (about a metre), as in Google's encoded polylines
+PRECISION = 5
+# Enough 5-bit chunks for any zigzagged delta of two coordinates
+_MAX_CHUNKS = 7
+_CHUNK_SHIFTS = 5 * np.arange(_MAX_CHUNKS)
+
+
+def _fixed_point(lat, lng):
+    return np.round(np.column_stack((lat, lng)) * 10 ** PRECISION).astype(np.int64)
+
+
+def encode_polylines(lat, lng, offsets):
+    """Google encoded-polyline strings for the point ranges ``offsets[i]:offsets[i + 1]``.
+
+    Every range is encoded in one vectorized pass: deltas restart at the
+    first point of each range, each zigzagged delta is split into 5-bit
+    chunks, and the resulting characters are cut back into one string per
+    range by their offsets.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    points = _fixed_point(lat, lng)
+    first = offsets[:-1][offsets[:-1] < offsets[1:]]
+    deltas = np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    deltas[first] = points[first]
+
+    values = deltas.ravel()
+    values = np.where(values < 0, ~(values << 1), values << 1)
+    chunks = (values[:, None] >> _CHUNK_SHIFTS) & 0x1f
+    needed = np.maximum((values[:, None] >> _CHUNK_SHIFTS > 0).sum(axis=1), 1)
+    # Every chunk but a value's last carries the continuation bit
+    used = np.arange(_MAX_CHUNKS) < needed[:, None]
+    more = np.arange(_MAX_CHUNKS) < needed[:, None] - 1
+    text = (chunks + (more << 5) + 63)[used].astype(np.uint8).tobytes().decode('ascii')
+
+    char_offsets = np.concatenate(([0], np.cumsum(needed.reshape(-1, 2).sum(axis=1))))[offsets]
+    return [text[lo:hi] for lo, hi in zip(char_offsets[:-1].tolist(), char_offsets[1:].tolist())]
+
+
+def pack_paths(lat, lng, offsets):
+    """Pack point ranges into a little-endian int32 buffer for typed-array decoding.
+
+    Layout: path count, point count, then path count + 1 point offsets
+    (starting at 0), then one (lat, lng) pair per point in 1e-5 degrees,
+    each pair a delta from the previous point (the first from zero).
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    points = _fixed_point(lat, lng)
+    deltas = np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    header = np.array([len(offsets) - 1, len(points)], dtype='<i4')
+    return b''.join((
+        header.tobytes(),
+        (offsets - offsets[0]).astype('<i4').tobytes(),
+        deltas.astype('<i4').tobytes()
+    ))
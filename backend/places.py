@@ -0,0 +1,128 @@
+import os
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from geocoding import chord_to_km, unit_vectors
+from spatial_index import km_to_chord
+from timeline_store import _NS_PER_SECOND
+
+# Stops closer than this (in meters) to another stop of a place belong to that place
+PLACE_RADIUS_M = float(os.environ.get('PLACE_RADIUS_M', 100))
+# Places whose stops reach further than this many radii from their centroid are chains of
+# nearby stops (along a road, a long beach) rather than one place, and are split into grid cells
+_CHAIN_RADII = 5
+
+_METERS_PER_DEGREE = 111_320.0
+
+
+def _grid_cells(lats, lngs, size_m):
+    """Cell index per point on a grid of roughly size_m squares, and the number of cells"""
+    row = np.floor(lats * _METERS_PER_DEGREE / size_m)
+    # Columns narrow towards the poles so cells stay about square
+    scale = np.cos(np.radians((row + 0.5) * size_m / _METERS_PER_DEGREE))
+    col = np.floor(lngs * _METERS_PER_DEGREE * scale / size_m)
+    _, cells = np.unique(np.column_stack((row, col)), axis=0, return_inverse=True)
+    cells = cells.ravel()
+    return cells, int(cells.max()) + 1 if len(cells) else 0
+
+
+def cluster_points(lats, lngs, radius_m=PLACE_RADIUS_M):
+    """Place label per point, numbered in order of first appearance.
+
+    Points are first snapped to cells half the radius wide, so a spot
+    visited a thousand times is one cell; cells whose centroids lie within
+    the radius are linked by a KD-tree pair query and every connected group
+    is one place. Groups reaching further than a few radii from their
+    centroid fall back to one place per cell of the radius' size.
+    """
+    if not len(lats):
+        return np.empty(0, dtype=np.int32)
+    cells, count = _grid_cells(lats, lngs, radius_m / 2)
+    members = np.maximum(np.bincount(cells, minlength=count), 1)
+    cell_points = unit_vectors(np.bincount(cells, weights=lats) / members, np.bincount(cells, weights=lngs) / members)
+    pairs = cKDTree(cell_points).query_pairs(km_to_chord(radius_m / 1000), output_type='ndarray')
+    graph = coo_matrix((np.ones(len(pairs), dtype=np.int8), (pairs[:, 0], pairs[:, 1])), shape=(count, count))
+    _, cell_labels = connected_components(graph, directed=False)
+    labels = cell_labels[cells]
+
+    # Split chains: distance of every point from its group's centroid
+    points = unit_vectors(lats, lngs)
+    sizes = np.bincount(labels)
+    centroids = np.column_stack([np.bincount(labels, weights=points[:, axis]) / sizes for axis in range(3)])
+    spread = chord_to_km(np.linalg.norm(points - centroids[labels], axis=1)) * 1000
+    reach = np.zeros(len(sizes))
+    np.maximum.at(reach, labels, spread)
+    chained = reach[labels] > _CHAIN_RADII * radius_m
+    if chained.any():
+        split, _ = _grid_cells(lats[chained], lngs[chained], radius_m)
+        labels[chained] = len(sizes) + split
+
+    # Number places by first appearance
+    _, first, labels = np.unique(labels, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.int32)
+    rank[np.argsort(first, kind='stable')] = np.arange(len(first), dtype=np.int32)
+    return rank[labels.ravel()]
+
+
+class PlaceStore:
+    """Visits clustered into places, and consecutive visits to one place merged into stays.
+
+    Visits within ``radius_m`` of each other are linked and every connected
+    group is one place (DBSCAN with a minimum of one point, see
+    ``cluster_points``). Places are numbered in order of their first visit;
+    ids are only meaningful within one dataset version. Visits without
+    coordinates belong to no place (-1).
+
+    Names are resolved once per place, at its centroid, by the geocoding pool.
+    """
+
+    def __init__(self, visits, radius_m=PLACE_RADIUS_M):
+        rows = np.flatnonzero(visits.has_coordinates)
+        self.visit_place = np.full(len(visits), -1, dtype=np.int32)
+        # Visits are sorted by start time, so places come out in order of their first visit
+        self.visit_place[rows] = cluster_points(visits.lat[rows], visits.lng[rows], radius_m)
+        count = int(self.visit_place.max()) + 1 if len(rows) else 0
+        self.size = count
+
+        place = self.visit_place[rows].astype(np.int64)
+        starts, ends = visits.start[rows], visits.end[rows]
+        self.visit_count = np.bincount(place, minlength=count)
+        visit_count = np.maximum(self.visit_count, 1)
+        self.lat = np.bincount(place, weights=visits.lat[rows], minlength=count) / visit_count
+        self.lng = np.bincount(place, weights=visits.lng[rows], minlength=count) / visit_count
+        self.dwell_hours = np.bincount(place, weights=visits.duration_hours[rows], minlength=count)
+        self.first_start = np.full(count, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(self.first_start, place, starts)
+        self.last_end = np.full(count, np.iinfo(np.int64).min, dtype=np.int64)
+        np.maximum.at(self.last_end, place, ends)
+
+        # A stay is a run of consecutive located visits at the same place
+        bounds = np.flatnonzero(np.concatenate(([True], place[1:] != place[:-1]))) if len(place) else place[:0]
+        self.stay_place = place[bounds].astype(np.int32)
+        self.stay_start = starts[bounds]
+        self.stay_end = np.maximum.reduceat(ends, bounds) if len(bounds) else ends[:0]
+        self.stay_visits = np.diff(np.append(bounds, len(place)))
+        self.stay_count = np.bincount(self.stay_place, minlength=count)
+
+        # Filled in by the geocoding pool; pending until the final name is known
+        self.reset_locations()
+
+    def __len__(self):
+        return self.size
+
+    def reset_locations(self):
+        """Start with every place unnamed; used when a store is restored from a shared file"""
+        self.location_name = np.full(self.size, None, dtype=object)
+        self.location_pending = np.ones(self.size, dtype=bool)
+
+    def stay_hours(self, stays):
+        """Length of stays from the first arrival to the last departure"""
+        return (self.stay_end[stays] - self.stay_start[stays]) / _NS_PER_SECOND / 3600
+
+    def latest_stays(self, limit):
+        """Positions of the ``limit`` most recent stays, newest first"""
+        size = len(self.stay_place)
+        return np.arange(size - 1, max(size - max(limit, 0), 0) - 1, -1, dtype=np.int64)
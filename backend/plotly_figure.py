@@ -0,0 +1,82 @@
+import json
+import threading
+
+import numpy as np
+import orjson
+
+from timeline_loader import DATA_DIR
+from timeline_store import date_strings
+
+# plotly.py's default "plotly" template, so figures render as they did when built with go.Figure
+PLOTLY_TEMPLATE_PATH = DATA_DIR / "plotly_template.json"
+
+_template = None
+_template_lock = threading.Lock()
+
+
+def plotly_template():
+    global _template
+    if _template is None:
+        with _template_lock:
+            if _template is None:
+                with open(PLOTLY_TEMPLATE_PATH, 'r', encoding='utf-8') as f:
+                    _template = json.load(f)
+    return _template
+
+
+def _group_by_code(codes):
+    """Row indices for each non-missing code, groups ordered by first appearance"""
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+    groups = [g for g in np.split(order, bounds) if len(g) and codes[g[0]] >= 0]
+    # With a stable sort each group's first index is where that code first appears
+    groups.sort(key=lambda g: g[0])
+    return groups
+
+
+def _vertices(first, second, mask):
+    """Interleave start and end points per activity, with a NaN (a Plotly line break) where a run ends"""
+    values = np.column_stack((first, second, np.full(len(first), np.nan)))
+    return np.ascontiguousarray(values[mask])
+
+
+def mapbox_line_traces(activities, positions, vertex_mask, color_map, default_color='#636363'):
+    """Scattermapbox line traces, one per activity type, straight from the store's arrays.
+
+    ``vertex_mask`` comes from RouteLOD.vertex_mask and says, per activity,
+    whether its start point, its end point and a line break are drawn.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    traces = []
+    for group in _group_by_code(activities.type_codes[positions]):
+        rows = positions[group]
+        mask = vertex_mask[group]
+        activity_type = activities.types[activities.type_codes[rows[0]]]
+
+        # Hover text is only formatted for activities that still have a vertex on the map
+        shown = mask[:, 0] | mask[:, 1]
+        hover = np.char.add(
+            np.char.add(f"{activity_type}<br>Distance: ", np.char.mod('%.0f', activities.distance[rows[shown]])),
+            np.char.add('m<br>Date: ', np.asarray(date_strings(activities.start[rows[shown]]), dtype=str))
+        )
+        text = np.full((len(rows), 3), None, dtype=object)
+        text[shown, 0] = hover
+        text[shown, 1] = hover
+
+        traces.append({
+            'hovertemplate': "%{text}<extra></extra>",
+            'lat': _vertices(activities.start_lat[rows], activities.end_lat[rows], mask),
+            'line': {'color': color_map.get(activity_type, default_color), 'width': 3},
+            'lon': _vertices(activities.start_lng[rows], activities.end_lng[rows], mask),
+            'mode': 'lines',
+            'name': activity_type.replace('_', ' '),
+            'text': text[mask].tolist(),
+            'type': 'scattermapbox'
+        })
+    return traces
+
+
+def figure_json(figure):
+    """Serialize a figure dict; NumPy arrays are written directly and NaN becomes null"""
+    return orjson.dumps(figure, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_SORT_KEYS) + b'\n'
@@ -0,0 +1,305 @@
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; rebuilds are then not coordinated
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from country_lookup import get_country_resolver
+from metrics import stage
+from timeline_loader import DATA_DIR, JOURNEY_START, load_timeline
+
+# Bump whenever the processed columns or their encoding change
+CACHE_FORMAT_VERSION = 5
+CACHE_DIR = DATA_DIR / "cache"
+DEFAULT_TIMELINE_PATH = DATA_DIR / "google_timeline.json"
+
+_META_KEY = '__meta__'
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Hash a file in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_fingerprint(json_path, with_hash=True):
+    """Identify a timeline export by mtime, size and (optionally) content hash"""
+    stat = os.stat(json_path)
+    return {
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': file_sha256(json_path) if with_hash else None
+    }
+
+
+def cache_path_for(json_path, cache_dir=CACHE_DIR):
+    return Path(cache_dir) / f"{Path(json_path).stem}.processed.npz"
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on ``path`` across processes; without a writable lock file, run unlocked"""
+    path = Path(path)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(path, 'a')
+    except OSError as e:
+        print(f"Could not open lock file {path}: {e}")
+        yield
+        return
+    with f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _encode_column(series):
+    """Turn a column into typed arrays plus the tag needed to restore it"""
+    if isinstance(series.dtype, pd.DatetimeTZDtype) or pd.api.types.is_datetime64_dtype(series.dtype):
+        return 'datetime', [series.to_numpy(dtype='datetime64[ns]').view(np.int64)]
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        return 'numeric', [series.to_numpy()]
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return 'bool', [series.to_numpy(dtype=bool)]
+    # Strings are stored dictionary-encoded; code -1 marks a missing value
+    codes, categories = pd.factorize(series, use_na_sentinel=True)
+    return 'category', [codes.astype(np.int32), np.asarray(categories, dtype=str)]
+
+
+def _decode_column(kind, arrays):
+    if kind == 'datetime':
+        return pd.to_datetime(arrays[0], unit='ns', utc=True)
+    if kind in ('numeric', 'bool'):
+        return arrays[0]
+    codes, categories = arrays
+    values = np.append(categories.astype(object), None)
+    return values[codes]
+
+
+def save_processed(path, frames, fingerprint, start_date):
+    """Write processed DataFrames to an .npz of typed columns, atomically"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    arrays = {}
+    layout = {}
+    for frame_name, df in frames.items():
+        columns = []
+        for column in df.columns:
+            kind, parts = _encode_column(df[column])
+            keys = []
+            for part in parts:
+                key = f"a{len(arrays)}"
+                arrays[key] = part
+                keys.append(key)
+            columns.append({'name': column, 'kind': kind, 'keys': keys})
+        layout[frame_name] = columns
+
+    meta = {
+        'format_version': CACHE_FORMAT_VERSION,
+        'start_date': start_date,
+        'source': fingerprint,
+        'frames': layout
+    }
+    arrays[_META_KEY] = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+
+    # Write next to the target and rename so concurrent workers never read a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _read_meta(npz):
+    return json.loads(npz[_META_KEY].tobytes().decode('utf-8'))
+
+
+def _is_fresh(meta, json_path, start_date):
+    """Check a cache's recorded source against the export on disk.
+
+    Returns False when stale, True when the mtime and size match, and
+    'rehashed' when only the content hash does, so the new mtime can be recorded.
+    """
+    if meta.get('format_version') != CACHE_FORMAT_VERSION or meta.get('start_date') != start_date:
+        return False
+    recorded = meta.get('source', {})
+    current = source_fingerprint(json_path, with_hash=False)
+    if recorded.get('mtime_ns') == current['mtime_ns'] and recorded.get('size') == current['size']:
+        return True
+    # A fresh checkout touches mtime without changing content, so fall back to the hash
+    if recorded.get('size') != current['size']:
+        return False
+    return 'rehashed' if recorded.get('sha256') == file_sha256(json_path) else False
+
+
+def _read_frames(npz, meta):
+    frames = {}
+    for frame_name, columns in meta['frames'].items():
+        frames[frame_name] = pd.DataFrame(
+            {c['name']: _decode_column(c['kind'], [npz[k] for k in c['keys']]) for c in columns},
+            columns=[c['name'] for c in columns]
+        )
+    return frames
+
+
+def _load_processed(path, json_path, start_date):
+    """(frames, fresh) as load_processed, where fresh is the result of _is_fresh"""
+    path = Path(path)
+    if not path.exists():
+        return None, False
+    with np.load(path, allow_pickle=False) as npz:
+        meta = _read_meta(npz)
+        fresh = _is_fresh(meta, json_path, start_date)
+        if not fresh:
+            return None, False
+        return _read_frames(npz, meta), fresh
+
+
+def load_processed(path, json_path, start_date):
+    """Load cached frames if they match the export on disk, otherwise return None"""
+    return _load_processed(path, json_path, start_date)[0]
+
+
+def _record_mtime(cache_path, json_path, start_date, frames):
+    """Rewrite a cache whose export only matched by hash with the export's current mtime.
+
+    Otherwise every worker would hash the whole export again on every start
+    after a checkout or touch.
+    """
+    try:
+        with file_lock(cache_path.with_suffix('.lock')):
+            with np.load(cache_path, allow_pickle=False) as npz:
+                recorded = _read_meta(npz).get('source', {})
+            current = source_fingerprint(json_path, with_hash=False)
+            # Another worker may have recorded it, or the export changed since
+            if recorded.get('mtime_ns') == current['mtime_ns'] or recorded.get('size') != current['size']:
+                return
+            save_processed(cache_path, frames, dict(recorded, mtime_ns=current['mtime_ns']), start_date)
+    except (OSError, ValueError) as e:
+        print(f"Could not update processed cache {cache_path}: {e}")
+
+
+def read_processed(path):
+    """Load frames saved by save_processed, with their recorded metadata, without a freshness check"""
+    with np.load(path, allow_pickle=False) as npz:
+        meta = _read_meta(npz)
+        if meta.get('format_version') != CACHE_FORMAT_VERSION:
+            raise ValueError(f"{path} has cache format {meta.get('format_version')}, expected {CACHE_FORMAT_VERSION}")
+        return _read_frames(npz, meta), meta
+
+
+def load_frames(json_path, start_date=JOURNEY_START, progress=None):
+    """Stream an export into the processed frames, before countries are resolved"""
+    with stage('load.parse'):
+        activity_df, visit_df, path_df, path_point_df = load_timeline(json_path, start_date, progress)
+    return {'activities': activity_df, 'visits': visit_df, 'paths': path_df, 'path_points': path_point_df}
+
+
+def resolve_countries(frames):
+    """Add the country columns to processed frames"""
+    # Countries are resolved once per coordinate column in a single batched call
+    with stage('load.countries'):
+        resolver = get_country_resolver()
+        activity_df, visit_df = frames['activities'], frames['visits']
+        activity_df['start_country'] = resolver.resolve(activity_df['start_latitude'], activity_df['start_longitude'])
+        activity_df['end_country'] = resolver.resolve(activity_df['end_latitude'], activity_df['end_longitude'])
+        visit_df['country'] = resolver.resolve(visit_df['latitude'], visit_df['longitude'])
+    return frames
+
+
+def build_processed(json_path, start_date=JOURNEY_START):
+    """Run the full processing pipeline for an export"""
+    return resolve_countries(load_frames(json_path, start_date))
+
+
+def _load_fresh(cache_path, json_path, start_date):
+    try:
+        with stage('load.cache_read'):
+            return _load_processed(cache_path, json_path, start_date)
+    except Exception as e:
+        print(f"Ignoring unreadable processed cache {cache_path}: {e}")
+        return None, False
+
+
+def load_or_build(json_path, start_date=JOURNEY_START, cache_dir=CACHE_DIR):
+    """Return processed frames from the on-disk cache, rebuilding it when the export changed.
+
+    Workers that find the cache stale take a lock file first, so one of them
+    reprocesses the export and the others read the cache it writes.
+    """
+    cache_path = cache_path_for(json_path, cache_dir)
+    frames, fresh = _load_fresh(cache_path, json_path, start_date)
+    if frames is None:
+        with file_lock(cache_path.with_suffix('.lock')):
+            # Another worker may have rebuilt it while this one waited
+            frames, fresh = _load_fresh(cache_path, json_path, start_date)
+            if frames is None:
+                fingerprint = source_fingerprint(json_path)
+                frames = build_processed(json_path, start_date)
+                try:
+                    with stage('load.cache_write'):
+                        save_processed(cache_path, frames, fingerprint, start_date)
+                except OSError as e:
+                    print(f"Could not write processed cache {cache_path}: {e}")
+                return frames
+    # Outside the lock above, which _record_mtime takes itself
+    if fresh == 'rehashed':
+        _record_mtime(cache_path, json_path, start_date, frames)
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prebuild the processed timeline cache")
+    # The same export and start date the app serves, so a deploy prebuilds the cache it reads
+    parser.add_argument('json_path', nargs='?', default=os.environ.get('TIMELINE_JSON_PATH', str(DEFAULT_TIMELINE_PATH)),
+                        help="Google Timeline export to process (default: $TIMELINE_JSON_PATH)")
+    parser.add_argument('--cache-dir', default=str(CACHE_DIR), help="Directory for the processed cache")
+    parser.add_argument('--start-date', default=JOURNEY_START,
+                        help="Drop segments before this date (default: $JOURNEY_START)")
+    parser.add_argument('--force', action='store_true', help="Rebuild even if the cache is fresh")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.json_path):
+        print(f"No timeline export at {args.json_path}, nothing to cache")
+        return
+
+    cache_path = cache_path_for(args.json_path, args.cache_dir)
+    started = time.perf_counter()
+    if args.force:
+        fingerprint = source_fingerprint(args.json_path)
+        frames = build_processed(args.json_path, args.start_date)
+        save_processed(cache_path, frames, fingerprint, args.start_date)
+    else:
+        frames = load_or_build(args.json_path, args.start_date, args.cache_dir)
+    elapsed = time.perf_counter() - started
+
+    counts = ', '.join(f"{len(df)} {name}" for name, df in frames.items())
+    print(f"Processed cache ready at {cache_path} ({counts}) in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Response
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Bodies smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+
+
+class CachedResponse:
+    """A serialized body, its gzip encoding and their ETags"""
+
+    def __init__(self, body, compress, mimetype='application/json'):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.gzipped = gzip.compress(body, GZIP_LEVEL, mtime=0) if compress and len(body) >= GZIP_MIN_BYTES else None
+
+    @property
+    def size(self):
+        return len(self.body) + (len(self.gzipped) if self.gzipped is not None else 0)
+
+    def to_response(self, request):
+        """Build the response for a request, answering 304 when its ETag still matches"""
+        if self.gzipped is not None and 'gzip' in request.accept_encodings:
+            # Each encoding is its own representation, so it gets its own ETag
+            response = Response(self.gzipped, mimetype=self.mimetype)
+            response.headers['Content-Encoding'] = 'gzip'
+            response.set_etag(f"{self.etag}-gzip")
+        else:
+            response = Response(self.body, mimetype=self.mimetype)
+            response.set_etag(self.etag)
+        response.vary.add('Accept-Encoding')
+        # Browsers keep the body but revalidate, which costs a 304 while the data is unchanged
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
+
+class ResponseCache:
+    """Bounded LRU of serialized responses, keyed by route, dataset version and normalized filters"""
+
+    def __init__(self, max_bytes=None, compress=None):
+        env = os.environ
+        self.max_bytes = int(max_bytes if max_bytes is not None else env.get('RESPONSE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+        if compress is None:
+            compress = env.get('RESPONSE_CACHE_GZIP', '1').lower() not in ('0', 'false', 'no')
+        self.compress = compress
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry
+
+    def put(self, key, body, mimetype='application/json'):
+        """Store a serialized body and return its entry; bodies larger than the cache are not kept"""
+        entry = CachedResponse(body, self.compress, mimetype)
+        if entry.size > self.max_bytes:
+            return entry
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.counters['evictions'] += 1
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        stats['max_bytes'] = self.max_bytes
+        return stats
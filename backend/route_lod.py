@@ -0,0 +1,225 @@
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+EARTH_CIRCUMFERENCE_KM = 2 * math.pi * EARTH_RADIUS_KM
+
+# Consecutive activities of one mode are drawn as a single line when one ends this close to where the next starts
+MERGE_GAP_KM = 0.5
+# Vertices that move the line by less than this many screen pixels are dropped
+PIXEL_TOLERANCE = 1.0
+# Width assumed when turning a bbox into a zoom level
+MAP_WIDTH_PX = 1024
+DEFAULT_MAX_VERTICES = 5000
+
+
+def project_km(lats, lngs):
+    """Equirectangular projection to kilometres, good enough for simplification distances"""
+    lat = np.radians(lats)
+    return EARTH_RADIUS_KM * np.radians(lngs) * np.cos(lat), EARTH_RADIUS_KM * lat
+
+
+def zoom_tolerance_km(zoom):
+    """Ground distance covered by PIXEL_TOLERANCE pixels at a web-map zoom level"""
+    return PIXEL_TOLERANCE * EARTH_CIRCUMFERENCE_KM / (256 * 2 ** math.floor(zoom))
+
+
+def parse_bbox(value):
+    """Parse 'min_lng,min_lat,max_lng,max_lat'"""
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4 or not all(math.isfinite(part) for part in parts):
+        raise ValueError('bbox must be min_lng,min_lat,max_lng,max_lat')
+    min_lng, min_lat, max_lng, max_lat = parts
+    if min_lng > max_lng or min_lat > max_lat:
+        raise ValueError('bbox minimums must not exceed its maximums')
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def zoom_for_bbox(bbox):
+    """The zoom level at which the bbox spans a MAP_WIDTH_PX wide map"""
+    span = max(bbox[2] - bbox[0], 1e-6)
+    return max(math.log2(360 * MAP_WIDTH_PX / (256 * span)), 0)
+
+
+def _segment_distance(px, py, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(length2 > 0, ((px - ax) * dx + (py - ay) * dy) / length2, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def dp_importance(x, y, lo, hi, keep=None):
+    """Douglas-Peucker importance of every vertex of many polylines at once.
+
+    Polyline i spans vertices lo[i]..hi[i] inclusive. A vertex is kept by
+    Douglas-Peucker at tolerance t exactly when its importance exceeds t, so
+    one pass serves every zoom level. All ranges at the same recursion depth
+    are split together with segment reductions. Endpoints get infinity.
+
+    With ``keep``, only the ``keep`` most important vertices are needed:
+    ranges that can no longer produce one of them are not split further,
+    and their inner vertices are left at zero.
+    """
+    importance = np.zeros(len(x))
+    importance[lo] = np.inf
+    importance[hi] = np.inf
+    parent = np.full(len(lo), np.inf)
+
+    while len(lo):
+        inner = hi - lo - 1
+        split = inner > 0
+        lo, hi, parent, inner = lo[split], hi[split], parent[split], inner[split]
+        if not len(lo):
+            break
+
+        offsets = np.concatenate(([0], np.cumsum(inner)[:-1]))
+        owner = np.repeat(np.arange(len(lo)), inner)
+        index = lo[owner] + 1 + (np.arange(inner.sum()) - offsets[owner])
+        distance = _segment_distance(x[index], y[index], x[lo[owner]], y[lo[owner]], x[hi[owner]], y[hi[owner]])
+
+        # The farthest vertex of each range (the first one on ties) becomes its split point
+        farthest = np.maximum.reduceat(distance, offsets)
+        candidates = np.flatnonzero(distance == farthest[owner])
+        _, first = np.unique(owner[candidates], return_index=True)
+        mid = index[candidates[first]]
+
+        # A vertex can never outlive the split that created its range
+        value = np.minimum(farthest, parent)
+        importance[mid] = value
+
+        lo, hi, parent = np.concatenate((lo, mid)), np.concatenate((mid, hi)), np.concatenate((value, value))
+
+        if keep is not None:
+            found = np.flatnonzero(importance)
+            if len(found) >= keep:
+                # Children never outrank their parent split, so ranges below the cut-off are done
+                cutoff = np.partition(importance[found], len(found) - keep)[len(found) - keep]
+                live = parent >= cutoff
+                lo, hi, parent = lo[live], hi[live], parent[live]
+    return importance
+
+
+class RouteLOD:
+    """Level-of-detail geometry for the activity lines.
+
+    Consecutive activities of the same mode that join up are chained into one
+    polyline, and every vertex of every chain gets a Douglas-Peucker
+    importance once at load time. A request then picks the vertices above
+    its zoom's tolerance, and each run of selected activities keeps both of
+    its endpoints, so every leg stays on the map.
+
+    When even the run endpoints exceed the vertex budget (thousands of short
+    legs seen from far away), each mode's runs are joined into one polyline
+    and simplified again as a whole, so the line still passes within the
+    achieved tolerance of every leg while the vertex count stays bounded.
+    """
+
+    def __init__(self, activities, merge_gap_km=MERGE_GAP_KM):
+        self.activities = activities
+        size = len(activities)
+        drawable = activities.has_coordinates
+
+        self.start_x, self.start_y = start_x, start_y = project_km(activities.start_lat, activities.start_lng)
+        self.end_x, self.end_y = end_x, end_y = project_km(activities.end_lat, activities.end_lng)
+
+        # An activity continues the previous chain when it has the same mode and starts where that one ended
+        continues = np.zeros(size, dtype=bool)
+        if size > 1:
+            gap = np.hypot(start_x[1:] - end_x[:-1], start_y[1:] - end_y[:-1])
+            continues[1:] = (
+                drawable[1:] & drawable[:-1]
+                & (activities.type_codes[1:] == activities.type_codes[:-1])
+                & (activities.type_codes[1:] >= 0)
+                & (gap <= merge_gap_km)
+            )
+        self.chain_id = np.where(drawable, np.cumsum(~continues) - 1, -1)
+
+        # Vertices: each chain's first start point, then the end point of every activity in it
+        rows = np.flatnonzero(drawable)
+        opens = ~continues[rows]
+        end_vertex = np.arange(len(rows)) + np.cumsum(opens)
+        start_vertex = end_vertex[opens] - 1
+        count = len(rows) + int(opens.sum())
+        x = np.empty(count)
+        y = np.empty(count)
+        x[end_vertex], y[end_vertex] = end_x[rows], end_y[rows]
+        x[start_vertex], y[start_vertex] = start_x[rows[opens]], start_y[rows[opens]]
+
+        chain_last = np.append(start_vertex[1:] - 1, count - 1) if len(start_vertex) else start_vertex
+        importance = dp_importance(x, y, start_vertex, chain_last)
+
+        self.end_importance = np.full(size, np.inf)
+        self.end_importance[rows] = importance[end_vertex]
+        self.vertex_count = count
+
+    def vertex_mask(self, positions, tolerance_km=0.0, max_vertices=DEFAULT_MAX_VERTICES):
+        """Choose the vertices to draw for the selected activities.
+
+        Returns (positions, mask): the drawable positions and a (k, 3) mask
+        saying whether to emit each activity's start point, its end point and
+        a line break after it.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        positions = positions[self.activities.has_coordinates[positions]]
+        chains = self.chain_id[positions]
+
+        run_start = np.ones(len(positions), dtype=bool)
+        run_start[1:] = (positions[1:] != positions[:-1] + 1) | (chains[1:] != chains[:-1])
+        run_end = np.append(run_start[1:], True) if len(positions) else run_start
+
+        importance = self.end_importance[positions]
+        optional = ~run_end
+        keep_end = run_end | (importance > tolerance_km)
+
+        # Run endpoints are always drawn; the budget decides how many inner vertices fit
+        forced = 2 * int(run_start.sum())
+        if forced > max_vertices:
+            mask = np.column_stack((run_start, keep_end, run_end))
+            return positions, self._join_runs(positions, mask, max_vertices)
+
+        budget = max_vertices - forced
+        kept_inner = np.flatnonzero(optional & keep_end)
+        if len(kept_inner) > budget:
+            order = np.argsort(-importance[kept_inner], kind='stable')
+            keep_end[kept_inner[order[budget:]]] = False
+
+        return positions, np.column_stack((run_start, keep_end, run_end))
+
+    def _join_runs(self, positions, mask, max_vertices):
+        """Simplify each mode's runs as one polyline to fit the vertex budget"""
+        codes = self.activities.type_codes[positions]
+        # Rows grouped by mode, in time order within each mode
+        rows = np.argsort(codes, kind='stable')
+        starts, ends = mask[rows, 0], mask[rows, 1]
+
+        # Vertex sequence per row: its start point if drawn, then its end point if drawn
+        per_row = starts.astype(np.int64) + ends
+        first_vertex = np.cumsum(per_row) - per_row
+        x = np.empty(int(per_row.sum()))
+        y = np.empty(len(x))
+        x[first_vertex[starts]] = self.start_x[positions[rows[starts]]]
+        y[first_vertex[starts]] = self.start_y[positions[rows[starts]]]
+        end_vertex = first_vertex[ends] + starts[ends]
+        x[end_vertex] = self.end_x[positions[rows[ends]]]
+        y[end_vertex] = self.end_y[positions[rows[ends]]]
+
+        group_codes = codes[rows]
+        group_start = np.flatnonzero(np.append(True, group_codes[1:] != group_codes[:-1]))
+        lo = first_vertex[group_start]
+        hi = np.append(lo[1:], len(x)) - 1
+        importance = dp_importance(x, y, lo, hi, keep=max_vertices)
+
+        keep = np.zeros(len(x), dtype=bool)
+        keep[np.argsort(-importance, kind='stable')[:max(max_vertices, 2 * len(lo))]] = True
+
+        joined = np.zeros_like(mask)
+        joined[rows[starts], 0] = keep[first_vertex[starts]]
+        joined[rows[ends], 1] = keep[end_vertex]
+        # Break the line only where the next run of the same mode starts with a vertex of its own
+        next_starts = np.append(joined[rows[1:], 0], True)
+        next_starts[group_start[1:] - 1] = True
+        joined[rows, 2] = mask[rows, 2] & next_starts
+        return joined
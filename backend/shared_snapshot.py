@@ -0,0 +1,154 @@
+import json
+import os
+import re
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from aggregates import DailyRollup
+from geodesic import KinematicsStore
+from places import PlaceStore
+from processed_cache import CACHE_DIR
+from route_lod import RouteLOD
+from spatial_index import GridIndex, StopIndex
+from timeline_snapshot import TimelineSnapshot
+from timeline_store import ActivityStore, PathStore, VisitStore, restore_store, store_state
+
+_MAGIC = b'VGSNAP01'
+# Bumped whenever the stores written to the file change
+SNAPSHOT_FORMAT_VERSION = 6
+_ALIGN = 64
+# Stores written to the shared file, with the attributes each worker keeps for itself
+_STORES = (
+    ('activities', ActivityStore, ()),
+    ('visits', VisitStore, ()),
+    ('route_lod', RouteLOD, ('activities',)),
+    ('paths', PathStore, ()),
+    ('kinematics', KinematicsStore, ()),
+    ('rollup', DailyRollup, ()),
+    ('activity_grid', GridIndex, ()),
+    ('visit_grid', GridIndex, ()),
+    ('places', PlaceStore, ('location_name', 'location_pending'))
+)
+
+
+def shared_path_for(json_path, version, cache_dir=CACHE_DIR):
+    # Versions contain '+' when additions are merged in, which is fine in a file name
+    return Path(cache_dir) / f"{Path(json_path).stem}.{version}.snapshot"
+
+
+def build_lock_for(json_path, cache_dir=CACHE_DIR):
+    """Lock file held while a worker builds a shared file for the export"""
+    return Path(cache_dir) / f"{Path(json_path).stem}.snapshot.lock"
+
+
+def _aligned(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def write_arrays(path, arrays, meta):
+    """Write arrays back to back (64-byte aligned) after a JSON header, atomically.
+
+    The file is laid out so ``read_arrays`` can map every array straight
+    from it without copying.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    entries = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        entries[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _aligned(offset + array.nbytes)
+    header = json.dumps({'meta': meta, 'arrays': entries}).encode('utf-8')
+    data_start = _aligned(len(_MAGIC) + 8 + len(header))
+
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(len(header).to_bytes(8, 'little'))
+            f.write(header)
+            for name, array in arrays.items():
+                f.seek(data_start + entries[name]['offset'])
+                f.write(np.ascontiguousarray(array).tobytes())
+            f.truncate(data_start + offset)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def read_arrays(path):
+    """Map a file written by ``write_arrays`` read-only; returns (arrays, meta).
+
+    Every array is a view of one shared mapping, so processes that read the
+    same file share its pages in the OS page cache.
+    """
+    mapping = np.memmap(path, dtype=np.uint8, mode='r')
+    if bytes(mapping[:len(_MAGIC)]) != _MAGIC:
+        raise ValueError(f"{path} is not a shared snapshot file")
+    header_size = int.from_bytes(bytes(mapping[len(_MAGIC):len(_MAGIC) + 8]), 'little')
+    header_start = len(_MAGIC) + 8
+    header = json.loads(bytes(mapping[header_start:header_start + header_size]).decode('utf-8'))
+    data_start = _aligned(header_start + header_size)
+
+    arrays = {}
+    for name, entry in header['arrays'].items():
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape'], dtype=np.int64))
+        array = np.frombuffer(mapping, dtype=dtype, count=count, offset=data_start + entry['offset'])
+        arrays[name] = array.reshape(entry['shape'])
+    return arrays, header['meta']
+
+
+def save_snapshot(path, snapshot):
+    """Write the arrays of a snapshot's stores to a shared file"""
+    arrays, layouts = {}, {}
+    for name, _, skip in _STORES:
+        store_arrays, layouts[name] = store_state(getattr(snapshot, name), skip)
+        arrays.update({f"{name}/{key}": value for key, value in store_arrays.items()})
+    write_arrays(path, arrays, {
+        'format_version': SNAPSHOT_FORMAT_VERSION,
+        'version': snapshot.version,
+        'stores': layouts
+    })
+
+
+def load_snapshot(path):
+    """A snapshot whose stores read their arrays from a shared file; it holds no frames.
+
+    Raises ValueError when the file was written in another format.
+    """
+    arrays, meta = read_arrays(path)
+    if meta.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"{path} has snapshot format {meta.get('format_version')}, expected {SNAPSHOT_FORMAT_VERSION}")
+    snapshot = TimelineSnapshot.__new__(TimelineSnapshot)
+    snapshot.setup(meta['version'])
+    for name, cls, _ in _STORES:
+        prefix = f"{name}/"
+        store_arrays = {key[len(prefix):]: value for key, value in arrays.items() if key.startswith(prefix)}
+        setattr(snapshot, name, restore_store(cls, store_arrays, meta['stores'][name]))
+    snapshot.places.reset_locations()
+    snapshot.route_lod.activities = snapshot.activities
+    # KD-trees hold their own copy of the points, so each worker builds one
+    snapshot.stop_index = StopIndex(snapshot.visits)
+    return snapshot
+
+
+def remove_stale(json_path, keep, cache_dir=CACHE_DIR):
+    """Delete shared files of other versions; workers still mapping one keep their pages until they let go"""
+    pattern = re.compile(re.escape(Path(json_path).stem) + r'\.(.+)\.snapshot$')
+    cache_dir = Path(cache_dir)
+    if not cache_dir.is_dir():
+        return
+    for path in cache_dir.iterdir():
+        match = pattern.match(path.name)
+        if match and path != Path(keep):
+            try:
+                path.unlink()
+            except OSError:
+                pass
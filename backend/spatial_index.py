@@ -0,0 +1,146 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+from geocoding import EARTH_RADIUS_KM, chord_to_km, unit_vectors
+
+# The grid spans the data's extent with at most this many cells along each axis
+GRID_CELLS = 128
+# Boxes covering more cells than this (long flights, ferries) are kept in one list
+# that every query checks, instead of being registered in each cell they cover
+MAX_CELLS_PER_BOX = 64
+# Viewports covering more than this share of the grid are answered with one scan
+_SCAN_SHARE = 0.25
+
+
+class GridIndex:
+    """Uniform grid over lng/lat boxes (points are boxes of zero size), built once per snapshot.
+
+    Every box is listed under each cell it covers; ``offsets`` delimit each
+    cell's rows in ``rows``, cells numbered row by row, so the cells of one
+    grid row within a viewport are one contiguous slice. Only rows listed in
+    the viewport's cells are tested exactly. Boxes with a missing coordinate
+    are never returned.
+    """
+
+    def __init__(self, min_lng, min_lat, max_lng, max_lat):
+        self.min_lng, self.min_lat = np.asarray(min_lng, dtype=np.float64), np.asarray(min_lat, dtype=np.float64)
+        self.max_lng, self.max_lat = np.asarray(max_lng, dtype=np.float64), np.asarray(max_lat, dtype=np.float64)
+        self.size = len(self.min_lng)
+        valid = (np.isfinite(self.min_lng) & np.isfinite(self.min_lat)
+                 & np.isfinite(self.max_lng) & np.isfinite(self.max_lat))
+        if not valid.any():
+            self.x0 = self.y0 = 0.0
+            self.cell_w = self.cell_h = 1.0
+            self.nx = self.ny = 1
+        else:
+            self.x0, self.y0 = float(self.min_lng[valid].min()), float(self.min_lat[valid].min())
+            width = float(self.max_lng[valid].max()) - self.x0
+            height = float(self.max_lat[valid].max()) - self.y0
+            self.nx = self.ny = GRID_CELLS
+            self.cell_w = max(width / GRID_CELLS, 1e-9)
+            self.cell_h = max(height / GRID_CELLS, 1e-9)
+
+        rows = np.flatnonzero(valid)
+        ix0, iy0 = self._cell(self.min_lng[rows], self.min_lat[rows])
+        ix1, iy1 = self._cell(self.max_lng[rows], self.max_lat[rows])
+        widths = ix1 - ix0 + 1
+        spans = widths * (iy1 - iy0 + 1)
+        small = spans <= MAX_CELLS_PER_BOX
+        self.large = rows[~small]
+
+        # One (cell, row) pair per cell a small box covers
+        rows, ix0, iy0, widths, spans = rows[small], ix0[small], iy0[small], widths[small], spans[small]
+        owner = np.repeat(np.arange(len(rows)), spans)
+        within = np.arange(len(owner)) - np.repeat(np.cumsum(spans) - spans, spans)
+        cells = (iy0[owner] + within // widths[owner]) * self.nx + ix0[owner] + within % widths[owner]
+        order = np.lexsort((rows[owner], cells))
+        self.rows = rows[owner][order]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(cells, minlength=self.nx * self.ny))))
+
+    @classmethod
+    def for_activities(cls, activities):
+        """Index over the box of each activity's straight line"""
+        return cls(np.fmin(activities.start_lng, activities.end_lng), np.fmin(activities.start_lat, activities.end_lat),
+                   np.fmax(activities.start_lng, activities.end_lng), np.fmax(activities.start_lat, activities.end_lat))
+
+    @classmethod
+    def for_points(cls, lats, lngs):
+        return cls(lngs, lats, lngs, lats)
+
+    def __len__(self):
+        return self.size
+
+    def _cell(self, lngs, lats):
+        ix = np.clip(((lngs - self.x0) // self.cell_w).astype(np.int64), 0, self.nx - 1)
+        iy = np.clip(((lats - self.y0) // self.cell_h).astype(np.int64), 0, self.ny - 1)
+        return ix, iy
+
+    def _overlaps(self, rows, bbox):
+        min_lng, min_lat, max_lng, max_lat = bbox
+        return ((self.min_lat[rows] <= max_lat) & (self.max_lat[rows] >= min_lat)
+                & (self.min_lng[rows] <= max_lng) & (self.max_lng[rows] >= min_lng))
+
+    def _cell_range(self, low, high, origin, size, count):
+        first = min(max(int((low - origin) // size), 0), count - 1)
+        last = min(max(int((high - origin) // size), 0), count - 1)
+        return first, last
+
+    def query(self, bbox):
+        """Sorted rows whose box overlaps the bbox (min_lng, min_lat, max_lng, max_lat)"""
+        min_lng, min_lat, max_lng, max_lat = bbox
+        cx0, cx1 = self._cell_range(min_lng, max_lng, self.x0, self.cell_w, self.nx)
+        cy0, cy1 = self._cell_range(min_lat, max_lat, self.y0, self.cell_h, self.ny)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > _SCAN_SHARE * self.nx * self.ny:
+            # Most of the data is in view: one vectorized pass beats gathering cells
+            return np.flatnonzero(self._overlaps(slice(None), bbox))
+
+        parts = [self.rows[self.offsets[cy * self.nx + cx0]:self.offsets[cy * self.nx + cx1 + 1]]
+                 for cy in range(cy0, cy1 + 1)]
+        candidates = np.sort(np.concatenate(parts))
+        # Boxes spanning several cells are listed once per cell
+        if len(candidates) > 1:
+            candidates = candidates[np.concatenate(([True], candidates[1:] != candidates[:-1]))]
+        # Points outside the grid's extent were clipped into its edge cells, so the exact test
+        # also covers viewports beyond the extent
+        found = candidates[self._overlaps(candidates, bbox)]
+        if len(self.large):
+            found = np.sort(np.concatenate((found, self.large[self._overlaps(self.large, bbox)])))
+        return found
+
+
+def km_to_chord(km):
+    return 2 * np.sin(np.minimum(km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+class StopIndex:
+    """KD-tree over the visits that have coordinates, as unit vectors (see OfflineGeocoder).
+
+    It cannot be mapped from a shared file, so each worker builds its own
+    when a snapshot is loaded.
+    """
+
+    def __init__(self, visits):
+        self.rows = np.flatnonzero(visits.has_coordinates)
+        self.tree = cKDTree(unit_vectors(visits.lat[self.rows], visits.lng[self.rows]))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def nearest(self, lat, lng, k):
+        """(visit rows, distances in km) of the k stops nearest to a point, nearest first"""
+        k = min(k, len(self.rows))
+        if not k:
+            return self.rows[:0], np.empty(0)
+        chords, found = self.tree.query(unit_vectors([lat], [lng])[0], k=k)
+        found, chords = np.atleast_1d(found), np.atleast_1d(chords)
+        return self.rows[found], chord_to_km(chords)
+
+    def within(self, lat, lng, radius_km):
+        """(visit rows, distances in km) of every stop within radius_km of a point, nearest first"""
+        point = unit_vectors([lat], [lng])[0]
+        found = np.asarray(self.tree.query_ball_point(point, km_to_chord(radius_km)), dtype=np.int64)
+        if not len(found):
+            return self.rows[:0], np.empty(0)
+        distances = chord_to_km(np.linalg.norm(self.tree.data[found] - point, axis=1))
+        order = np.argsort(distances, kind='stable')
+        return self.rows[found[order]], distances[order]
@@ -7,5 +7,11 @@ echo "Installing dependencies..."
 # Install Python dependencies
 pip install -r requirements.txt
 
+echo "Prebuilding processed timeline cache..."
+python processed_cache.py || echo "Cache prebuild failed, workers will process the export on startup"
+
+echo "Migrating waitlist.json into the waitlist database..."
+python waitlist_store.py || echo "Waitlist migration failed, waitlist.json was not copied"
+
 echo "Starting Flask application with Gunicorn..."
 exec gunicorn app:app --bind 0.0.0.0:$PORT --workers 2 --timeout 120
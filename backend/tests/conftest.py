@@ -0,0 +1,69 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The backend modules import each other by name, as they do when run from backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from processed_cache import build_processed
+from timeline_synth import write_timeline
+
+
+@pytest.fixture(scope='session')
+def timeline_export(tmp_path_factory):
+    """A small synthetic export, written once per test run"""
+    path = tmp_path_factory.mktemp('export') / 'timeline.json'
+    write_timeline(path, 1500)
+    return path
+
+
+@pytest.fixture(scope='session')
+def frames(timeline_export):
+    """Processed frames of ``timeline_export``; tests must not modify them"""
+    return build_processed(timeline_export)
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """The Flask app module, imported with its data, caches and stores in a temporary directory"""
+    root = tmp_path_factory.mktemp('app')
+    with pytest.MonkeyPatch.context() as patch:
+        # No default export, so the import loads nothing; tests install their own processor
+        patch.setenv('TIMELINE_JSON_PATH', str(root / 'google_timeline.json'))
+        patch.setenv('DATASET_POLL_SECONDS', '0')
+        patch.setenv('JOURNEYS_DIR', str(root / 'journeys'))
+        patch.setenv('UPLOAD_JOBS_DIR', str(root / 'jobs'))
+        patch.setenv('WAITLIST_DB_PATH', str(root / 'waitlist.sqlite3'))
+        patch.setenv('GEOCODE_CACHE_PATH', str(root / 'geocode_cache.sqlite3'))
+        import app
+        yield app
+
+
+@pytest.fixture(scope='session')
+def processor(app_module, timeline_export, tmp_path_factory):
+    """A processor serving ``timeline_export``, without background threads"""
+    processor = app_module.TimelineProcessor(timeline_export, background=False,
+                                             cache_dir=tmp_path_factory.mktemp('cache'),
+                                             additions_dir=tmp_path_factory.mktemp('additions'))
+    assert processor.timeline_loaded
+    return processor
+
+
+@pytest.fixture
+def client(app_module, processor, monkeypatch):
+    """A test client of the app serving ``processor``, with an empty response cache"""
+    monkeypatch.setattr(app_module, 'timeline_processor', processor)
+    app_module.response_cache.clear()
+    return app_module.app.test_client()
+
+
+@pytest.fixture(scope='session')
+def outlier_processor(app_module, tmp_path_factory):
+    """A processor whose export has a flight recorded as a car ride on a third of the days"""
+    root = tmp_path_factory.mktemp('outliers')
+    write_timeline(root / 'timeline.json', 1500, outlier_rate=0.3)
+    processor = app_module.TimelineProcessor(root / 'timeline.json', background=False, cache_dir=root / 'cache',
+                                             additions_dir=root / 'additions')
+    assert processor.snapshot.kinematics.outlier.any()
+    return processor
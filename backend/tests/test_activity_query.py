@@ -0,0 +1,147 @@
+import numpy as np
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from activity_query import ActivityQuery, ActivityQueryEngine, decode_cursor, encode_cursor
+from processed_cache import build_processed
+from timeline_snapshot import TimelineSnapshot
+from timeline_store import _NS_PER_DAY, as_positions, to_epoch_ns
+from timeline_synth import write_timeline
+
+QUERIES = [
+    {},
+    {'start_date': '2025-06-20', 'end_date': '2025-07-05'},
+    {'transport_mode': 'WALKING,CYCLING'},
+    {'transport_mode': ['IN_BUS', 'HOVERBOARD'], 'start_date': '2025-06-15'},
+    {'country': 'Finland', 'min_distance': '2000'},
+    {'min_duration': '0.5', 'end_date': '2025-07-01'},
+    {'bbox': '24,59,31,61.5'},
+    {'bbox': '24,59,31,61.5', 'transport_mode': 'WALKING', 'start_date': '2025-06-18'},
+    {'exclude_outliers': '1', 'transport_mode': 'IN_PASSENGER_VEHICLE'},
+]
+
+
+def _engine(snapshot, outliers=None):
+    return ActivityQueryEngine(snapshot.activities, snapshot.version, snapshot.activity_grid,
+                               snapshot.kinematics.outlier if outliers is None else outliers)
+
+
+def _scan(activities, query, outliers):
+    """The rows a query selects, by testing every predicate on every row"""
+    keep = np.ones(len(activities), dtype=bool)
+    if query.start_ns is not None:
+        keep &= activities.start >= query.start_ns
+    if query.end_ns is not None:
+        keep &= activities.start <= query.end_ns
+    if query.modes:
+        keep &= np.isin(activities.types[activities.type_codes], query.modes) & (activities.type_codes >= 0)
+    if query.countries:
+        names = np.append(activities.countries, None)
+        keep &= np.isin(names[activities.start_country_codes], query.countries) | \
+            np.isin(names[activities.end_country_codes], query.countries)
+    if query.min_distance is not None:
+        keep &= activities.distance >= query.min_distance
+    if query.min_duration is not None:
+        keep &= activities.duration_hours >= query.min_duration
+    if query.bbox is not None:
+        min_lng, min_lat, max_lng, max_lat = query.bbox
+        keep &= ((np.fmin(activities.start_lng, activities.end_lng) <= max_lng)
+                 & (np.fmax(activities.start_lng, activities.end_lng) >= min_lng)
+                 & (np.fmin(activities.start_lat, activities.end_lat) <= max_lat)
+                 & (np.fmax(activities.start_lat, activities.end_lat) >= min_lat))
+    if query.exclude_outliers:
+        keep &= ~outliers
+    return np.flatnonzero(keep)
+
+
+@pytest.fixture(scope='module')
+def snapshot(frames):
+    return TimelineSnapshot(frames, version='full')
+
+
+@pytest.fixture(scope='module')
+def early(tmp_path_factory):
+    """The first 600 segments of the trip, as loaded before more were added"""
+    path = tmp_path_factory.mktemp('early') / 'timeline.json'
+    write_timeline(path, 600)
+    return TimelineSnapshot(build_processed(path), version='early')
+
+
+@pytest.mark.parametrize('args', QUERIES)
+def test_select_matches_a_scan(snapshot, args):
+    # Every third activity counts as an outlier, so the flag filters something
+    outliers = np.arange(len(snapshot.activities)) % 3 == 0
+    query = ActivityQuery.from_args(MultiDict(args))
+    selection = as_positions(_engine(snapshot, outliers).select(query))
+    np.testing.assert_array_equal(selection, _scan(snapshot.activities, query, outliers))
+
+
+def test_from_args():
+    query = ActivityQuery.from_args(MultiDict([('transport_mode', 'WALKING, CYCLING'), ('transport_mode', 'WALKING'),
+                                               ('start_date', '2025-06-20'), ('exclude_outliers', 'yes')]))
+    assert query.modes == ('CYCLING', 'WALKING')
+    assert query.start_ns == to_epoch_ns('2025-06-20')
+    assert query.exclude_outliers
+    assert not query.with_outliers().exclude_outliers and query.with_outliers().modes == query.modes
+    assert ActivityQuery.from_args(MultiDict()).key() == ActivityQuery().key()
+    for bad in ({'start_date': 'soon'}, {'min_distance': '-1'}, {'min_duration': 'nan'},
+                {'bbox': '1,2,3'}, {'exclude_outliers': 'maybe'}):
+        with pytest.raises(ValueError):
+            ActivityQuery.from_args(MultiDict(bad))
+
+
+def test_whole_days():
+    query = ActivityQuery(start_ns=to_epoch_ns('2025-06-20T13:00:00'), end_ns=to_epoch_ns('2025-06-21')).whole_days()
+    assert query.start_ns == to_epoch_ns('2025-06-20')
+    assert query.end_ns == to_epoch_ns('2025-06-22') - 1
+
+
+def _walk(engine, query, limit, cursor=None):
+    pages = []
+    while True:
+        positions, cursor = engine.page(query, limit, cursor)
+        pages.append(positions)
+        if cursor is None:
+            return np.concatenate(pages)
+
+
+@pytest.mark.parametrize('args', [{}, {'transport_mode': 'WALKING'}, {'start_date': '2025-06-20'}])
+def test_pages_cover_the_selection_once(snapshot, args):
+    query = ActivityQuery.from_args(MultiDict(args))
+    engine = _engine(snapshot)
+    np.testing.assert_array_equal(_walk(engine, query, 37), as_positions(engine.select(query)))
+
+
+@pytest.mark.parametrize('args', [{}, {'transport_mode': 'WALKING'}])
+def test_cursor_resumes_after_a_reload(snapshot, early, args):
+    query = ActivityQuery.from_args(MultiDict(args))
+    old = _engine(early)
+    first, cursor = old.page(query, 40)
+    second, cursor = old.page(query, 40, cursor)
+    assert cursor is not None
+    # The dataset is reloaded with more segments; the cursor still points into the old version
+    new = _engine(snapshot)
+    resumed = _walk(new, query, 40, cursor)
+    seen = np.concatenate((early.activities.start[np.concatenate((first, second))], snapshot.activities.start[resumed]))
+    expected = snapshot.activities.start[as_positions(new.select(query))]
+    # No row is skipped, and rows are only repeated if they share the start time the cursor resumes at
+    assert set(expected) <= set(seen)
+    assert len(seen) - len(expected) <= np.sum(expected == snapshot.activities.start[resumed[0]])
+
+
+def test_cursor_of_the_same_version_is_a_position(snapshot):
+    engine = _engine(snapshot)
+    version, position, start_ns = decode_cursor(engine.page(None, 10)[1])
+    assert (version, position, start_ns) == ('full', 10, snapshot.activities.start[10])
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor')
+    assert decode_cursor(encode_cursor('v', 3, 99)) == ('v', 3, 99)
+
+
+def test_map_data_pages(client, processor):
+    first = client.get('/api/map/data?transport_mode=WALKING&limit=25').get_json()
+    assert len(first['activities']) == 25 and first['next_cursor']
+    second = client.get(f"/api/map/data?transport_mode=WALKING&limit=25&cursor={first['next_cursor']}").get_json()
+    assert first['activities'][-1]['start_time'] < second['activities'][0]['start_time']
+    assert client.get('/api/map/data?cursor=garbage').status_code == 400
+    assert client.get('/api/map/data?limit=0').status_code == 400
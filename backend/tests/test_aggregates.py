@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregates import DailyRollup, bucket_starts
+from timeline_snapshot import TimelineSnapshot
+from timeline_store import _NS_PER_DAY
+
+
+@pytest.fixture(scope='module')
+def snapshot(frames):
+    return TimelineSnapshot(frames, version='test')
+
+
+def _activity_table(df):
+    """Activities with the columns the rollup groups by, the way pandas would work them out"""
+    return pd.DataFrame({
+        'day': df['startTime'].dt.floor('D').dt.tz_localize(None),
+        'type': df['topCandidate.type'],
+        'country': df['start_country'].fillna(df['end_country']).fillna('?'),
+        'distance': df['distanceMeters'].fillna(0),
+        'hours': (df['endTime'] - df['startTime']).dt.total_seconds() / 3600
+    })
+
+
+def _rollup_table(rollup):
+    countries = np.append(rollup.countries, '?')
+    return pd.DataFrame({
+        'day': pd.to_datetime(rollup.day * _NS_PER_DAY),
+        'type': rollup.types[rollup.type_codes],
+        'country': countries[rollup.country_codes],
+        'distance': rollup.distance,
+        'hours': rollup.duration_hours,
+        'count': rollup.count
+    }).set_index(['day', 'type', 'country']).sort_index()
+
+
+def _groupby(df):
+    return _activity_table(df).groupby(['day', 'type', 'country']).agg(
+        distance=('distance', 'sum'), hours=('hours', 'sum'), count=('distance', 'size'))
+
+
+def _assert_matches(rollup, df):
+    table, expected = _rollup_table(rollup), _groupby(df)
+    assert table.index.tolist() == expected.index.tolist()
+    np.testing.assert_allclose(table['distance'], expected['distance'])
+    np.testing.assert_allclose(table['hours'], expected['hours'])
+    np.testing.assert_array_equal(table['count'], expected['count'])
+
+
+def test_rows_match_a_groupby(snapshot):
+    rollup = snapshot.rollup
+    _assert_matches(rollup, snapshot.frames['activities'])
+    assert np.all(np.diff(rollup.day) >= 0)
+
+    visits = snapshot.frames['visits']
+    dwell = ((visits['endTime'] - visits['startTime']).dt.total_seconds() / 3600).groupby(
+        visits['startTime'].dt.floor('D')).agg(['sum', 'size'])
+    np.testing.assert_allclose(rollup.visit_dwell_hours, dwell['sum'])
+    np.testing.assert_array_equal(rollup.visit_count, dwell['size'])
+
+
+def test_totals(snapshot):
+    rollup, df = snapshot.rollup, snapshot.frames['activities']
+    assert rollup.total_count() == len(df)
+    walking = df['topCandidate.type'].isin(['WALKING', 'ON_FOOT'])
+    assert rollup.count_by_type(['WALKING', 'ON_FOOT']) == walking.sum()
+    assert rollup.distance_by_type(['WALKING', 'ON_FOOT']) == pytest.approx(df['distanceMeters'][walking].sum())
+    assert rollup.most_common_type() == df['topCandidate.type'].value_counts().index[0]
+    countries = set(df['start_country'].dropna()) | set(df['end_country'].dropna())
+    assert sorted(rollup.country_names()) == sorted(countries)
+
+
+def test_selection(snapshot):
+    activities, df = snapshot.activities, snapshot.frames['activities']
+    positions = activities.type_positions[activities.type_code('CYCLING')]
+    _assert_matches(DailyRollup(activities, snapshot.visits, positions), df.iloc[positions])
+
+
+def test_combined_halves_equal_the_whole(snapshot, frames):
+    # Split in the middle of a day, so both halves have rows for it
+    df = snapshot.frames['activities']
+    days = snapshot.activities.start // _NS_PER_DAY
+    middle = len(df) // 2 + int(np.argmax(days[len(df) // 2:] == days[len(df) // 2 - 1:-1]))
+    assert days[middle] == days[middle - 1]
+    halves = [{'activities': df.iloc[part], 'visits': frames['visits'].iloc[:0]}
+              for part in (slice(None, middle), slice(middle, None))]
+    combined = DailyRollup.from_frames(halves[0]).combine(DailyRollup.from_frames(halves[1]))
+    _assert_matches(combined, df)
+    assert sorted(combined.country_names()) == sorted(snapshot.rollup.country_names())
+
+
+@pytest.mark.parametrize('granularity,freq', [('day', 'D'), ('week', 'W-SUN'), ('month', 'M')])
+def test_timeseries_matches_a_groupby_by_period(snapshot, granularity, freq):
+    df = _activity_table(snapshot.frames['activities'])
+    start = snapshot.activities.start[len(snapshot.activities) // 4]
+    end = snapshot.activities.start[len(snapshot.activities) * 3 // 4]
+    starts, series, visits = snapshot.rollup.timeseries(granularity, 'mode', start, end)
+
+    day_start = pd.Timestamp(start // _NS_PER_DAY * _NS_PER_DAY)
+    day_end = pd.Timestamp(end // _NS_PER_DAY * _NS_PER_DAY)
+    df = df[(df['day'] >= day_start) & (df['day'] <= day_end)]
+    # Weeks ending on Sunday start on Monday, like the rollup's weekly buckets
+    key = df['day'].dt.to_period(freq).dt.start_time if granularity != 'day' else df['day']
+    expected = df.groupby([key, 'type'])['distance'].sum().unstack(fill_value=0.0)
+    assert pd.to_datetime(starts)[0] == expected.index[0]
+    for entry in series:
+        column = expected[entry['key']].reindex(pd.to_datetime(starts), fill_value=0.0)
+        np.testing.assert_allclose(entry['distance'], column)
+    assert sum(int(entry['count'].sum()) for entry in series) == len(df)
+    assert len(visits['count']) == len(starts)
+
+
+def test_bucket_starts():
+    days = pd.to_datetime(['2025-06-09', '2025-06-15', '2025-06-16', '2025-07-31']).as_unit('ns').asi8 // _NS_PER_DAY
+    weeks = pd.to_datetime(bucket_starts(days, 'week') * _NS_PER_DAY)
+    months = pd.to_datetime(bucket_starts(days, 'month') * _NS_PER_DAY)
+    assert [str(day.date()) for day in weeks] == ['2025-06-09', '2025-06-09', '2025-06-16', '2025-07-28']
+    assert [str(day.date()) for day in months] == ['2025-06-01', '2025-06-01', '2025-06-01', '2025-07-01']
+    with pytest.raises(ValueError):
+        bucket_starts(days, 'year')
@@ -0,0 +1,68 @@
+import pytest
+
+
+@pytest.fixture
+def stats(client, app_module, monkeypatch, outlier_processor):
+    monkeypatch.setattr(app_module, 'timeline_processor', outlier_processor)
+    return lambda query='': client.get(f'/api/dashboard/stats{query}')
+
+
+def _frame(processor):
+    df = processor.snapshot.frames['activities']
+    return df.assign(outlier=processor.snapshot.kinematics.outlier)
+
+
+def test_unfiltered_stats(stats, outlier_processor):
+    df = _frame(outlier_processor)
+    body = stats().get_json()
+    assert body['total_activities'] == len(df)
+    assert body['outlier_activities'] == df['outlier'].sum()
+    assert body['vehicle_distance'] == round(df['distanceMeters'][df['topCandidate.type'] == 'IN_PASSENGER_VEHICLE']
+                                             .sum() / 1000, 1)
+    assert body['countries_visited'] == len(set(df['start_country'].dropna()) | set(df['end_country'].dropna()))
+
+
+def test_filters_narrow_the_totals(stats, outlier_processor):
+    df = _frame(outlier_processor)
+    body = stats('?transport_mode=WALKING&start_date=2025-06-20&end_date=2025-07-10').get_json()
+    days = df['startTime'].dt.strftime('%Y-%m-%d')
+    selected = df[(df['topCandidate.type'] == 'WALKING') & (days >= '2025-06-20') & (days <= '2025-07-10')]
+    assert body['total_activities'] == len(selected)
+    assert body['walking_distance'] == round(selected['distanceMeters'].sum() / 1000, 1)
+    assert body['vehicle_distance'] == 0
+    assert body['most_common_activity'] == 'WALKING'
+    assert body['outlier_activities'] == selected['outlier'].sum()
+
+
+def test_daily_average_covers_the_date_range(stats, outlier_processor):
+    df = _frame(outlier_processor)
+    body = stats('?start_date=2025-06-11&end_date=2025-06-20').get_json()
+    days = df['startTime'].dt.strftime('%Y-%m-%d')
+    vehicle = df[(df['topCandidate.type'] == 'IN_PASSENGER_VEHICLE') & (days >= '2025-06-11') & (days <= '2025-06-20')]
+    assert body['avg_distance_per_day'] == round(vehicle['distanceMeters'].sum() / 1000 / 10, 1)
+    # Days on the road still count from the start of the journey
+    assert body['days_on_road'] == stats().get_json()['days_on_road']
+
+
+def test_outliers_are_excluded_but_still_counted(stats, outlier_processor):
+    df = _frame(outlier_processor)
+    body = stats('?exclude_outliers=1').get_json()
+    assert body['total_activities'] == len(df) - df['outlier'].sum()
+    assert body['outlier_activities'] == df['outlier'].sum()
+    vehicle = df[(df['topCandidate.type'] == 'IN_PASSENGER_VEHICLE') & ~df['outlier']]
+    assert body['vehicle_distance'] == round(vehicle['distanceMeters'].sum() / 1000, 1)
+
+
+def test_unfiltered_totals_are_cached_per_snapshot(stats, outlier_processor):
+    stats()
+    assert 'journey_stats' in outlier_processor.snapshot._derived
+    cached = dict(outlier_processor.snapshot._derived)
+    stats('?country=Finland')
+    assert outlier_processor.snapshot._derived.keys() == cached.keys()
+
+
+@pytest.mark.parametrize('query', ['?exclude_outliers=maybe', '?start_date=soon', '?min_distance=-5'])
+def test_malformed_filters(stats, query):
+    response = stats(query)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
@@ -0,0 +1,63 @@
+import json
+from datetime import datetime
+
+import numpy as np
+
+from benchmark import ENDPOINTS, compare, run_scale
+from timeline_synth import generate_segments, write_timeline
+
+_SPEEDS = {'WALKING': 5.5, 'CYCLING': 22, 'RUNNING': 12, 'IN_BUS': 45, 'IN_PASSENGER_VEHICLE': 85}
+
+
+def _run(segments, p50_ms, peak_rss_mb):
+    return {'segments': segments, 'peak_rss_mb': peak_rss_mb, 'endpoints': {'/api/filters': {'p50_ms': p50_ms}}}
+
+
+def test_segments_are_reproducible_and_in_time_order():
+    segments = list(generate_segments(400))
+    assert len(segments) == 400
+    assert segments == list(generate_segments(400))
+    assert segments != list(generate_segments(400, seed=1))
+    starts = [datetime.fromisoformat(segment['startTime']) for segment in segments]
+    assert starts == sorted(starts)
+    # A longer export begins with the same segments, so it can stand for a later download
+    assert list(generate_segments(500))[:400] == segments
+
+
+def test_activities_move_at_their_mode_speed():
+    segments = list(generate_segments(2000, outlier_rate=0))
+    for segment, following in zip(segments, segments[1:]):
+        if 'activity' not in segment:
+            continue
+        activity = segment['activity']
+        hours = (datetime.fromisoformat(segment['endTime'])
+                 - datetime.fromisoformat(segment['startTime'])).total_seconds() / 3600
+        # Trips shorter than a minute are stretched to one
+        assert activity['distanceMeters'] / 1000 / hours <= _SPEEDS[activity['topCandidate']['type']] * 1.001
+        # Every activity is followed by its path
+        assert following['startTime'] == segment['startTime'] and len(following['timelinePath']) >= 2
+
+
+def test_export_is_json(tmp_path):
+    write_timeline(tmp_path / 'timeline.json', 50)
+    with open(tmp_path / 'timeline.json') as f:
+        export = json.load(f)
+    assert len(export['semanticSegments']) == 50
+
+
+def test_compare_flags_slowdowns_beyond_tolerance_and_noise(capsys):
+    baseline = {'runs': [_run(1000, 2.0, 100), _run(10000, 0.1, 200)]}
+    results = {'runs': [_run(1000, 3.0, 101), _run(10000, 0.3, 200), _run(100000, 9.0, 900)]}
+    regressions = compare(results, baseline, 0.25)
+    # 0.1 -> 0.3 ms is three times slower but within the noise; memory grew by less than the tolerance
+    assert regressions == [(1000, 'endpoints /api/filters p50_ms', 2.0, 3.0)]
+    assert 'REGRESSION' in capsys.readouterr().out
+    assert compare(baseline, results, 0.25) == []
+
+
+def test_run_scale(tmp_path):
+    write_timeline(tmp_path / 'benchmark.json', 300)
+    result = run_scale(tmp_path / 'benchmark.json', repeat=2)
+    assert result['activities'] > 0
+    assert set(result['endpoints']) == set(ENDPOINTS)
+    assert all(np.isfinite(timing['p50_ms']) for timing in result['endpoints'].values())
@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+from country_lookup import get_country_resolver
+
+KNOWN_CITIES = [
+    ('Lisbon', 38.72, -9.14, 'Portugal'),
+    ('Porto', 41.15, -8.61, 'Portugal'),
+    ('Madrid', 40.42, -3.70, 'Spain'),
+    ('Paris', 48.86, 2.35, 'France'),
+    ('Berlin', 52.52, 13.40, 'Germany'),
+    ('Rome', 41.90, 12.50, 'Italy'),
+    ('Vatican City', 41.9029, 12.4534, 'Vatican City'),
+    ('San Marino', 43.94, 12.45, 'San Marino'),
+    ('Andorra la Vella', 42.51, 1.52, 'Andorra'),
+    ('Monaco', 43.7384, 7.4246, 'Monaco'),
+    ('Dubrovnik', 42.65, 18.09, 'Croatia'),
+    ('Athens', 37.98, 23.73, 'Greece'),
+    ('Sofia', 42.70, 23.32, 'Bulgaria'),
+    ('Tangier', 35.77, -5.80, 'Morocco'),
+    ('Ankara', 39.93, 32.86, 'Turkey'),
+    # Both sides of the Bosphorus, which the simplified Turkey outline leaves out
+    ('Istanbul, Sultanahmet', 41.01, 28.98, 'Turkey'),
+    ('Istanbul, Bakirkoy', 41.0, 28.8, 'Turkey'),
+    ('Istanbul, Besiktas', 41.04, 29.0, 'Turkey'),
+    ('Istanbul, Beykoz', 41.1, 29.05, 'Turkey'),
+    ('Istanbul, Kadikoy', 40.98, 29.03, 'Turkey'),
+]
+
+
+# Twin towns across a border, at their GeoNames coordinates; the simplified borders put
+# Freilassing in Austria, Slubice in Germany and Cesky Tesin in Poland
+BORDER_TOWNS = [
+    ('Freilassing', 47.84085, 12.98114, 'Germany'),
+    ('Salzburg', 47.79941, 13.04399, 'Austria'),
+    ('Frankfurt (Oder)', 52.34714, 14.55062, 'Germany'),
+    ('Slubice', 52.35088, 14.56065, 'Poland'),
+    ('Cieszyn', 49.75133, 18.63213, 'Poland'),
+    ('Cesky Tesin', 49.74613, 18.62613, 'Czech Republic'),
+    ('Gorizia', 45.94088, 13.62167, 'Italy'),
+    ('Nova Gorica', 45.95604, 13.64837, 'Slovenia'),
+    ('Kehl', 48.57297, 7.81523, 'Germany'),
+    ('Strasbourg', 48.58392, 7.74553, 'France'),
+    ('Valga', 57.77781, 26.04730, 'Estonia'),
+    ('Valka', 57.77520, 26.01013, 'Latvia'),
+    ('Narva', 59.37722, 28.19028, 'Estonia'),
+    ('Ivangorod', 59.37155, 28.21625, 'Russia'),
+    ('Tornio', 65.84811, 24.14662, 'Finland'),
+    ('Haparanda', 65.83549, 24.13676, 'Sweden'),
+    ('Irun', 43.33904, -1.78938, 'Spain'),
+    ('Hendaye', 43.37172, -1.77382, 'France'),
+    # Next to Vatican City, whose own place must not pull the rest of Rome in
+    ('Rome, Prati', 41.907, 12.462, 'Italy'),
+    # Above the Arctic circle, in the latitudes Russia's outline reaches past the antimeridian
+    ('Bodo', 67.28, 14.4, 'Norway'),
+    ('Narvik', 68.44, 17.43, 'Norway'),
+    ('Murmansk', 68.97, 33.08, 'Russia'),
+]
+
+# Further offshore than any coastline is snapped
+OFFSHORE = [
+    ('Atlantic off Lisbon', 38.7, -9.7),
+    ('Atlantic off Porto', 41.15, -8.85),
+    ('Ligurian Sea off Nice', 43.5, 7.4),
+    ('Mid Adriatic', 42.8, 15.5),
+    ('Balearic Sea', 40.5, 2.0),
+    ('Bay of Biscay', 45.0, -3.0),
+    ('Sea of Marmara', 40.75, 28.4),
+    ('Black Sea off Istanbul', 41.5, 29.2),
+    ('Norwegian Sea', 67.0, 8.0),
+    ('North of Iceland', 67.0, -20.0),
+]
+
+
+@pytest.fixture(scope='module')
+def resolver():
+    return get_country_resolver()
+
+
+@pytest.mark.parametrize('city, lat, lng, country', KNOWN_CITIES, ids=[city[0] for city in KNOWN_CITIES])
+def test_known_cities(resolver, city, lat, lng, country):
+    assert resolver.resolve([lat], [lng])[0] == country
+
+
+@pytest.mark.parametrize('town, lat, lng, country', BORDER_TOWNS, ids=[town[0] for town in BORDER_TOWNS])
+def test_border_towns(resolver, town, lat, lng, country):
+    assert resolver.resolve([lat], [lng])[0] == country
+
+
+@pytest.mark.parametrize('place, lat, lng', OFFSHORE, ids=[place[0] for place in OFFSHORE])
+def test_offshore(resolver, place, lat, lng):
+    assert resolver.resolve([lat], [lng])[0] is None
+
+
+def test_coast_snapping(resolver):
+    # Cascais, Venice and Copenhagen fall just outside the simplified coastlines
+    assert list(resolver.resolve([38.6916, 45.4408, 55.6761], [-9.4215, 12.3155, 12.5683])) == ['Portugal', 'Italy', 'Denmark']
+
+
+def test_batch_matches_single_points(resolver):
+    points = KNOWN_CITIES + BORDER_TOWNS
+    lats = np.array([point[1] for point in points])
+    lngs = np.array([point[2] for point in points])
+    assert list(resolver.resolve(lats, lngs)) == [point[3] for point in points]
+
+
+def test_unresolvable_points(resolver):
+    # Open Atlantic, missing coordinates
+    result = resolver.resolve([45.0, np.nan, 40.0], [-30.0, 10.0, np.nan])
+    assert list(result) == [None, None, None]
+
+
+def test_codes(resolver):
+    assert list(resolver.resolve_codes([38.72, 41.01], [-9.14, 28.98])) == ['PT', 'TR']
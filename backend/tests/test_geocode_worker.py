@@ -0,0 +1,90 @@
+import threading
+
+import numpy as np
+import pytest
+
+from geocode_worker import GeocodeWorkerPool
+from geocoding import OfflineGeocoder, ReverseGeocoder
+
+# Lisbon, Porto, and Lisbon again a few metres away
+LATS = [38.7223, 41.1496, 38.72231]
+LNGS = [-9.1393, -8.6110, -9.13931]
+START_TIMES = [1, 2, 3]
+
+
+class SlowOnline:
+    """An online backend that answers only once the test lets it"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def reverse(self, lat, lng):
+        self.calls.append((lat, lng))
+        self.release.wait(5)
+        return {'name': 'Online', 'city': 'Online city', 'country': '', 'country_code': '', 'state': '',
+                'display_name': 'Online'}
+
+
+@pytest.fixture(scope='module')
+def offline():
+    return OfflineGeocoder()
+
+
+def collect():
+    names, pending = {}, {}
+
+    def on_update(rows, labels, flags):
+        for row, label, flag in zip(rows, labels, flags):
+            names[row], pending[row] = label, flag
+    return names, pending, on_update
+
+
+def test_offline_names_before_start_returns(offline):
+    pool = GeocodeWorkerPool(ReverseGeocoder(offline=offline))
+    names, pending, on_update = collect()
+    pool.start(LATS, LNGS, START_TIMES, on_update)
+
+    assert names == {0: 'Lisbon', 1: 'Porto', 2: 'Lisbon'}
+    assert not any(pending.values())
+    # Nothing is left for background threads without an online backend
+    assert pool.status()['workers'] == 0 and pool.status()['progress'] == 1.0
+    assert pool.lookup(38.7223, -9.1393) == (offline.reverse(38.7223, -9.1393), False)
+
+
+def test_lookup_of_a_new_point_is_named_offline(offline):
+    pool = GeocodeWorkerPool(ReverseGeocoder(offline=offline))
+    location, pending = pool.lookup(48.8566, 2.3522)
+    assert location['city'] == 'Paris' and not pending
+
+
+def test_online_refines_in_background(offline):
+    online = SlowOnline()
+    pool = GeocodeWorkerPool(ReverseGeocoder(offline=offline, online=online), workers=1)
+    names, pending, on_update = collect()
+    try:
+        pool.start(LATS, LNGS, START_TIMES, on_update)
+        # Offline names straight away, pending their online answer
+        assert names == {0: 'Lisbon', 1: 'Porto', 2: 'Lisbon'}
+        assert all(pending.values())
+        location, is_pending = pool.lookup(41.1496, -8.6110)
+        assert location['city'] == 'Porto' and is_pending
+
+        online.release.set()
+        pool._queue.join()
+        assert set(names.values()) == {'Online city'}
+        assert not any(pending.values())
+        assert pool.lookup(41.1496, -8.6110)[1] is False
+    finally:
+        online.release.set()
+        pool.stop()
+
+
+def test_restart_reuses_names(offline):
+    pool = GeocodeWorkerPool(ReverseGeocoder(offline=offline))
+    pool.start(LATS, LNGS, START_TIMES, lambda rows, labels, flags: None)
+    names, pending, on_update = collect()
+    # A new snapshot with one more stop, the old ones at other rows
+    pool.start(np.array(LATS[:2] + [48.8566]), np.array(LNGS[:2] + [2.3522]), [3, 2, 1], on_update)
+    assert names == {0: 'Lisbon', 1: 'Porto', 2: 'Paris'}
+    assert not any(pending.values())
@@ -0,0 +1,86 @@
+import math
+import socket
+
+import numpy as np
+import pytest
+
+import geocoding
+from geocoding import OfflineGeocoder, ReverseGeocoder, create_geocoder
+
+FIELDS = {'name', 'city', 'country', 'country_code', 'state', 'display_name'}
+
+KNOWN_PLACES = [
+    (38.7223, -9.1393, 'Lisbon', 'Portugal', 'PT'),
+    (48.8566, 2.3522, 'Paris', 'France', 'FR'),
+    (52.52, 13.405, 'Mitte', 'Germany', 'DE'),
+    (43.7384, 7.4246, 'Monte-Carlo', 'Monaco', 'MC'),
+    (41.01, 28.98, 'Eminoenue', 'Turkey', 'TR'),
+]
+
+
+@pytest.fixture(autouse=True)
+def no_network(monkeypatch):
+    def refuse(*args, **kwargs):
+        raise AssertionError('The offline geocoder must not use the network')
+    monkeypatch.setattr(socket.socket, 'connect', refuse)
+    monkeypatch.setattr(socket, 'create_connection', refuse)
+
+
+@pytest.fixture(scope='module')
+def geocoder():
+    return OfflineGeocoder()
+
+
+@pytest.mark.parametrize('lat, lng, city, country, code', KNOWN_PLACES, ids=[place[2] for place in KNOWN_PLACES])
+def test_known_places(geocoder, lat, lng, city, country, code):
+    location = geocoder.reverse(lat, lng)
+    assert location['city'] == city
+    assert location['country'] == country
+    assert location['country_code'] == code
+    assert location['name'].startswith(city)
+
+
+def test_reverse_and_batch_agree(geocoder):
+    lats = [place[0] for place in KNOWN_PLACES] + [45.0]
+    lngs = [place[1] for place in KNOWN_PLACES] + [-30.0]
+    batch = geocoder.reverse_batch(lats, lngs)
+    assert len(batch) == len(lats)
+    for lat, lng, location in zip(lats, lngs, batch):
+        assert set(location) == FIELDS
+        assert geocoder.reverse(lat, lng) == location
+
+
+def test_point_far_from_any_place(geocoder):
+    # Mid-Atlantic: no country and no place in range
+    location = geocoder.reverse(45.0, -30.0)
+    assert set(location) == FIELDS
+    assert location['city'] == '' and location['country'] == ''
+
+
+def test_missing_coordinates(geocoder):
+    assert geocoder.reverse(math.nan, 10.0) is None
+    results = geocoder.reverse_batch([np.nan, 38.7223, 40.0], [1.0, -9.1393, np.nan])
+    assert results[0] is None and results[2] is None
+    assert results[1]['city'] == 'Lisbon'
+
+
+def test_empty_batch(geocoder):
+    assert geocoder.reverse_batch([], []) == []
+    assert geocoder.reverse_batch(np.empty(0), np.empty(0)) == []
+
+
+def test_offline_backend_never_builds_nominatim(monkeypatch, geocoder):
+    def forbidden(*args, **kwargs):
+        raise AssertionError('Nominatim constructed for the offline backend')
+    monkeypatch.setattr(geocoding, 'NominatimGeocoder', forbidden)
+    monkeypatch.setenv('GEOCODER_BACKEND', 'offline')
+
+    reverse_geocoder = create_geocoder()
+    assert reverse_geocoder.online is None
+    assert reverse_geocoder.cache_stats() is None
+    assert reverse_geocoder.prewarm([38.7223], [-9.1393]) == []
+
+    # Looked up through the wrapper exactly as the bare offline geocoder answers
+    reverse_geocoder = ReverseGeocoder(offline=geocoder)
+    assert reverse_geocoder.reverse(38.7223, -9.1393) == geocoder.reverse(38.7223, -9.1393)
+    assert reverse_geocoder.reverse_batch([38.7223], [-9.1393]) == geocoder.reverse_batch([38.7223], [-9.1393])
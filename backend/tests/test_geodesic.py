@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from geodesic import MAX_SPEED_KMH, MIN_PLAUSIBILITY, haversine_km, speed_kmh, step_km
+from geocoding import EARTH_RADIUS_KM
+
+
+def test_haversine_known_distances():
+    # Paris to London, and a quarter of a meridian
+    assert haversine_km(48.8566, 2.3522, 51.5074, -0.1278) == pytest.approx(343.5, abs=0.5)
+    assert haversine_km(0, 0, 90, 0) == pytest.approx(np.pi / 2 * EARTH_RADIUS_KM)
+    assert haversine_km(0, 0, 0, 180) == pytest.approx(np.pi * EARTH_RADIUS_KM)
+    # Across the antimeridian the short way round
+    assert haversine_km(65, 179.5, 65, -179.5) == pytest.approx(haversine_km(65, 0, 65, 1))
+    distances = haversine_km([10, np.nan], [10, 0], [10, 1], [10.5, 1])
+    assert distances[0] == pytest.approx(54.7, abs=0.1) and np.isnan(distances[1])
+
+
+def test_steps_stop_at_path_ends():
+    lats = np.array([0.0, 0.0, 0.0, 1.0, 1.0])
+    lngs = np.array([0.0, 1.0, 2.0, 0.0, 0.0])
+    steps = step_km(lats, lngs, np.array([0, 3, 3, 5]))
+    one_degree = haversine_km(0, 0, 0, 1)
+    np.testing.assert_allclose(steps, [one_degree, one_degree, 0, 0, 0])
+
+
+def test_speed():
+    np.testing.assert_array_equal(speed_kmh(np.array([10.0, 10.0, 0.0, 0.0]), np.array([2.0, 0.0, 0.0, 1.0])),
+                                  [5.0, np.inf, 0.0, 0.0])
+
+
+def test_flights_recorded_as_drives_are_outliers(outlier_processor):
+    snapshot = outlier_processor.snapshot
+    activities, kinematics = snapshot.activities, snapshot.kinematics
+    df = snapshot.frames['activities']
+    travelled = np.fmax(df['distanceMeters'].fillna(0) / 1000, kinematics.straight_km)
+    speed = travelled / ((df['endTime'] - df['startTime']).dt.total_seconds() / 3600)
+    limits = df['topCandidate.type'].map(MAX_SPEED_KMH)
+    np.testing.assert_allclose(kinematics.speed_kmh, speed)
+    np.testing.assert_array_equal(kinematics.outlier, speed > limits / MIN_PLAUSIBILITY)
+    # The synthetic flights are recorded as car rides
+    assert set(activities.activity_types(np.flatnonzero(kinematics.outlier))) == {'IN_PASSENGER_VEHICLE'}
+    assert np.all((kinematics.plausibility > 0) & (kinematics.plausibility <= 1))
+
+
+def test_path_lengths(outlier_processor):
+    snapshot = outlier_processor.snapshot
+    paths, kinematics = snapshot.paths, snapshot.kinematics
+    for path in range(0, len(paths), 25):
+        lo, hi = paths.offsets[path], paths.offsets[path + 1]
+        expected = haversine_km(paths.lat[lo:hi - 1], paths.lng[lo:hi - 1], paths.lat[lo + 1:hi],
+                                paths.lng[lo + 1:hi]).sum()
+        assert kinematics.path_km[path] == pytest.approx(expected)
+
+
+def test_outliers_route(client, app_module, monkeypatch, outlier_processor):
+    monkeypatch.setattr(app_module, 'timeline_processor', outlier_processor)
+    body = client.get('/api/stats/outliers?limit=5').get_json()
+    assert body['total'] == outlier_processor.snapshot.kinematics.outlier.sum()
+    scores = [outlier['plausibility'] for outlier in body['outliers']]
+    assert len(scores) == 5 and scores == sorted(scores)
+    assert all(score < MIN_PLAUSIBILITY for score in scores)
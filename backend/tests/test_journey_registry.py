@@ -0,0 +1,166 @@
+import shutil
+import threading
+import time
+
+import pytest
+
+from journey_registry import JourneyRegistry, valid_journey_id
+
+
+class _Snapshot:
+    def __init__(self, nbytes):
+        self._nbytes = nbytes
+
+    def nbytes(self):
+        return self._nbytes
+
+
+class _Processor:
+    def __init__(self, settings, nbytes):
+        self.id = settings['id']
+        self.snapshot = _Snapshot(nbytes)
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _registry(tmp_path, ids=('a', 'b', 'c'), nbytes=100, delay=0, **limits):
+    loads = []
+
+    def factory(settings):
+        loads.append(settings['id'])
+        time.sleep(delay)
+        return _Processor(settings, nbytes)
+
+    registry = JourneyRegistry(factory, journeys_dir=tmp_path / 'journeys', reserved={'default', 'health'}, **limits)
+    for journey_id in ids:
+        registry.create(journey_id)
+    return registry, loads
+
+
+def test_journey_ids():
+    assert valid_journey_id('van-2024_spring')
+    for journey_id in ('', None, 'Upper', '-leading', 'with space', '../etc', 'a' * 65):
+        assert not valid_journey_id(journey_id)
+
+
+def test_unknown_invalid_and_reserved_ids(tmp_path):
+    registry, loads = _registry(tmp_path)
+    for journey_id in ('missing', '../journeys', 'default', 'health'):
+        assert registry.get(journey_id) is None
+    for journey_id in ('default', 'health', 'Bad!'):
+        with pytest.raises(ValueError):
+            registry.create(journey_id)
+    assert loads == []
+
+
+def test_create_keeps_the_start_date(tmp_path):
+    registry, _ = _registry(tmp_path, ids=())
+    settings = registry.create('trip', name='Trip', start_date='2024-05-01')
+    assert (settings['name'], settings['start_date']) == ('Trip', '2024-05-01')
+    assert registry.create('trip') == settings
+    with pytest.raises(ValueError):
+        registry.create('trip', start_date='2024-06-01')
+    assert [journey['id'] for journey in registry.journeys()] == ['trip']
+
+
+def test_concurrent_first_requests_load_once(tmp_path):
+    registry, loads = _registry(tmp_path, delay=0.05)
+    factory, loading = registry.factory, threading.Barrier(2, timeout=5)
+
+    def factory_waiting_for_the_other(settings):
+        # Breaks with an error if the two journeys were loaded one after the other
+        loading.wait()
+        return factory(settings)
+
+    registry.factory = factory_waiting_for_the_other
+    barrier = threading.Barrier(16)
+    results = []
+
+    def request(journey_id):
+        barrier.wait()
+        results.append(registry.get(journey_id))
+
+    threads = [threading.Thread(target=request, args=('ab'[i % 2],)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(loads) == ['a', 'b']
+    assert len({id(processor) for processor in results}) == 2
+    assert not loading.broken
+    assert registry.status()['loads'] == 2
+
+
+def test_failed_load_is_retried(tmp_path):
+    registry, loads = _registry(tmp_path)
+    factory, failures = registry.factory, []
+
+    def flaky(settings):
+        if not failures:
+            failures.append(settings['id'])
+            raise OSError('disk full')
+        return factory(settings)
+
+    registry.factory = flaky
+    with pytest.raises(OSError):
+        registry.get('a')
+    assert registry.get('a').id == 'a'
+    assert loads == ['a']
+
+
+def test_least_recently_used_is_evicted_by_count(tmp_path):
+    registry, loads = _registry(tmp_path, max_loaded=2)
+    a, b = registry.get('a'), registry.get('b')
+    registry.get('a')
+    c = registry.get('c')
+    assert registry.loaded() == ['a', 'c']
+    assert b.closed and not a.closed and not c.closed
+    # peek neither loads nor counts as use
+    assert registry.peek('b') is None
+    registry.peek('a')
+    registry.get('b')
+    assert registry.loaded() == ['c', 'b']
+    assert loads == ['a', 'b', 'c', 'b']
+    assert registry.status()['evictions'] == 2
+
+
+def test_evicted_by_memory_but_newest_stays(tmp_path):
+    registry, _ = _registry(tmp_path, nbytes=100, max_bytes=250)
+    registry.get('a')
+    registry.get('b')
+    registry.get('c')
+    assert registry.loaded() == ['b', 'c']
+    assert registry.status()['loaded_bytes'] == 200
+
+    # A journey larger than the limit on its own is still served
+    registry.max_bytes = 50
+    registry.get('a')
+    assert registry.loaded() == ['a']
+
+
+@pytest.fixture
+def journey_client(app_module, client, timeline_export, monkeypatch, tmp_path):
+    registry = JourneyRegistry(app_module._load_journey, journeys_dir=tmp_path / 'journeys',
+                               reserved=app_module.journeys.reserved)
+    monkeypatch.setattr(app_module, 'journeys', registry)
+    shutil.copy(timeline_export, registry.create('trip')['json_path'])
+    yield client
+    for journey_id in registry.loaded():
+        registry.peek(journey_id).close()
+
+
+def test_prefixed_routes(journey_client, app_module):
+    default = journey_client.get('/api/filters').get_json()
+    assert journey_client.get('/api/trip/filters').get_json() == default
+    assert journey_client.get('/api/default/filters').get_json() == default
+    assert app_module.journeys.loaded() == ['trip']
+    assert journey_client.get('/api/trip/dashboard/stats').status_code == 200
+    assert journey_client.get('/api/missing/filters').status_code == 404
+    assert journey_client.get('/api/Trip/filters').status_code == 404
+
+    listing = journey_client.get('/api/journeys').get_json()
+    assert listing['journeys'] == [{'id': 'trip', 'name': 'trip', 'start_date': listing['journeys'][0]['start_date'],
+                                    'loaded': True}]
+    assert (listing['default'], listing['loaded']) == ('default', 1)
@@ -0,0 +1,108 @@
+import re
+import threading
+import time
+
+import pytest
+
+from metrics import Counter, Gauge, Histogram, Registry, SamplingProfiler, STAGE_SECONDS, stage
+
+
+def _sample(text, name, labels=''):
+    match = re.search(rf'^{re.escape(name + labels)} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_counter_and_gauge_render_in_prometheus_text():
+    registry = Registry()
+    requests = registry.register(Counter('requests_total', 'Requests', ('route', 'status')))
+    requests.inc('/a', '200')
+    requests.inc('/a', '200', amount=2)
+    requests.inc('/b "quoted"\n', '500')
+    registry.register(Gauge('queue', 'Waiting jobs', (), lambda: {(): 4}))
+    registry.register(Gauge('broken', 'Fails to read', (), lambda: 1 / 0))
+    assert registry.render() == (
+        '# HELP requests_total Requests\n'
+        '# TYPE requests_total counter\n'
+        'requests_total{route="/a",status="200"} 3\n'
+        'requests_total{route="/b \\"quoted\\"\\n",status="500"} 1\n'
+        '# HELP queue Waiting jobs\n'
+        '# TYPE queue gauge\n'
+        'queue 4\n'
+        '# HELP broken Fails to read\n'
+        '# TYPE broken gauge\n'
+    )
+    # Registering a name again returns the metric already registered
+    assert registry.register(Counter('requests_total', 'Requests', ('route', 'status'))) is requests
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.register(Histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1)))
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value, '/a')
+    text = registry.render()
+    assert _sample(text, 'latency_seconds_bucket', '{route="/a",le="0.1"}') == 2
+    assert _sample(text, 'latency_seconds_bucket', '{route="/a",le="1"}') == 3
+    assert _sample(text, 'latency_seconds_bucket', '{route="/a",le="+Inf"}') == 4
+    assert _sample(text, 'latency_seconds_count', '{route="/a"}') == 4
+    assert _sample(text, 'latency_seconds_sum', '{route="/a"}') == pytest.approx(3.65)
+
+
+def test_histogram_counts_every_observation_from_several_threads():
+    latency = Histogram('latency_seconds', 'Latency')
+    threads = [threading.Thread(target=lambda: [latency.observe(0.01) for _ in range(1000)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert dict((name, value) for name, _, value in latency.samples())['latency_seconds_count'] == 8000
+
+
+def test_stage_is_timed_when_it_raises():
+    def count():
+        return sum(value for name, labels, value in STAGE_SECONDS.samples()
+                   if name.endswith('_count') and 'test.failing' in labels)
+
+    before = count()
+    with pytest.raises(ValueError):
+        with stage('test.failing'):
+            raise ValueError
+    assert count() == before + 1
+
+
+def test_sampling_profiler_records_the_target_thread():
+    def spin():
+        deadline = time.perf_counter() + 0.1
+        while time.perf_counter() < deadline:
+            pass
+
+    profiler = SamplingProfiler(interval=0.002).start()
+    spin()
+    profiler.stop()
+    assert profiler.samples > 0
+    assert 'test_metrics.py:spin' in profiler.folded()
+    assert sum(int(line.rsplit(' ', 1)[1]) for line in profiler.folded().splitlines()) == profiler.samples
+
+
+def test_requests_are_counted_by_route_and_status(client):
+    def requests(status):
+        text = client.get('/api/metrics').get_data(as_text=True)
+        return _sample(text, 'vangon_http_requests_total', f'{{route="/api/filters",method="GET",status="{status}"}}')
+
+    before = requests(200)
+    client.get('/api/filters')
+    client.get('/api/filters')
+    text = client.get('/api/metrics').get_data(as_text=True)
+    assert requests(200) == before + 2
+    assert '# TYPE vangon_http_request_duration_seconds histogram' in text
+    assert _sample(text, 'vangon_dataset_rows', '{store="activities"}') > 0
+    assert 'vangon_stage_duration_seconds_count{stage="snapshot.stores"}' in text
+
+
+def test_profiled_request_returns_folded_stacks(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'PROFILE_REQUESTS', True)
+    response = client.get('/api/filters?profile=1')
+    assert response.mimetype == 'text/plain'
+    assert response.headers['X-Profile-Status'] == '200'
+    assert int(response.headers['X-Profile-Samples']) >= 0
+    assert client.get('/api/filters?profile=maybe').status_code == 400
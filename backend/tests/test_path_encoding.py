@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from path_encoding import PRECISION, encode_polylines, pack_paths
+
+
+def _decode(polyline):
+    """Decode a Google encoded polyline into (lat, lng) pairs"""
+    values, value, shift = [], 0, 0
+    for char in polyline:
+        chunk = ord(char) - 63
+        value |= (chunk & 0x1f) << shift
+        shift += 5
+        if chunk < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    points = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0)
+    return points / 10 ** PRECISION
+
+
+def _unpack(buffer):
+    data = np.frombuffer(buffer, dtype='<i4')
+    paths, points = data[:2]
+    offsets = data[2:3 + paths]
+    deltas = data[3 + paths:].reshape(points, 2)
+    return offsets, np.cumsum(deltas, axis=0) / 10 ** PRECISION
+
+
+def test_reference_vector():
+    # The example in Google's encoded polyline algorithm documentation
+    lat, lng = [38.5, 40.7, 43.252], [-120.2, -120.95, -126.453]
+    assert encode_polylines(lat, lng, [0, 3]) == ['_p~iF~ps|U_ulLnnqC_mqNvxq`@']
+
+
+def test_each_path_starts_from_zero():
+    lat, lng = [38.5, 40.7, 43.252], [-120.2, -120.95, -126.453]
+    # The second path is encoded as if it were on its own
+    assert encode_polylines(lat, lng, [0, 1, 3]) == ['_p~iF~ps|U', encode_polylines(lat[1:], lng[1:], [0, 2])[0]]
+    # An empty range encodes as an empty string
+    assert encode_polylines(lat, lng, [0, 0, 3]) == ['', '_p~iF~ps|U_ulLnnqC_mqNvxq`@']
+
+
+def test_round_trip():
+    rng = np.random.default_rng(3)
+    lat = rng.uniform(-89, 89, 500)
+    lng = rng.uniform(-179.9, 179.9, 500)
+    offsets = np.array([0, 1, 1, 120, 499, 500])
+    polylines = encode_polylines(lat, lng, offsets)
+    for lo, hi, polyline in zip(offsets[:-1], offsets[1:], polylines):
+        decoded = _decode(polyline)
+        assert len(decoded) == hi - lo
+        if hi > lo:
+            np.testing.assert_allclose(decoded, np.column_stack((lat[lo:hi], lng[lo:hi])), atol=0.6e-5)
+
+
+def test_pack_round_trip():
+    rng = np.random.default_rng(4)
+    lat, lng = rng.uniform(-89, 89, 50), rng.uniform(-179.9, 179.9, 50)
+    offsets, points = _unpack(pack_paths(lat, lng, [10, 25, 25, 60]))
+    np.testing.assert_array_equal(offsets, [0, 15, 15, 50])
+    np.testing.assert_allclose(points, np.column_stack((lat, lng)), atol=0.6e-5)
+
+
+def test_day_endpoints_agree(client, processor):
+    days = client.get('/api/paths').get_json()['days']
+    day = max(days, key=lambda entry: entry['paths'])
+    polylines = client.get(f"/api/paths/{day['date']}").get_json()['paths']
+    assert len(polylines) == day['paths']
+    offsets, points = _unpack(client.get(f"/api/paths/{day['date']}?format=binary").get_data())
+    assert offsets[-1] == day['points']
+    for lo, hi, path in zip(offsets[:-1], offsets[1:], polylines):
+        np.testing.assert_allclose(_decode(path['polyline']), points[lo:hi], atol=1e-9)
+
+
+@pytest.mark.parametrize('day', ['2025-13-01', 'yesterday'])
+def test_malformed_day(client, day):
+    assert client.get(f'/api/paths/{day}').status_code == 400
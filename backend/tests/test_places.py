@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from places import PlaceStore, cluster_points
+from timeline_snapshot import TimelineSnapshot
+
+_METERS_PER_DEGREE = 111_320.0
+
+
+def _offsets(lat, lng, east_m, north_m):
+    """Points at the given offsets in meters from (lat, lng)"""
+    east_m, north_m = np.asarray(east_m, dtype=float), np.asarray(north_m, dtype=float)
+    return (lat + north_m / _METERS_PER_DEGREE,
+            lng + east_m / (_METERS_PER_DEGREE * np.cos(np.radians(lat))))
+
+
+@pytest.fixture(scope='module')
+def snapshot(frames):
+    return TimelineSnapshot(frames, version='test')
+
+
+def test_nearby_points_form_one_place():
+    rng = np.random.default_rng(6)
+    # Three spots in Lisbon: two 60 m apart, one 400 m away; each visited repeatedly with GPS noise
+    east = np.repeat([0, 60, 400], 20) + rng.normal(0, 5, 60)
+    north = rng.normal(0, 5, 60)
+    lats, lngs = _offsets(38.71, -9.14, east, north)
+    labels = cluster_points(lats, lngs, 100)
+    assert len(set(labels[:40])) == 1
+    assert set(labels[40:]).isdisjoint(labels[:40]) and len(set(labels[40:])) == 1
+
+
+def test_labels_follow_first_appearance():
+    lats, lngs = _offsets(60.17, 24.94, [3000, 0, 3000, 6000, 0], [0, 0, 0, 0, 0])
+    np.testing.assert_array_equal(cluster_points(lats, lngs, 100), [0, 1, 0, 2, 1])
+    assert len(cluster_points(np.empty(0), np.empty(0))) == 0
+
+
+def test_points_within_a_quarter_radius_share_a_place():
+    rng = np.random.default_rng(7)
+    # Spots across a city, each visited a few times with GPS noise
+    spots = np.repeat(rng.uniform(0, 20_000, (150, 2)), 6, axis=0) + rng.normal(0, 20, (900, 2))
+    lats, lngs = _offsets(48.85, 2.35, spots[:, 0], spots[:, 1])
+    labels = cluster_points(lats, lngs, 100)
+    y, x = lats * _METERS_PER_DEGREE, lngs * _METERS_PER_DEGREE * np.cos(np.radians(48.85))
+    close = np.argwhere(np.hypot(x[:, None] - x, y[:, None] - y) < 25)
+    assert len(close) > 900
+    assert np.all(labels[close[:, 0]] == labels[close[:, 1]])
+
+
+def test_chains_are_split():
+    # Stops every 80 m along a 3 km road are linked one to the next, but are not one place
+    lats, lngs = _offsets(43.3, 5.37, np.arange(0, 3000, 80), np.zeros(38))
+    labels = cluster_points(lats, lngs, 100)
+    assert len(set(labels)) > 10
+
+
+def test_campsites_are_one_place_each(snapshot):
+    visits, places = snapshot.frames['visits'], snapshot.places
+    place = pd.Series(places.visit_place, index=visits.index)
+    # The synthetic trip goes back to the same campsite (placeId) when it returns to a town
+    campsites = visits['placeId'].str.startswith('ChIJsynth')
+    assert (place[campsites].groupby(visits['placeId'][campsites]).nunique() == 1).all()
+    assert place[campsites].groupby(visits['placeId'][campsites]).size().max() > 1
+
+
+def test_place_totals(snapshot):
+    visits, places = snapshot.visits, snapshot.places
+    located = places.visit_place >= 0
+    assert places.visit_count.sum() == located.sum()
+    np.testing.assert_allclose(places.dwell_hours.sum(), visits.duration_hours[located].sum())
+    for place in range(0, len(places), max(len(places) // 20, 1)):
+        rows = np.flatnonzero(places.visit_place == place)
+        assert places.first_start[place] == visits.start[rows].min()
+        assert places.last_end[place] == visits.end[rows].max()
+        assert places.lat[place] == pytest.approx(visits.lat[rows].mean())
+    # Places are numbered by their first visit
+    assert np.all(np.diff(places.first_start) >= 0)
+
+
+def test_stays_merge_consecutive_visits(snapshot):
+    places = snapshot.places
+    visit_place = places.visit_place[places.visit_place >= 0]
+    assert places.stay_visits.sum() == len(visit_place)
+    assert np.all(places.stay_place[1:] != places.stay_place[:-1])
+    np.testing.assert_array_equal(np.repeat(places.stay_place, places.stay_visits), visit_place)
+    np.testing.assert_array_equal(np.bincount(places.stay_place, minlength=len(places)), places.stay_count)
+
+
+def test_empty_store():
+    visits = TimelineSnapshot().visits
+    assert len(PlaceStore(visits)) == 0
+
+
+def test_place_routes(client, processor):
+    places = processor.snapshot.places
+    body = client.get('/api/places?sort=visits&limit=5').get_json()
+    assert body['total'] == len(places)
+    counts = [place['visit_count'] for place in body['places']]
+    assert counts == sorted(places.visit_count.tolist(), reverse=True)[:5]
+    stops = client.get('/api/recent-stops').get_json()
+    assert stops[0]['start_time'] >= stops[-1]['start_time']
+    assert sum(stop['visit_count'] for stop in stops) >= len(stops)
+    assert client.get('/api/places?sort=name').status_code == 400
@@ -0,0 +1,70 @@
+import json
+
+import numpy as np
+import orjson
+import pytest
+
+from plotly_figure import figure_json, mapbox_line_traces, plotly_template
+from timeline_snapshot import TimelineSnapshot
+
+COLORS = {'WALKING': '#ff7f0e', 'CYCLING': '#2ca02c'}
+
+
+@pytest.fixture(scope='module')
+def activities(frames):
+    return TimelineSnapshot(frames, version='test').activities
+
+
+def _full_mask(count):
+    return np.ones((count, 3), dtype=bool)
+
+
+def test_one_trace_per_type_in_order_of_appearance(activities):
+    positions = np.arange(200)
+    traces = mapbox_line_traces(activities, positions, _full_mask(len(positions)), COLORS)
+    codes = activities.type_codes[positions]
+    first_seen = [activities.types[code] for code in dict.fromkeys(codes.tolist())]
+    assert [trace['name'] for trace in traces] == [name.replace('_', ' ') for name in first_seen]
+    assert sum(len(trace['lat']) for trace in traces) == 3 * len(positions)
+    walking = traces[first_seen.index('WALKING')]
+    assert walking['line'] == {'color': '#ff7f0e', 'width': 3}
+
+
+def test_masked_vertices_are_dropped(activities):
+    positions = np.arange(10)
+    mask = _full_mask(len(positions))
+    # The first activity is drawn as a continuation of the one before: no start point, no break
+    mask[1, 0] = False
+    mask[0, 2] = False
+    traces = mapbox_line_traces(activities, positions, mask, COLORS)
+    assert sum(len(trace['lat']) for trace in traces) == mask.sum()
+    assert all(len(trace['lat']) == len(trace['lon']) == len(trace['text']) for trace in traces)
+
+
+def test_figure_json_writes_nan_as_null():
+    body = figure_json({'data': [{'lat': np.array([1.5, np.nan])}]})
+    assert orjson.loads(body) == {'data': [{'lat': [1.5, None]}]}
+
+
+def test_matches_plotly_figure(activities):
+    go = pytest.importorskip('plotly.graph_objects')
+    positions = np.arange(120)
+    traces = mapbox_line_traces(activities, positions, _full_mask(len(positions)), COLORS)
+    layout = {'height': 600, 'template': plotly_template()}
+
+    # The figure as it was built with plotly before
+    figure = go.Figure()
+    for name in dict.fromkeys(activities.types[activities.type_codes[positions]].tolist()):
+        lats, lons, text = [], [], []
+        for row in positions[activities.types[activities.type_codes[positions]] == name]:
+            hover = (f"{name}<br>Distance: {activities.distance[row]:.0f}m<br>"
+                     f"Date: {np.datetime_as_string(activities.start[row].astype('datetime64[ns]'), unit='D')}")
+            lats += [activities.start_lat[row], activities.end_lat[row], None]
+            lons += [activities.start_lng[row], activities.end_lng[row], None]
+            text += [hover, hover, None]
+        figure.add_trace(go.Scattermapbox(
+            lat=lats, lon=lons, mode='lines', line={'color': COLORS.get(name, '#636363'), 'width': 3},
+            name=name.replace('_', ' '), text=text, hovertemplate="%{text}<extra></extra>"))
+    figure.update_layout(height=600)
+
+    assert json.loads(figure_json({'data': traces, 'layout': layout})) == json.loads(figure.to_json())
@@ -0,0 +1,65 @@
+import os
+import sys
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+import processed_cache
+from processed_cache import cache_path_for, load_or_build, load_processed, read_processed
+from timeline_synth import write_timeline
+
+
+@pytest.fixture
+def export(tmp_path):
+    path = tmp_path / 'timeline.json'
+    write_timeline(path, 200)
+    return path
+
+
+def test_round_trip(tmp_path, export):
+    built = load_or_build(export, cache_dir=tmp_path / 'cache')
+    cached = load_processed(cache_path_for(export, tmp_path / 'cache'), export, processed_cache.JOURNEY_START)
+    assert cached is not None
+    for name, frame in built.items():
+        # Timestamps come back in nanoseconds and strings as objects
+        assert_frame_equal(cached[name], frame, check_dtype=False)
+
+
+def test_touched_export_is_hashed_once(tmp_path, monkeypatch, export):
+    cache_dir = tmp_path / 'cache'
+    load_or_build(export, cache_dir=cache_dir)
+    stat = os.stat(export)
+    os.utime(export, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    def no_rebuild(*args, **kwargs):
+        raise AssertionError('An export with the same content was processed again')
+    monkeypatch.setattr(processed_cache, 'build_processed', no_rebuild)
+    load_or_build(export, cache_dir=cache_dir)
+    _, meta = read_processed(cache_path_for(export, cache_dir))
+    assert meta['source']['mtime_ns'] == os.stat(export).st_mtime_ns
+
+    # The new mtime is recorded, so the next start does not hash the export again
+    def no_hash(path, chunk_size=None):
+        raise AssertionError('The export was hashed again')
+    monkeypatch.setattr(processed_cache, 'file_sha256', no_hash)
+    assert load_or_build(export, cache_dir=cache_dir) is not None
+
+
+def test_changed_export_is_reprocessed(tmp_path, export):
+    cache_dir = tmp_path / 'cache'
+    first = load_or_build(export, cache_dir=cache_dir)
+    write_timeline(export, 300)
+    assert load_processed(cache_path_for(export, cache_dir), export, processed_cache.JOURNEY_START) is None
+    assert len(load_or_build(export, cache_dir=cache_dir)['activities']) > len(first['activities'])
+
+
+def test_other_start_date_is_stale(tmp_path, export):
+    load_or_build(export, cache_dir=tmp_path / 'cache')
+    assert load_processed(cache_path_for(export, tmp_path / 'cache'), export, '2030-01-01') is None
+
+
+def test_main_prebuilds_the_served_export(tmp_path, monkeypatch, export):
+    monkeypatch.setenv('TIMELINE_JSON_PATH', str(export))
+    monkeypatch.setattr(sys, 'argv', ['processed_cache.py', '--cache-dir', str(tmp_path / 'cache')])
+    processed_cache.main()
+    assert cache_path_for(export, tmp_path / 'cache').exists()
@@ -0,0 +1,84 @@
+import gzip
+
+from flask import Flask
+
+from response_cache import GZIP_MIN_BYTES, ResponseCache
+
+_app = Flask(__name__)
+
+
+def _respond(entry, headers=None):
+    with _app.test_request_context(headers=headers or {}) as context:
+        return entry.to_response(context.request)
+
+
+def test_lru_stays_under_its_size():
+    cache = ResponseCache(max_bytes=300, compress=False)
+    for key in 'abc':
+        cache.put(key, b'x' * 100)
+    cache.get('a')
+    cache.put('d', b'x' * 100)
+    # 'b' was the least recently used
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    stats = cache.stats()
+    assert stats['bytes'] <= 300
+    assert stats['evictions'] == 1
+    assert stats['entries'] == 3
+
+
+def test_oversized_body_is_served_but_not_kept():
+    cache = ResponseCache(max_bytes=10, compress=False)
+    entry = cache.put('big', b'x' * 100)
+    assert entry.body == b'x' * 100
+    assert cache.get('big') is None
+    assert cache.stats()['bytes'] == 0
+
+
+def test_replacing_a_key_keeps_the_byte_count():
+    cache = ResponseCache(max_bytes=1000, compress=False)
+    cache.put('a', b'x' * 100)
+    cache.put('a', b'x' * 50)
+    assert cache.stats()['bytes'] == 50
+
+
+def test_matching_etag_answers_304():
+    entry = ResponseCache(compress=False).put('a', b'{"a": 1}')
+    first = _respond(entry)
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'no-cache'
+    again = _respond(entry, {'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert _respond(entry, {'If-None-Match': '"stale"'}).status_code == 200
+
+
+def test_gzip_representation_has_its_own_etag():
+    body = b'[' + b'1, ' * GZIP_MIN_BYTES + b'1]'
+    entry = ResponseCache(compress=True).put('a', body)
+    zipped = _respond(entry, {'Accept-Encoding': 'gzip'})
+    plain = _respond(entry)
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(zipped.get_data()) == plain.get_data() == body
+    assert zipped.headers['ETag'] != plain.headers['ETag']
+    assert 'Accept-Encoding' in zipped.headers['Vary']
+    # A client that stopped accepting gzip does not get a 304 for the gzipped ETag
+    assert _respond(entry, {'If-None-Match': zipped.headers['ETag']}).status_code == 200
+
+
+def test_small_bodies_are_not_compressed():
+    entry = ResponseCache(compress=True).put('a', b'{}')
+    assert entry.gzipped is None
+    assert 'Content-Encoding' not in _respond(entry, {'Accept-Encoding': 'gzip'}).headers
+
+
+def test_map_data_revalidates_until_the_data_changes(client, app_module):
+    first = client.get('/api/map/data?transport_mode=WALKING')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert client.get('/api/map/data?transport_mode=WALKING',
+                      headers={'If-None-Match': etag}).status_code == 304
+    assert app_module.response_cache.stats()['hits'] >= 1
+    # Other filters are another response
+    other = client.get('/api/map/data?transport_mode=CYCLING', headers={'If-None-Match': etag})
+    assert other.status_code == 200
+    assert other.headers['ETag'] != etag
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from route_lod import _segment_distance, dp_importance, zoom_for_bbox, zoom_tolerance_km
+from timeline_snapshot import TimelineSnapshot
+
+
+def _douglas_peucker(x, y, lo, hi, tolerance, kept):
+    """Textbook recursive Douglas-Peucker, marking the vertices it keeps"""
+    if hi - lo < 2:
+        return
+    inner = np.arange(lo + 1, hi)
+    distance = _segment_distance(x[inner], y[inner], x[lo], y[lo], x[hi], y[hi])
+    farthest = int(np.argmax(distance))
+    if distance[farthest] > tolerance:
+        kept[inner[farthest]] = True
+        _douglas_peucker(x, y, lo, inner[farthest], tolerance, kept)
+        _douglas_peucker(x, y, inner[farthest], hi, tolerance, kept)
+
+
+@pytest.fixture(scope='module')
+def snapshot(frames):
+    return TimelineSnapshot(frames, version='test')
+
+
+def _vertices(mask):
+    return int(mask[:, 0].sum() + mask[:, 1].sum())
+
+
+def test_importance_matches_douglas_peucker():
+    rng = np.random.default_rng(1)
+    x, y = np.cumsum(rng.normal(size=(2, 400)), axis=1)
+    lo, hi = np.array([0, 150, 151]), np.array([149, 150, 399])
+    importance = dp_importance(x, y, lo, hi)
+    assert np.isinf(importance[np.concatenate((lo, hi))]).all()
+    for tolerance in (0.1, 0.5, 2.0, 8.0):
+        kept = np.zeros(len(x), dtype=bool)
+        kept[lo] = kept[hi] = True
+        for first, last in zip(lo, hi):
+            _douglas_peucker(x, y, first, last, tolerance, kept)
+        np.testing.assert_array_equal(importance > tolerance, kept)
+
+
+def test_partial_importance_ranks_the_top_vertices():
+    rng = np.random.default_rng(2)
+    x, y = np.cumsum(rng.normal(size=(2, 300)), axis=1)
+    lo, hi = np.array([0]), np.array([299])
+    full = dp_importance(x, y, lo, hi)
+    partial = dp_importance(x, y, lo, hi, keep=40)
+    top = np.argsort(-full, kind='stable')[:40]
+    np.testing.assert_array_equal(partial[top], full[top])
+
+
+def test_every_run_keeps_its_endpoints(snapshot):
+    lod = snapshot.route_lod
+    # Every other week of the journey, so the selection has gaps
+    positions = np.flatnonzero((snapshot.activities.start // (7 * 86_400 * 10 ** 9)) % 2 == 0)
+    for tolerance in (0.0, 1.0, 50.0):
+        drawn, mask = lod.vertex_mask(positions, tolerance)
+        assert set(drawn) == set(positions[snapshot.activities.has_coordinates[positions]])
+        run_start, run_end = mask[:, 0], mask[:, 2]
+        # A run starts with a start point and ends with an end point and a line break
+        assert run_start[0] and run_end[-1]
+        np.testing.assert_array_equal(run_start[1:], run_end[:-1])
+        assert mask[run_end, 1].all()
+        # Runs never span a gap in the selection
+        breaks = np.flatnonzero(np.diff(drawn) != 1)
+        assert run_end[breaks].all()
+
+
+def test_higher_zoom_keeps_more(snapshot):
+    lod = snapshot.route_lod
+    positions = np.arange(len(snapshot.activities))
+    previous = None
+    for zoom in range(0, 17, 2):
+        _, mask = lod.vertex_mask(positions, zoom_tolerance_km(zoom), max_vertices=10 ** 6)
+        if previous is not None:
+            # Detail only ever grows with the zoom level
+            assert (mask[previous]).all()
+            assert mask.sum() >= previous.sum()
+        previous = mask
+    assert zoom_tolerance_km(3) > zoom_tolerance_km(4)
+
+
+def test_vertex_budget(snapshot):
+    lod = snapshot.route_lod
+    positions = np.arange(len(snapshot.activities))
+    _, unlimited = lod.vertex_mask(positions, 0.0, max_vertices=10 ** 6)
+    runs = int(unlimited[:, 0].sum())
+    budget = 2 * runs + 10
+    _, mask = lod.vertex_mask(positions, 0.0, max_vertices=budget)
+    assert _vertices(mask) <= budget
+    np.testing.assert_array_equal(mask[:, 0], unlimited[:, 0])
+
+
+def test_joined_runs_fit_the_budget(snapshot):
+    lod = snapshot.route_lod
+    activities = snapshot.activities
+    positions = np.arange(len(activities))
+    drawn, mask = lod.vertex_mask(positions, 0.0, max_vertices=30)
+    modes = np.unique(activities.type_codes[drawn])
+    assert _vertices(mask) <= max(30, 2 * len(modes))
+    for code in modes:
+        rows = np.flatnonzero(activities.type_codes[drawn] == code)
+        # Each mode's line still starts at its first leg and ends at its last
+        assert mask[rows[0], 0] and mask[rows[-1], 1] and mask[rows[-1], 2]
+
+
+def test_zoom_for_bbox():
+    assert zoom_for_bbox((-180, -85, 180, 85)) == pytest.approx(2, abs=0.01)
+    assert zoom_for_bbox((10, 50, 10.01, 50.01)) > 15
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+import shared_snapshot
+from shared_snapshot import (
+    _STORES, load_snapshot, read_arrays, remove_stale, save_snapshot, shared_path_for, write_arrays
+)
+from timeline_snapshot import TimelineSnapshot
+
+ROUTES = ('/api/map/data', '/api/map/data?transport_mode=WALKING&limit=50', '/api/map/plotly?zoom=8',
+          '/api/recent-stops', '/api/filters', '/api/paths', '/api/stats/timeseries?granularity=week',
+          '/api/stats/outliers', '/api/stops/nearest?lat=60&lng=25', '/api/dashboard/stats')
+
+
+def _assert_same_store(restored, original, skip=()):
+    for name, value in vars(original).items():
+        if name in skip:
+            continue
+        copy = getattr(restored, name)
+        if isinstance(value, dict):
+            assert value.keys() == copy.keys(), name
+            for key in value:
+                np.testing.assert_array_equal(copy[key], value[key])
+        elif isinstance(value, np.ndarray):
+            assert copy.dtype == value.dtype, name
+            np.testing.assert_array_equal(copy, value)
+        else:
+            assert copy == value, name
+
+
+def test_arrays_round_trip(tmp_path):
+    arrays = {
+        'ints': np.arange(7, dtype=np.int64),
+        'grid': np.arange(12, dtype=np.float32).reshape(3, 4),
+        'flags': np.array([True, False, True]),
+        'codes': np.array([-1, 3], dtype=np.int16),
+        'empty': np.empty(0),
+        'names': np.array(['Lisboa', 'Zürich'])
+    }
+    write_arrays(tmp_path / 'a.snapshot', arrays, {'version': 'v'})
+    mapped, meta = read_arrays(tmp_path / 'a.snapshot')
+    assert meta == {'version': 'v'}
+    for name, array in arrays.items():
+        assert mapped[name].dtype == array.dtype
+        np.testing.assert_array_equal(mapped[name], array)
+        # Views of the read-only mapping
+        assert not mapped[name].flags.writeable
+    assert mapped['grid'].ctypes.data % 64 == mapped['ints'].ctypes.data % 64
+
+
+def test_snapshot_round_trip(tmp_path, frames):
+    snapshot = TimelineSnapshot(frames, version='v1')
+    save_snapshot(tmp_path / 'v1.snapshot', snapshot)
+    mapped = load_snapshot(tmp_path / 'v1.snapshot')
+    assert mapped.version == 'v1'
+    assert mapped.frames is None
+    for name, _, skip in _STORES:
+        _assert_same_store(getattr(mapped, name), getattr(snapshot, name), skip)
+    assert mapped.route_lod.activities is mapped.activities
+    assert mapped.places.location_pending.all()
+
+
+def test_other_format_is_rejected(tmp_path, frames, monkeypatch):
+    save_snapshot(tmp_path / 'v1.snapshot', TimelineSnapshot(frames, version='v1'))
+    monkeypatch.setattr(shared_snapshot, 'SNAPSHOT_FORMAT_VERSION', shared_snapshot.SNAPSHOT_FORMAT_VERSION + 1)
+    with pytest.raises(ValueError):
+        load_snapshot(tmp_path / 'v1.snapshot')
+    (tmp_path / 'junk.snapshot').write_bytes(b'not a snapshot' * 10)
+    with pytest.raises(ValueError):
+        read_arrays(tmp_path / 'junk.snapshot')
+
+
+def test_stale_versions_are_removed(tmp_path):
+    export = tmp_path / 'timeline.json'
+    paths = [shared_path_for(export, version, tmp_path) for version in ('a', 'b+c')]
+    other = shared_path_for(tmp_path / 'other.json', 'a', tmp_path)
+    for path in paths + [other]:
+        path.write_bytes(b'')
+    remove_stale(export, paths[1], tmp_path)
+    assert [path.exists() for path in paths + [other]] == [False, True, True]
+
+
+def test_shared_processor_serves_the_same_responses(app_module, client, processor, timeline_export, tmp_path,
+                                                    monkeypatch):
+    responses = {route: client.get(route) for route in ROUTES}
+    assert all(response.status_code == 200 for response in responses.values())
+    expected = {route: response.get_data() for route, response in responses.items()}
+    shared = app_module.TimelineProcessor(timeline_export, shared=True, background=False, cache_dir=tmp_path,
+                                          additions_dir=processor.additions_dir)
+    assert shared.snapshot.frames is None
+    assert shared_path_for(timeline_export, shared.dataset_version, tmp_path).exists()
+    monkeypatch.setattr(app_module, 'timeline_processor', shared)
+    app_module.response_cache.clear()
+    for route in ROUTES:
+        assert client.get(route).get_data() == expected[route], route
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from geodesic import haversine_km
+from spatial_index import GridIndex, StopIndex
+from timeline_snapshot import TimelineSnapshot
+
+
+@pytest.fixture(scope='module')
+def snapshot(frames):
+    return TimelineSnapshot(frames, version='test')
+
+
+def _overlapping(min_lng, min_lat, max_lng, max_lat, bbox):
+    return np.flatnonzero((min_lng <= bbox[2]) & (max_lng >= bbox[0]) & (min_lat <= bbox[3]) & (max_lat >= bbox[1]))
+
+
+def test_grid_matches_a_scan():
+    rng = np.random.default_rng(5)
+    lng, lat = rng.uniform(-10, 30, 3000), rng.uniform(35, 70, 3000)
+    width, height = rng.exponential(0.3, 3000), rng.exponential(0.3, 3000)
+    # A few boxes span most of the map (flights), and some have no coordinates
+    lng[:20], width[:20] = -9, 35
+    lng[20:40] = np.nan
+    boxes = (lng, lat, lng + width, lat + height)
+    grid = GridIndex(*boxes)
+    assert len(grid.large) >= 20
+    viewports = [(5, 50, 6, 51), (-10, 35, 30, 70), (29.9, 69.9, 45, 80), (-60, -40, -50, -30), (12, 40, 12, 40)]
+    for _ in range(50):
+        corner = rng.uniform((-12, 33), (32, 72))
+        viewports.append((*corner, *(corner + rng.exponential(3, 2))))
+    for bbox in viewports:
+        np.testing.assert_array_equal(grid.query(bbox), _overlapping(*boxes, bbox))
+
+
+def test_empty_grid():
+    grid = GridIndex(np.array([np.nan]), np.array([np.nan]), np.array([np.nan]), np.array([np.nan]))
+    assert len(grid.query((-180, -90, 180, 90))) == 0
+
+
+def test_activity_grid_covers_each_line(snapshot):
+    a = snapshot.activities
+    bbox = (24.5, 59.5, 27.5, 61.0)
+    expected = _overlapping(np.fmin(a.start_lng, a.end_lng), np.fmin(a.start_lat, a.end_lat),
+                            np.fmax(a.start_lng, a.end_lng), np.fmax(a.start_lat, a.end_lat), bbox)
+    assert len(expected)
+    np.testing.assert_array_equal(snapshot.activity_grid.query(bbox), expected)
+
+
+def test_nearest_and_within_match_haversine(snapshot):
+    visits = snapshot.visits
+    index = StopIndex(visits)
+    distances = haversine_km(60.2, 24.9, visits.lat, visits.lng)
+    order = np.argsort(distances, kind='stable')
+
+    rows, found = index.nearest(60.2, 24.9, 15)
+    np.testing.assert_allclose(found, distances[order[:15]], rtol=1e-9)
+    np.testing.assert_allclose(distances[rows], found, rtol=1e-9)
+
+    rows, found = index.within(60.2, 24.9, 50)
+    assert sorted(rows.tolist()) == sorted(np.flatnonzero(distances <= 50).tolist())
+    assert np.all(np.diff(found) >= 0)
+    assert len(index.nearest(0, 0, 10 ** 6)[0]) == len(index)
+
+
+def test_stop_routes(client):
+    nearest = client.get('/api/stops/nearest?lat=60.2&lng=24.9&k=5').get_json()
+    assert len(nearest) == 5
+    within = client.get('/api/stops/within?lat=60.2&lng=24.9&radius_km=50&limit=3').get_json()
+    assert len(within['stops']) == min(3, within['total'])
+    in_view = client.get('/api/stops?bbox=20,55,35,70&limit=4').get_json()
+    assert len(in_view['stops']) == min(4, in_view['total'])
+    for bad in ('/api/stops', '/api/stops?bbox=1,2,3', '/api/stops/nearest?lat=95&lng=0',
+                '/api/stops/nearest?lat=1&lng=2&k=1000', '/api/stops/within?lat=1&lng=2&radius_km=-1'):
+        assert client.get(bad).status_code == 400, bad
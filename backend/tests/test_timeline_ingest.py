@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from processed_cache import build_processed
+from timeline_ingest import (
+    _segment_keys, addition_paths, apply_additions, dataset_version, drop_known, ingest_export, segment_count
+)
+from timeline_synth import write_timeline
+
+
+@pytest.fixture(scope='module')
+def base_export(tmp_path_factory):
+    """The first 600 segments of ``timeline_export``: the synthetic trip is the same for a given seed"""
+    path = tmp_path_factory.mktemp('base') / 'timeline.json'
+    write_timeline(path, 600)
+    return path
+
+
+@pytest.fixture(scope='module')
+def base(base_export):
+    return build_processed(base_export)
+
+
+def _keys(frames, name):
+    return sorted(_segment_keys(frames[name]).tolist())
+
+
+def _assert_same_segments(frames, expected):
+    for name in ('activities', 'visits', 'paths'):
+        assert _keys(frames, name) == _keys(expected, name)
+    assert len(frames['path_points']) == len(expected['path_points'])
+
+
+def test_overlapping_upload_adds_only_new_segments(tmp_path, base, frames, timeline_export):
+    new = ingest_export(timeline_export, base, tmp_path)
+    assert segment_count(new) == segment_count(frames) - segment_count(base)
+    assert len(addition_paths(tmp_path)) == 1
+    merged = apply_additions(base, tmp_path)
+    _assert_same_segments(merged, frames)
+    assert merged['activities']['startTime'].is_monotonic_increasing
+    # The new segments had their countries resolved when they were ingested
+    assert merged['activities']['start_country'].notna().sum() == frames['activities']['start_country'].notna().sum()
+
+
+def test_repeated_upload_adds_nothing(tmp_path, base, timeline_export):
+    ingest_export(timeline_export, base, tmp_path)
+    merged = apply_additions(base, tmp_path)
+    assert ingest_export(timeline_export, merged, tmp_path) is None
+    assert len(addition_paths(tmp_path)) == 1
+    # An addition whose segments the export already has changes nothing on the next load
+    _assert_same_segments(apply_additions(merged, tmp_path), merged)
+
+
+def test_additions_are_numbered_in_order(tmp_path, base, base_export, timeline_export):
+    empty = {name: df.iloc[:0] for name, df in base.items()}
+    versions = {dataset_version('v', tmp_path)}
+    ingest_export(base_export, empty, tmp_path)
+    versions.add(dataset_version('v', tmp_path))
+    ingest_export(timeline_export, apply_additions(empty, tmp_path), tmp_path)
+    versions.add(dataset_version('v', tmp_path))
+    assert [path.name[:6] for path in addition_paths(tmp_path)] == ['000001', '000002']
+    assert len(versions) == 3
+
+
+def test_repeats_inside_an_upload_are_kept_once(base):
+    doubled = {name: pd.concat([df, df], ignore_index=True) for name, df in base.items()}
+    new = drop_known({}, doubled)
+    for name in ('activities', 'visits', 'paths'):
+        assert len(new[name]) == len(base[name])
+    # Each path keeps the points of its first copy
+    np.testing.assert_array_equal(new['path_points']['latitude'], base['path_points']['latitude'])
+
+
+def test_same_times_of_another_kind_are_not_known(base):
+    # A visit with the times of a known activity is still new
+    upload = dict(base, visits=base['activities'][['startTime', 'endTime']].assign(latitude=0.0, longitude=0.0))
+    assert len(drop_known({'activities': base['activities']}, upload)['visits']) == len(base['activities'])
+
+
+def test_processor_ingests_and_reloads(app_module, tmp_path, base_export, timeline_export, frames):
+    def processor():
+        return app_module.TimelineProcessor(base_export, background=False, cache_dir=tmp_path / 'cache',
+                                            additions_dir=tmp_path / 'additions')
+    first = processor()
+    before = first.dataset_version
+    loaded = segment_count(first.snapshot.frames)
+    assert first.ingest(timeline_export) == segment_count(frames) - loaded
+    assert first.dataset_version != before
+    assert len(first.snapshot.activities) == len(frames['activities'])
+    # A restart merges the saved addition back in
+    restarted = processor()
+    assert restarted.dataset_version == first.dataset_version
+    _assert_same_segments(restarted.snapshot.frames, frames)
+    assert first.ingest(timeline_export) == 0
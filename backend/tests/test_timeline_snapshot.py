@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+from timeline_snapshot import TimelineSnapshot
+from timeline_synth import write_timeline
+
+
+@pytest.fixture
+def make_processor(app_module, tmp_path):
+    def make(count, shared=False):
+        export = tmp_path / 'timeline.json'
+        if not export.exists():
+            write_timeline(export, count)
+        return app_module.TimelineProcessor(export, shared=shared, background=False, cache_dir=tmp_path / 'cache',
+                                            additions_dir=tmp_path / 'additions')
+    return make
+
+
+def test_derived_values_are_built_once(frames):
+    snapshot = TimelineSnapshot(frames, version='test')
+    calls = []
+
+    def build():
+        calls.append(1)
+        return len(calls)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(snapshot.derived('value', build))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Concurrent first uses may each build, but all of them get the value that was kept
+    assert len(set(results)) == 1
+    assert snapshot.derived('value', build) == results[0]
+
+
+def test_unchanged_data_is_not_reloaded(make_processor):
+    processor = make_processor(300)
+    snapshot = processor.snapshot
+    assert not processor.reload_if_changed()
+    assert processor.snapshot is snapshot
+
+
+def test_changed_export_swaps_the_snapshot(make_processor):
+    processor = make_processor(300)
+    old = processor.snapshot
+    old_version, old_count = old.version, len(old.activities)
+    write_timeline(processor.json_path, 600)
+    assert processor.reload_if_changed()
+    new = processor.snapshot
+    assert new is not old
+    assert new.version != old_version
+    assert len(new.activities) > old_count
+    # A request still holding the old snapshot reads the old data
+    assert old.version == old_version and len(old.activities) == old_count
+    assert not processor.reload_if_changed()
+
+
+def test_new_additions_trigger_a_reload(make_processor, timeline_export):
+    first = make_processor(300)
+    second = make_processor(300)
+    first.ingest(timeline_export)
+    # Another worker picks up the addition on its next check
+    assert second.reload_if_changed()
+    assert second.dataset_version == first.dataset_version
+    assert len(second.snapshot.activities) == len(first.snapshot.activities)
+
+
+def test_failed_reload_keeps_serving(make_processor):
+    processor = make_processor(300)
+    snapshot = processor.snapshot
+    processor.json_path.write_text('{"semanticSegments": [')
+    processor.reload_if_changed()
+    assert processor.snapshot is snapshot
+
+
+def test_responses_follow_the_new_version(make_processor, client, app_module, monkeypatch):
+    processor = make_processor(300)
+    monkeypatch.setattr(app_module, 'timeline_processor', processor)
+    first = client.get('/api/map/data')
+    write_timeline(processor.json_path, 600)
+    processor.reload_if_changed()
+    second = client.get('/api/map/data', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert len(second.get_json()) > len(first.get_json())
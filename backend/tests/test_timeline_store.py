@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from timeline_snapshot import TimelineSnapshot
+from timeline_store import ActivityStore, VisitStore, category_values, date_strings, iso_strings
+
+
+def _names(series):
+    return [value if isinstance(value, str) else None for value in series]
+
+
+@pytest.fixture(scope='module')
+def snapshot(frames):
+    return TimelineSnapshot(frames, version='test')
+
+
+def test_activity_columns_match_frame(snapshot):
+    df, store = snapshot.frames['activities'], snapshot.activities
+    assert len(store) == len(df)
+    assert iso_strings(store.start) == [t.isoformat() for t in df['startTime']]
+    assert iso_strings(store.end) == [t.isoformat() for t in df['endTime']]
+    assert date_strings(store.start) == df['startTime'].dt.strftime('%Y-%m-%d').tolist()
+    np.testing.assert_array_equal(store.distance, df['distanceMeters'])
+    np.testing.assert_allclose(store.duration_hours,
+                               (df['endTime'] - df['startTime']).dt.total_seconds() / 3600)
+    positions = np.arange(len(store))
+    assert store.activity_types(positions) == df['topCandidate.type'].tolist()
+    assert store.start_countries(positions) == _names(df['start_country'])
+    assert store.end_countries(positions) == _names(df['end_country'])
+
+
+def test_country_table_is_shared(snapshot):
+    store = snapshot.activities
+    names = set(store.countries)
+    assert set(store.country_names()) == names
+    # The same country has the same code whether an activity starts or ends there
+    both = (store.start_country_codes >= 0) & (store.start_country_codes == store.end_country_codes)
+    df = snapshot.frames['activities']
+    assert (df['start_country'][both] == df['end_country'][both]).all()
+
+
+def test_visit_columns_match_frame(snapshot):
+    df, store = snapshot.frames['visits'], snapshot.visits
+    assert iso_strings(store.start) == [t.isoformat() for t in df['startTime']]
+    np.testing.assert_array_equal(store.lat, df['latitude'])
+    assert category_values(store.country_codes, store.countries) == _names(df['country'])
+
+
+def test_iso_strings_fractional_seconds():
+    times = pd.DatetimeIndex(['2025-06-10 08:00:00', '2025-06-10 08:00:00.250'], tz='UTC')
+    assert iso_strings(times.as_unit('ns').asi8) == [t.isoformat() for t in times]
+
+
+def test_missing_categories_decode_to_none():
+    assert category_values(np.array([1, -1, 0], dtype=np.int16), np.array(['a', 'b'], dtype=object)) == \
+        ['b', None, 'a']
+
+
+def test_empty_stores():
+    assert len(ActivityStore(pd.DataFrame())) == 0
+    assert len(VisitStore(pd.DataFrame())) == 0
+    assert ActivityStore(pd.DataFrame()).country_names() == []
+
+
+def test_time_bounds_match_a_scan(snapshot):
+    store = snapshot.activities
+    rng = np.random.default_rng(0)
+    edges = np.concatenate([rng.choice(store.start, 20), rng.integers(store.start[0] - 10 ** 12, store.end[-1], 20)])
+    for start_ns, end_ns in zip(edges[::2], edges[1::2]):
+        lo, hi = store.time_bounds(start_ns, end_ns)
+        expected = np.flatnonzero((store.start >= start_ns) & (store.start <= end_ns))
+        np.testing.assert_array_equal(np.arange(lo, hi), expected)
+    assert store.time_bounds() == (0, len(store))
+    assert store.time_bounds(None, store.start[0] - 1) == (0, 0)
+
+
+def test_positions_by_type_and_country(snapshot):
+    store = snapshot.activities
+    for code, name in enumerate(store.types):
+        np.testing.assert_array_equal(store.type_positions[code], np.flatnonzero(store.type_codes == code))
+        assert store.type_code(name) == code
+    for code, name in enumerate(store.countries):
+        expected = np.flatnonzero((store.start_country_codes == code) | (store.end_country_codes == code))
+        np.testing.assert_array_equal(store.country_positions[code], expected)
+        assert store.country_code(name) == code
+    assert store.type_code('HOVERBOARD') is None
+
+
+def test_unsorted_rows_are_rejected(frames):
+    with pytest.raises(ValueError):
+        ActivityStore(frames['activities'].iloc[::-1])
+
+
+def test_latest_visits(snapshot):
+    store = snapshot.visits
+    np.testing.assert_array_equal(store.latest(3), [len(store) - 1, len(store) - 2, len(store) - 3])
+    assert len(store.latest(len(store) + 5)) == len(store)
+    assert len(store.latest(0)) == 0
@@ -0,0 +1,173 @@
+import io
+from concurrent.futures import Future
+
+import pytest
+
+import upload_jobs
+from journey_registry import JourneyRegistry
+from processed_cache import cache_path_for, load_processed
+from timeline_synth import write_timeline
+from upload_jobs import InlineExecutor, UploadQueue, read_job, save_stream
+
+
+class DeferredExecutor:
+    """Holds jobs until the test runs them, so they can be seen queued and cancelled"""
+
+    def __init__(self):
+        self.queued = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.queued.append((future, fn, args))
+        return future
+
+    def start(self, future):
+        assert future.set_running_or_notify_cancel()
+
+    def run(self, future, fn, args):
+        future.set_result(fn(*args))
+
+
+@pytest.fixture(scope='module')
+def export_bytes(tmp_path_factory):
+    path = tmp_path_factory.mktemp('export') / 'synthetic.json'
+    write_timeline(path, 300)
+    return path.read_bytes()
+
+
+@pytest.fixture
+def journeys(tmp_path):
+    return JourneyRegistry(None, journeys_dir=tmp_path / 'journeys')
+
+
+@pytest.fixture
+def journey(journeys):
+    # The synthetic trip starts on the default journey start date
+    return journeys.create('trip')
+
+
+def upload(journeys, data):
+    return save_stream(io.BytesIO(data), journeys.journeys_dir)
+
+
+def submit(queue, journeys, journey, data):
+    upload_path, sha256, size = upload(journeys, data)
+    job, created = queue.submit(journey, upload_path, sha256, size)
+    return job, created, upload_path
+
+
+def test_job_done(tmp_path, journeys, journey, export_bytes):
+    finished = []
+    queue = UploadQueue(executor=InlineExecutor(), jobs_dir=tmp_path / 'jobs', on_done=finished.append)
+    job, created, upload_path = submit(queue, journeys, journey, export_bytes)
+
+    assert created
+    assert job['status'] == 'done'
+    assert job['progress'] == 1.0
+    assert job['result']['activities'] > 0 and job['result']['visits'] > 0
+    assert [done['id'] for done in finished] == [job['id']]
+    # The export is replaced by the upload, and its processed cache matches it
+    assert journey['json_path'].read_bytes() == export_bytes
+    assert not upload_path.exists()
+    frames = load_processed(cache_path_for(journey['json_path'], journey['cache_dir']),
+                            journey['json_path'], journey['start_date'])
+    assert frames is not None
+    assert len(frames['activities']) == job['result']['activities']
+    assert queue.status()['done'] == 1 and queue.status()['pending'] == 0
+
+
+def test_duplicate_upload_returns_existing_job(tmp_path, journeys, journey, export_bytes):
+    queue = UploadQueue(executor=InlineExecutor(), jobs_dir=tmp_path / 'jobs')
+    first, _, _ = submit(queue, journeys, journey, export_bytes)
+    again, created, upload_path = submit(queue, journeys, journey, export_bytes)
+
+    assert not created
+    assert again['id'] == first['id'] and again['status'] == 'done'
+    assert not upload_path.exists()
+    assert queue.status()['duplicates'] == 1
+
+
+def test_failed_job_can_be_resubmitted(tmp_path, monkeypatch, journeys, journey, export_bytes):
+    queue = UploadQueue(executor=InlineExecutor(), jobs_dir=tmp_path / 'jobs')
+
+    def broken(frames):
+        raise RuntimeError('country lookup unavailable')
+
+    resolve_countries = upload_jobs.resolve_countries
+    monkeypatch.setattr(upload_jobs, 'resolve_countries', broken)
+    failed, _, upload_path = submit(queue, journeys, journey, export_bytes)
+    assert failed['status'] == 'failed'
+    assert 'country lookup unavailable' in failed['error']
+    assert not upload_path.exists()
+    assert not journey['json_path'].exists()
+
+    monkeypatch.setattr(upload_jobs, 'resolve_countries', resolve_countries)
+    retried, created, _ = submit(queue, journeys, journey, export_bytes)
+    assert created
+    assert retried['id'] == failed['id'] and retried['status'] == 'done'
+
+
+def test_truncated_export_fails(tmp_path, journeys, journey, export_bytes):
+    queue = UploadQueue(executor=InlineExecutor(), jobs_dir=tmp_path / 'jobs')
+    job, _, _ = submit(queue, journeys, journey, export_bytes[:len(export_bytes) // 2])
+    assert job['status'] == 'failed'
+    assert not journey['json_path'].exists()
+
+
+def test_cancel_queued_job(tmp_path, journeys, journey, export_bytes):
+    executor = DeferredExecutor()
+    queue = UploadQueue(executor=executor, jobs_dir=tmp_path / 'jobs')
+    job, _, upload_path = submit(queue, journeys, journey, export_bytes)
+    assert job['status'] == 'queued'
+
+    cancelled = queue.cancel(job['id'])
+    assert cancelled['status'] == 'cancelled'
+    assert read_job(job['id'], tmp_path / 'jobs')['status'] == 'cancelled'
+    assert not upload_path.exists()
+    assert queue.status()['cancelled'] == 1 and queue.status()['pending'] == 0
+
+
+def test_cancel_running_job(tmp_path, journeys, journey, export_bytes):
+    executor = DeferredExecutor()
+    queue = UploadQueue(executor=executor, jobs_dir=tmp_path / 'jobs')
+    job, _, upload_path = submit(queue, journeys, journey, export_bytes)
+    future, fn, args = executor.queued[0]
+    executor.start(future)
+
+    # Too late to drop from the queue, so the job stops at its next progress report
+    assert queue.cancel(job['id'])['cancel_requested']
+    executor.run(future, fn, args)
+    assert read_job(job['id'], tmp_path / 'jobs')['status'] == 'cancelled'
+    assert not upload_path.exists()
+    assert not journey['json_path'].exists()
+
+    # A cancelled upload can be sent again
+    executor.queued.clear()
+    _, created, _ = submit(queue, journeys, journey, export_bytes)
+    assert created and len(executor.queued) == 1
+
+
+def test_queue_full(tmp_path, journeys, journey):
+    queue = UploadQueue(executor=DeferredExecutor(), jobs_dir=tmp_path / 'jobs', max_pending=2)
+    submit(queue, journeys, journey, b'{"semanticSegments": []} ')
+    submit(queue, journeys, journey, b'{"semanticSegments": []}  ')
+
+    upload_path, sha256, size = upload(journeys, b'{"semanticSegments": []}   ')
+    with pytest.raises(OverflowError):
+        queue.submit(journey, upload_path, sha256, size)
+    assert not upload_path.exists()
+    assert queue.status()['pending'] == 2
+
+
+@pytest.mark.parametrize('job_id', ['', None, 'abc', 'A' * 24, 'a' * 25, 'g' * 24, '../' + 'a' * 21])
+def test_read_job_rejects_malformed_ids(tmp_path, job_id):
+    jobs_dir = tmp_path / 'jobs'
+    jobs_dir.mkdir()
+    if job_id:
+        # A file the ID would name exists, so only the format check keeps it from being read
+        (jobs_dir / f'{job_id}.json').write_text('{"status": "done"}')
+    assert read_job(job_id, jobs_dir) is None
+
+
+def test_read_job_missing(tmp_path):
+    assert read_job('0' * 24, tmp_path) is None
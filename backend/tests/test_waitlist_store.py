@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+
+import pytest
+
+import waitlist_store
+from waitlist_store import SqliteWaitlistStore, create_waitlist_store, migrate_json, normalize_email
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SqliteWaitlistStore(tmp_path / 'waitlist.sqlite3')
+
+
+def _row(email, source='homepage'):
+    return (email, normalize_email(email), source, '2025-10-02T21:28:21')
+
+
+def _write(path, emails):
+    path.write_text(json.dumps([{'email': email, 'timestamp': '2025-10-02T21:28:21', 'source': 'homepage'}
+                                for email in emails]))
+
+
+def test_duplicates_differing_in_case(store):
+    assert store.insert_many([_row('Ana@Mail.com'), _row(' ana@mail.com'), _row('ANA@MAIL.COM '),
+                              _row('joao@mail.pt')]) == [True, False, False, True]
+    assert store.insert_many([_row('JOAO@Mail.PT'), _row('rita@mail.pt')]) == [False, True]
+    assert store.count() == 3
+    # The first spelling of an email is the one kept
+    assert [entry['email'] for entry in store.entries()] == ['Ana@Mail.com', 'joao@mail.pt', 'rita@mail.pt']
+    assert not store.add('rita@MAIL.pt')
+
+
+def test_concurrent_signups_are_group_committed(store, monkeypatch):
+    commits = []
+    insert_many = store.insert_many
+
+    def slow_insert_many(rows):
+        # Slow commits let the next signups queue up behind them
+        time.sleep(0.01)
+        commits.append(len(rows))
+        return insert_many(rows)
+    monkeypatch.setattr(store, 'insert_many', slow_insert_many)
+
+    results = {}
+
+    def sign_up(thread):
+        for i in range(25):
+            # Every email is sent by two threads, spelled differently
+            email = f"user{(thread // 2) * 25 + i}@mail.com"
+            results[(thread, i)] = store.add(email.upper() if thread % 2 else email)
+    threads = [threading.Thread(target=sign_up, args=(thread,)) for thread in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert store.count() == 8 * 25
+    assert sum(results.values()) == 8 * 25
+    assert sum(commits) == 16 * 25
+    assert len(commits) < 16 * 25 / 4
+
+
+def test_migration_runs_once_per_file(store, tmp_path):
+    legacy = tmp_path / 'waitlist.json'
+    _write(legacy, ['goncalo@mail.com', 'crocs@mail.com'])
+    store.add('Crocs@Mail.com')
+    assert migrate_json(store, legacy) == 1
+    # The file stays where it is, so the checkout is not changed
+    assert legacy.exists()
+    assert migrate_json(store, legacy) == 0
+    assert store.count() == 2
+
+    # Signups added to the file later are copied in on the next deploy
+    _write(legacy, ['goncalo@mail.com', 'crocs@mail.com', 'new@mail.com'])
+    assert migrate_json(store, legacy) == 1
+    # A deploy bringing back the older copy adds nothing
+    _write(legacy, ['goncalo@mail.com', 'crocs@mail.com'])
+    assert migrate_json(store, legacy) == 0
+    assert store.count() == 3
+    assert migrate_json(store, tmp_path / 'missing.json') == 0
+
+
+def test_concurrent_migrations_import_once(tmp_path):
+    legacy = tmp_path / 'waitlist.json'
+    _write(legacy, [f'user{i}@mail.com' for i in range(200)])
+    added = []
+    # Stores of their own, as in separate worker processes
+    threads = [threading.Thread(target=lambda: added.append(
+        migrate_json(SqliteWaitlistStore(tmp_path / 'waitlist.sqlite3'), legacy))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(added) == [0, 0, 0, 200]
+
+
+def test_opening_the_store_does_not_migrate(tmp_path, monkeypatch):
+    legacy = tmp_path / 'waitlist.json'
+    _write(legacy, ['goncalo@mail.com'])
+    monkeypatch.setattr(waitlist_store, 'LEGACY_WAITLIST_PATH', legacy)
+    monkeypatch.setenv('WAITLIST_DB_PATH', str(tmp_path / 'waitlist.sqlite3'))
+    store = create_waitlist_store('sqlite')
+    assert store.count() == 0
+    assert legacy.read_text() == json.dumps([{'email': 'goncalo@mail.com', 'timestamp': '2025-10-02T21:28:21',
+                                              'source': 'homepage'}])
+
+
+def test_waitlist_route(client):
+    first = client.post('/api/waitlist', json={'email': 'Route@Test.com'})
+    assert first.status_code == 201
+    assert client.post('/api/waitlist', json={'email': 'route@test.com'}).status_code == 200
+    assert client.post('/api/waitlist', json={'email': 'not-an-email'}).status_code == 400
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from processed_cache import (
+    file_lock, load_frames, read_processed, resolve_countries, save_processed, source_fingerprint
+)
+from timeline_loader import DATA_DIR, JOURNEY_START
+
+ADDITIONS_DIR = DATA_DIR / "additions"
+
+# Frames whose rows are segments, deduplicated by (startTime, endTime) within their own kind
+_SEGMENT_FRAMES = ('activities', 'visits', 'paths')
+_ADDITION_NAME = re.compile(r'^(\d{6})-[0-9a-f]+\.npz$')
+
+
+def additions_dir_for(json_path, additions_dir=ADDITIONS_DIR):
+    return Path(additions_dir) / Path(json_path).stem
+
+
+def _segment_keys(df):
+    if df.empty:
+        return pd.MultiIndex.from_arrays([[], []])
+    return pd.MultiIndex.from_arrays([
+        pd.DatetimeIndex(df['startTime']).as_unit('ns').asi8,
+        pd.DatetimeIndex(df['endTime']).as_unit('ns').asi8
+    ])
+
+
+def drop_known(frames, upload):
+    """The segments of ``upload`` that ``frames`` does not have yet.
+
+    A segment is known when one of the same kind (activity, visit or path)
+    has the same startTime and endTime; repeats inside the upload are kept
+    once. Path points follow their path.
+    """
+    new = {}
+    for name in _SEGMENT_FRAMES:
+        df = upload[name]
+        keys = _segment_keys(df)
+        known = frames.get(name)
+        keep = ~keys.duplicated()
+        if known is not None and not known.empty:
+            keep &= ~keys.isin(_segment_keys(known))
+        new[name] = df[keep].reset_index(drop=True)
+        if name == 'paths':
+            counts = df['points'].to_numpy(dtype=np.int64) if len(df) else np.empty(0, dtype=np.int64)
+            point_keep = np.repeat(keep, counts)
+            new['path_points'] = upload['path_points'][point_keep].reset_index(drop=True)
+    return new
+
+
+def merge_frames(frames, new):
+    """Frames with the new segments added, activities and visits sorted by startTime"""
+    merged = {}
+    for name in ('activities', 'visits'):
+        parts = [df for df in (frames.get(name), new[name]) if df is not None and not df.empty]
+        if not parts:
+            merged[name] = new[name]
+            continue
+        df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+        merged[name] = df.sort_values('startTime', kind='stable', ignore_index=True)
+    # Path points are stored in path order, so paths are appended and PathStore orders them
+    for name in ('paths', 'path_points'):
+        parts = [df for df in (frames.get(name), new[name]) if df is not None and not df.empty]
+        merged[name] = pd.concat(parts, ignore_index=True) if len(parts) > 1 else (parts[0] if parts else new[name])
+    return merged
+
+
+def segment_count(frames):
+    return sum(len(frames[name]) for name in _SEGMENT_FRAMES)
+
+
+def addition_paths(directory):
+    """Saved additions in the order they were ingested"""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    return sorted(p for p in directory.iterdir() if _ADDITION_NAME.match(p.name))
+
+
+def apply_additions(frames, directory):
+    """Merge every saved addition into freshly loaded frames, skipping segments the export already has"""
+    for path in addition_paths(directory):
+        try:
+            addition, _ = read_processed(path)
+        except Exception as e:
+            print(f"Ignoring unreadable timeline addition {path}: {e}")
+            continue
+        new = drop_known(frames, addition)
+        if segment_count(new):
+            frames = merge_frames(frames, new)
+    return frames
+
+
+def export_version(fingerprint):
+    """Identify an export by its mtime and size"""
+    return f"{fingerprint['mtime_ns']:x}-{fingerprint['size']:x}"
+
+
+def dataset_version(base_version, directory):
+    """The version of an export's data with the saved additions merged in"""
+    additions = additions_version(directory)
+    return f"{base_version}+{additions}" if additions else base_version
+
+
+def additions_version(directory):
+    """Identify the saved additions by name, so the dataset version changes with every ingestion"""
+    names = [p.name for p in addition_paths(directory)]
+    if not names:
+        return None
+    return hashlib.blake2b('\n'.join(names).encode('utf-8'), digest_size=8).hexdigest()
+
+
+def _next_addition_path(directory, digest):
+    existing = addition_paths(directory)
+    sequence = int(_ADDITION_NAME.match(existing[-1].name).group(1)) + 1 if existing else 1
+    return Path(directory) / f"{sequence:06d}-{digest}.npz"
+
+
+def save_upload(stream, directory):
+    """Copy an uploaded export to a temporary file next to the additions, in chunks"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=directory, suffix='.upload')
+    with os.fdopen(fd, 'wb') as f:
+        shutil.copyfileobj(stream, f, 1 << 20)
+    return Path(path)
+
+
+def ingest_export(upload_path, frames, directory, start_date=JOURNEY_START):
+    """Process the segments of an uploaded export (or delta) that ``frames`` does not have.
+
+    Only the new segments get countries resolved. They are saved as a
+    numbered addition, so they are merged back in on the next load, and
+    returned as frames. Returns None when the upload adds nothing.
+    """
+    started = time.perf_counter()
+    upload = load_frames(upload_path, start_date)
+    new = drop_known(frames, upload)
+    if not segment_count(new):
+        return None
+    resolve_countries(new)
+
+    fingerprint = source_fingerprint(upload_path)
+    # Workers ingesting at the same time get distinct sequence numbers
+    with file_lock(Path(directory) / '.lock'):
+        path = _next_addition_path(directory, fingerprint['sha256'][:16])
+        save_processed(path, new, fingerprint, start_date)
+    print(f"Ingested {segment_count(new)} new segments into {path.name} in {time.perf_counter() - started:.2f}s")
+    return new
@@ -0,0 +1,261 @@
+import json
+import os
+import re
+from array import array
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+DATA_DIR = Path(__file__).parent / "src" / "data"
+
+# Entries before the start of the journey are dropped while streaming (as in notebook);
+# journeys served from JOURNEYS_DIR set their own in journey.json
+JOURNEY_START = os.environ.get('JOURNEY_START', '2025-06-10')
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ONE_MICROSECOND = timedelta(microseconds=1)
+_SEPARATORS = re.compile(r'[\s,]*')
+_SEGMENTS_KEY = '"semanticSegments"'
+
+ACTIVITY_COLUMNS = [
+    'startTime', 'endTime', 'start_latitude', 'start_longitude', 'end_latitude', 'end_longitude',
+    'distanceMeters', 'probability', 'topCandidate.type', 'parking.startTime',
+    'parking_latitude', 'parking_longitude'
+]
+VISIT_COLUMNS = ['startTime', 'endTime', 'latitude', 'longitude', 'placeId', 'semanticType', 'probability']
+# timelinePath segments, and their points stored back to back in segment order
+PATH_COLUMNS = ['startTime', 'endTime', 'points']
+PATH_POINT_COLUMNS = ['time', 'latitude', 'longitude']
+
+
+def iter_semantic_segments(json_path, chunk_size=1 << 20, progress=None):
+    """Yield the entries of the semanticSegments array one at a time.
+
+    The export is read in fixed-size chunks and each segment is decoded on its
+    own, so memory use is bounded by the largest single segment rather than by
+    the size of the file. ``progress(characters_read)`` is called after every
+    chunk; an exception it raises stops the read.
+    """
+    decoder = json.JSONDecoder()
+    with open(json_path, 'r', encoding='utf-8') as f:
+        consumed = 0
+
+        def read():
+            nonlocal consumed
+            chunk = f.read(chunk_size)
+            consumed += len(chunk)
+            if progress is not None:
+                progress(consumed)
+            return chunk
+
+        buf = ''
+        # Seek forward to the opening bracket of the semanticSegments array
+        while True:
+            key_pos = buf.find(_SEGMENTS_KEY)
+            if key_pos != -1:
+                bracket = buf.find('[', key_pos + len(_SEGMENTS_KEY))
+                if bracket != -1:
+                    buf = buf[bracket + 1:]
+                    break
+                buf = buf[key_pos:]
+            else:
+                # Keep a tail so a key split across two chunks is still found
+                buf = buf[-len(_SEGMENTS_KEY):]
+            chunk = read()
+            if not chunk:
+                return
+            buf += chunk
+
+        pos = 0
+        while True:
+            pos = _SEPARATORS.match(buf, pos).end()
+            if pos >= len(buf):
+                chunk = read()
+                if not chunk:
+                    raise ValueError('Unexpected end of file inside semanticSegments')
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            if buf[pos] == ']':
+                return
+            try:
+                segment, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # The segment continues past the buffered data
+                chunk = read()
+                if not chunk:
+                    raise
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            yield segment
+            pos = end
+            if pos >= chunk_size:
+                buf = buf[pos:]
+                pos = 0
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 export timestamp into integer microseconds since the epoch"""
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - _EPOCH) // _ONE_MICROSECOND
+
+
+def parse_lat_lng(value):
+    """Parse a '38.7223°, -9.1393°' string into a (lat, lng) pair of floats"""
+    try:
+        lat, lng = value.split(',')
+        return float(lat.strip().rstrip('°')), float(lng.strip().rstrip('°'))
+    except (AttributeError, ValueError):
+        return np.nan, np.nan
+
+
+def parse_lat_lng_strings(values):
+    """Parse a list of '38.7223°, -9.1393°' strings into lat and lng arrays in one pass.
+
+    The strings are joined and converted by NumPy as a whole; if any of them
+    is malformed the list is parsed one value at a time instead, which gives
+    NaN for the bad ones.
+    """
+    if not values:
+        return np.empty(0), np.empty(0)
+    try:
+        numbers = np.array(','.join(values).replace('°', '').split(','), dtype=np.float64)
+        if len(numbers) == 2 * len(values):
+            return numbers[0::2].copy(), numbers[1::2].copy()
+    except (TypeError, ValueError):
+        pass
+    lat_lng = np.array([parse_lat_lng(value) for value in values], dtype=np.float64)
+    return lat_lng[:, 0].copy(), lat_lng[:, 1].copy()
+
+
+def _to_float(value):
+    return np.nan if value is None else float(value)
+
+
+def _to_datetime(micros):
+    return pd.to_datetime(np.frombuffer(micros, dtype=np.int64), unit='us', utc=True)
+
+
+def load_timeline(json_path, start_date=JOURNEY_START, progress=None):
+    """Stream a Google Timeline export into (activity_df, visit_df, path_df, path_point_df).
+
+    Only the fields used by the API are kept, in typed arrays, and segments
+    starting before ``start_date`` are skipped as they are read. timelinePath
+    points are collected as raw strings and parsed in bulk at the end.
+    """
+    cutoff = parse_timestamp(pd.Timestamp(start_date, tz='UTC').isoformat())
+
+    activity = {
+        'start': array('q'), 'end': array('q'),
+        'start_lat': array('d'), 'start_lng': array('d'),
+        'end_lat': array('d'), 'end_lng': array('d'),
+        'distance': array('d'), 'probability': array('d'),
+        'parking_lat': array('d'), 'parking_lng': array('d'),
+        'type': [], 'parking_start': []
+    }
+    visit = {
+        'start': array('q'), 'end': array('q'),
+        'lat': array('d'), 'lng': array('d'), 'probability': array('d'),
+        'place_id': [], 'semantic_type': []
+    }
+    path = {'start': array('q'), 'end': array('q'), 'points': array('q'), 'point': [], 'time': []}
+    # Intern repeated category strings so each distinct value is stored once
+    categories = {}
+
+    for segment in iter_semantic_segments(json_path, progress=progress):
+        start_time = segment.get('startTime')
+        end_time = segment.get('endTime')
+        if not start_time or not end_time:
+            continue
+        start = parse_timestamp(start_time)
+        if start < cutoff:
+            continue
+        end = parse_timestamp(end_time)
+
+        if 'activity' in segment:
+            data = segment['activity'] or {}
+            start_lat, start_lng = parse_lat_lng((data.get('start') or {}).get('latLng'))
+            end_lat, end_lng = parse_lat_lng((data.get('end') or {}).get('latLng'))
+            parking = data.get('parking') or {}
+            parking_lat, parking_lng = parse_lat_lng((parking.get('location') or {}).get('latLng'))
+            activity_type = (data.get('topCandidate') or {}).get('type')
+
+            activity['start'].append(start)
+            activity['end'].append(end)
+            activity['start_lat'].append(start_lat)
+            activity['start_lng'].append(start_lng)
+            activity['end_lat'].append(end_lat)
+            activity['end_lng'].append(end_lng)
+            activity['distance'].append(_to_float(data.get('distanceMeters')))
+            activity['probability'].append(_to_float(data.get('probability')))
+            activity['parking_lat'].append(parking_lat)
+            activity['parking_lng'].append(parking_lng)
+            activity['type'].append(categories.setdefault(activity_type, activity_type))
+            activity['parking_start'].append(parking.get('startTime'))
+
+        elif 'visit' in segment:
+            data = segment['visit'] or {}
+            candidate = data.get('topCandidate') or {}
+            lat, lng = parse_lat_lng((candidate.get('placeLocation') or {}).get('latLng'))
+            semantic_type = candidate.get('semanticType')
+
+            visit['start'].append(start)
+            visit['end'].append(end)
+            visit['lat'].append(lat)
+            visit['lng'].append(lng)
+            visit['probability'].append(_to_float(data.get('probability')))
+            visit['place_id'].append(candidate.get('placeId'))
+            visit['semantic_type'].append(categories.setdefault(semantic_type, semantic_type))
+
+        elif 'timelinePath' in segment:
+            points = [p for p in segment['timelinePath'] or [] if isinstance(p, dict) and p.get('point')]
+            path['start'].append(start)
+            path['end'].append(end)
+            path['points'].append(len(points))
+            path['point'].extend(p['point'] for p in points)
+            path['time'].extend(p.get('time') for p in points)
+
+    activity_df = pd.DataFrame({
+        'startTime': _to_datetime(activity['start']),
+        'endTime': _to_datetime(activity['end']),
+        'start_latitude': np.frombuffer(activity['start_lat']),
+        'start_longitude': np.frombuffer(activity['start_lng']),
+        'end_latitude': np.frombuffer(activity['end_lat']),
+        'end_longitude': np.frombuffer(activity['end_lng']),
+        'distanceMeters': np.frombuffer(activity['distance']),
+        'probability': np.frombuffer(activity['probability']),
+        'topCandidate.type': pd.Series(activity['type'], dtype=object),
+        'parking.startTime': pd.Series(activity['parking_start'], dtype=object),
+        'parking_latitude': np.frombuffer(activity['parking_lat']),
+        'parking_longitude': np.frombuffer(activity['parking_lng'])
+    }, columns=ACTIVITY_COLUMNS)
+
+    visit_df = pd.DataFrame({
+        'startTime': _to_datetime(visit['start']),
+        'endTime': _to_datetime(visit['end']),
+        'latitude': np.frombuffer(visit['lat']),
+        'longitude': np.frombuffer(visit['lng']),
+        'placeId': pd.Series(visit['place_id'], dtype=object),
+        'semanticType': pd.Series(visit['semantic_type'], dtype=object),
+        'probability': np.frombuffer(visit['probability'])
+    }, columns=VISIT_COLUMNS)
+
+    path_df = pd.DataFrame({
+        'startTime': _to_datetime(path['start']),
+        'endTime': _to_datetime(path['end']),
+        'points': np.frombuffer(path['points'], dtype=np.int64)
+    }, columns=PATH_COLUMNS)
+
+    point_lat, point_lng = parse_lat_lng_strings(path['point'])
+    path_point_df = pd.DataFrame({
+        'time': pd.to_datetime(pd.Series(path['time'], dtype=object), utc=True, format='ISO8601'),
+        'latitude': point_lat,
+        'longitude': point_lng
+    }, columns=PATH_POINT_COLUMNS)
+
+    return activity_df, visit_df, path_df, path_point_df
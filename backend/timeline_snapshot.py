@@ -0,0 +1,91 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aggregates import DailyRollup
+from geodesic import KinematicsStore
+from metrics import stage
+from places import PlaceStore
+from route_lod import RouteLOD
+from spatial_index import GridIndex, StopIndex
+from timeline_store import ActivityStore, PathStore, VisitStore
+
+
+class TimelineSnapshot:
+    """Everything the endpoints read for one version of the dataset.
+
+    A snapshot is built completely before it is published and its arrays are
+    not changed afterwards (apart from the place names the geocoding pool
+    fills in), so a request that takes ``processor.snapshot`` once reads one
+    consistent dataset even while a newer one is being swapped in.
+
+    Values derived from the data are cached on the snapshot itself (see
+    ``derived``), so they are dropped together with it.
+    """
+
+    def __init__(self, frames=None, version='empty', rollup=None):
+        frames = dict(frames or {})
+        activity_df = frames.get('activities', pd.DataFrame())
+        visit_df = frames.get('visits', pd.DataFrame())
+        # Kept sorted by start time so date ranges resolve by binary search
+        if not activity_df.empty:
+            frames['activities'] = activity_df = activity_df.sort_values('startTime', kind='stable', ignore_index=True)
+        if not visit_df.empty:
+            frames['visits'] = visit_df = visit_df.sort_values('startTime', kind='stable', ignore_index=True)
+        self.setup(version, frames)
+
+        # Typed arrays the endpoints read from, built once per snapshot
+        with stage('snapshot.stores'):
+            self.activities = ActivityStore(activity_df)
+            self.visits = VisitStore(visit_df)
+            self.paths = PathStore(frames.get('paths', pd.DataFrame()), frames.get('path_points', pd.DataFrame()))
+        # Simplified map geometry for every zoom level
+        with stage('snapshot.route_lod'):
+            self.route_lod = RouteLOD(self.activities)
+        # Great-circle distances, implied speeds and outlier flags
+        with stage('snapshot.kinematics'):
+            self.kinematics = KinematicsStore(self.activities, self.paths)
+        # Spatial lookups: viewport queries over activity lines and stop locations, nearest stops
+        with stage('snapshot.spatial_index'):
+            self.activity_grid = GridIndex.for_activities(self.activities)
+            self.visit_grid = GridIndex.for_points(self.visits.lat, self.visits.lng)
+            self.stop_index = StopIndex(self.visits)
+        # Visits clustered into places, named once per place
+        with stage('snapshot.places'):
+            self.places = PlaceStore(self.visits)
+        # Per-day totals behind the dashboard and /api/stats/timeseries; an ingestion passes
+        # the previous rollup combined with that of the new segments
+        with stage('snapshot.rollup'):
+            self.rollup = rollup if rollup is not None else DailyRollup(self.activities, self.visits)
+
+    def setup(self, version, frames=None):
+        """Set the version and empty caches; ``frames`` is None when the stores were mapped from a file"""
+        self.version = version
+        self.frames = frames
+        self._derived = {}
+        self._derived_lock = threading.Lock()
+
+    def nbytes(self):
+        """Approximate memory held by the stores' arrays and the frames (strings are counted as pointers)"""
+        return self.derived('nbytes', self._count_bytes)
+
+    def _count_bytes(self):
+        total = 0
+        for name, store in vars(self).items():
+            if name == 'frames':
+                total += sum(int(df.memory_usage(index=True).sum()) for df in (store or {}).values())
+                continue
+            for value in getattr(store, '__dict__', {}).values():
+                arrays = value.values() if isinstance(value, dict) else (value,)
+                total += sum(array.nbytes for array in arrays if isinstance(array, np.ndarray))
+        return total
+
+    def derived(self, name, build):
+        """The value ``build()`` returns for this snapshot, computed on first use"""
+        with self._derived_lock:
+            if name in self._derived:
+                return self._derived[name]
+        value = build()
+        with self._derived_lock:
+            return self._derived.setdefault(name, value)
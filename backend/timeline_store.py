@@ -0,0 +1,262 @@
+import numpy as np
+import pandas as pd
+
+_NS_PER_SECOND = 1_000_000_000
+_NS_PER_DAY = 86_400 * _NS_PER_SECOND
+
+
+def _codes(values):
+    """Dictionary-encode a column into (int16 codes, categories); -1 marks a missing value"""
+    codes, categories = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+    return codes.astype(np.int16), np.asarray(categories, dtype=object)
+
+
+def _epoch_ns(times):
+    return pd.DatetimeIndex(times).as_unit('ns').asi8
+
+
+def _float_column(df, column):
+    return df[column].to_numpy(dtype=np.float64)
+
+
+def to_epoch_ns(value):
+    """Parse a date or timestamp query parameter into UTC epoch nanoseconds"""
+    return pd.to_datetime(value, utc=True).as_unit('ns').value
+
+
+def iso_strings(times_ns):
+    """Format epoch nanoseconds like Timestamp.isoformat() on UTC timestamps"""
+    times = np.asarray(times_ns, dtype=np.int64).view('datetime64[ns]')
+    strings = np.datetime_as_string(times, unit='s').astype(object)
+    # isoformat() only shows fractional seconds when there are some
+    fractional = times_ns % _NS_PER_SECOND != 0
+    if fractional.any():
+        strings[fractional] = np.datetime_as_string(times[fractional], unit='us')
+    return (strings + '+00:00').tolist()
+
+
+def date_strings(times_ns):
+    """Format epoch nanoseconds as YYYY-MM-DD"""
+    return np.datetime_as_string(np.asarray(times_ns, dtype=np.int64).view('datetime64[ns]'), unit='D').tolist()
+
+
+def category_values(codes, categories):
+    """Decode category codes back to a list of values, None for missing"""
+    lookup = np.append(categories, None)
+    return lookup[codes].tolist()
+
+
+def _positions_by_code(*code_arrays):
+    """Sorted row positions for every category code found in any of the arrays"""
+    codes = np.concatenate(code_arrays)
+    rows = np.tile(np.arange(len(code_arrays[0]), dtype=np.int64), len(code_arrays))
+    keep = codes >= 0
+    codes, rows = codes[keep], rows[keep]
+    order = np.lexsort((rows, codes))
+    codes, rows = codes[order], rows[order]
+    # A row listed under the same code twice (start and end in one country) is kept once
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = (codes[1:] != codes[:-1]) | (rows[1:] != rows[:-1])
+    codes, rows = codes[first], rows[first]
+    bounds = np.flatnonzero(np.diff(codes)) + 1
+    return {int(group[0]): positions for group, positions in zip(np.split(codes, bounds), np.split(rows, bounds))
+            if len(group)}
+
+
+def as_positions(selection):
+    """Turn a selection (slice or position array) into a position array"""
+    if isinstance(selection, slice):
+        return np.arange(selection.start, selection.stop, dtype=np.int64)
+    return selection
+
+
+def selection_size(selection):
+    if isinstance(selection, slice):
+        return selection.stop - selection.start
+    return len(selection)
+
+
+class ActivityStore:
+    """Activity segments as parallel typed arrays, built once per load.
+
+    Times are int64 nanoseconds since the epoch, activity types and countries
+    are int16 codes into small category arrays, and durations are precomputed,
+    so endpoints work on array slices instead of boxing rows into Series.
+
+    Rows must be sorted by start time: date ranges are then found by binary
+    search, and each activity type and country keeps a sorted list of its
+    row positions, from which filter masks are built (``activity_query.py``).
+    """
+
+    def __init__(self, df):
+        self.size = len(df)
+        self.start = _epoch_ns(df['startTime']) if self.size else np.empty(0, dtype=np.int64)
+        self.end = _epoch_ns(df['endTime']) if self.size else np.empty(0, dtype=np.int64)
+        self.start_lat = _float_column(df, 'start_latitude') if self.size else np.empty(0)
+        self.start_lng = _float_column(df, 'start_longitude') if self.size else np.empty(0)
+        self.end_lat = _float_column(df, 'end_latitude') if self.size else np.empty(0)
+        self.end_lng = _float_column(df, 'end_longitude') if self.size else np.empty(0)
+        self.distance = _float_column(df, 'distanceMeters') if self.size else np.empty(0)
+        self.duration_hours = (self.end - self.start) / _NS_PER_SECOND / 3600
+
+        self.type_codes, self.types = _codes(df['topCandidate.type'] if self.size else [])
+        # Both country columns share one category table so codes compare directly
+        countries = pd.concat([df['start_country'], df['end_country']]) if self.size else []
+        country_codes, self.countries = _codes(countries)
+        self.start_country_codes = country_codes[:self.size]
+        self.end_country_codes = country_codes[self.size:]
+
+        self.has_coordinates = ~(np.isnan(self.start_lat) | np.isnan(self.end_lat))
+
+        if np.any(self.start[1:] < self.start[:-1]):
+            raise ValueError('Activities must be sorted by startTime')
+        self.type_positions = _positions_by_code(self.type_codes)
+        self.country_positions = _positions_by_code(self.start_country_codes, self.end_country_codes)
+
+    def __len__(self):
+        return self.size
+
+    def time_bounds(self, start_ns=None, end_ns=None):
+        """Row range [lo, hi) of activities starting within the inclusive time range"""
+        lo = 0 if start_ns is None else int(np.searchsorted(self.start, start_ns, side='left'))
+        hi = self.size if end_ns is None else int(np.searchsorted(self.start, end_ns, side='right'))
+        return lo, max(hi, lo)
+
+    def country_code(self, country):
+        matches = np.flatnonzero(self.countries == country)
+        return int(matches[0]) if len(matches) else None
+
+    def type_code(self, activity_type):
+        """Code of an activity type, or None if no activity has it"""
+        matches = np.flatnonzero(self.types == activity_type)
+        return int(matches[0]) if len(matches) else None
+
+    def country_names(self):
+        """Every country an activity starts or ends in"""
+        used = np.union1d(self.start_country_codes, self.end_country_codes)
+        return [self.countries[code] for code in used if code >= 0]
+
+    def activity_types(self, positions):
+        return category_values(self.type_codes[positions], self.types)
+
+    def start_countries(self, positions):
+        return category_values(self.start_country_codes[positions], self.countries)
+
+    def end_countries(self, positions):
+        return category_values(self.end_country_codes[positions], self.countries)
+
+
+class VisitStore:
+    """Visit segments as parallel typed arrays sorted by start time"""
+
+    def __init__(self, df):
+        self.size = len(df)
+        self.start = _epoch_ns(df['startTime']) if self.size else np.empty(0, dtype=np.int64)
+        self.end = _epoch_ns(df['endTime']) if self.size else np.empty(0, dtype=np.int64)
+        self.lat = _float_column(df, 'latitude') if self.size else np.empty(0)
+        self.lng = _float_column(df, 'longitude') if self.size else np.empty(0)
+        self.duration_hours = (self.end - self.start) / _NS_PER_SECOND / 3600
+        self.country_codes, self.countries = _codes(df['country'] if self.size else [])
+
+        self.has_coordinates = ~(np.isnan(self.lat) | np.isnan(self.lng))
+
+        if np.any(self.start[1:] < self.start[:-1]):
+            raise ValueError('Visits must be sorted by startTime')
+
+    def __len__(self):
+        return self.size
+
+    def latest(self, limit):
+        """Positions of the ``limit`` most recent visits, newest first (rows are sorted by start time)"""
+        return np.arange(self.size - 1, max(self.size - max(limit, 0), 0) - 1, -1, dtype=np.int64)
+
+
+class PathStore:
+    """timelinePath geometry: the points of every path back to back, with per-path offsets.
+
+    Path i owns points ``offsets[i]:offsets[i + 1]``. Paths are put in start
+    time order and points without coordinates are dropped at load, so the
+    geometry of any run of paths (a day, say) is one contiguous slice.
+    """
+
+    def __init__(self, path_df, point_df):
+        self.size = len(path_df)
+        start = _epoch_ns(path_df['startTime']) if self.size else np.empty(0, dtype=np.int64)
+        end = _epoch_ns(path_df['endTime']) if self.size else np.empty(0, dtype=np.int64)
+        counts = path_df['points'].to_numpy(dtype=np.int64) if self.size else np.empty(0, dtype=np.int64)
+        has_points = len(point_df) > 0
+        lat = _float_column(point_df, 'latitude') if has_points else np.empty(0)
+        lng = _float_column(point_df, 'longitude') if has_points else np.empty(0)
+        times = _epoch_ns(point_df['time']) if has_points else np.empty(0, dtype=np.int64)
+        if counts.sum() != len(lat):
+            raise ValueError('Path point counts do not match the number of points')
+
+        order = np.argsort(start, kind='stable')
+        rank = np.empty(self.size, dtype=np.int64)
+        rank[order] = np.arange(self.size)
+        # Each point moves with its path; points stay in their original order within it
+        owner = rank[np.repeat(np.arange(self.size), counts)]
+        points = np.argsort(owner, kind='stable')
+        points = points[~(np.isnan(lat[points]) | np.isnan(lng[points]))]
+
+        self.start = start[order]
+        self.end = end[order]
+        self.lat = lat[points]
+        self.lng = lng[points]
+        self.time = times[points]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(owner[points], minlength=self.size))))
+
+    def __len__(self):
+        return self.size
+
+    def days(self):
+        """(UTC midnights in epoch ns, paths per day, points per day) for every day with a path"""
+        day = self.start // _NS_PER_DAY
+        first = np.flatnonzero(np.append(True, day[1:] != day[:-1])) if self.size else np.empty(0, dtype=np.int64)
+        bounds = np.append(first, self.size)
+        return day[first] * _NS_PER_DAY, np.diff(bounds), np.diff(self.offsets[bounds])
+
+    def day_bounds(self, day_ns):
+        """Path range [lo, hi) of paths starting on the UTC day beginning at ``day_ns``"""
+        lo = int(np.searchsorted(self.start, day_ns, side='left'))
+        hi = int(np.searchsorted(self.start, day_ns + _NS_PER_DAY, side='left'))
+        return lo, hi
+
+
+def store_state(store, skip=()):
+    """Split a store's attributes into arrays and a JSON layout, for writing it to a shared file.
+
+    Category arrays (object dtype) are stored as fixed-width strings and
+    dicts of position arrays as one array per key.
+    """
+    arrays, layout = {}, {'scalars': {}, 'objects': [], 'dicts': {}}
+    for name, value in vars(store).items():
+        if name in skip:
+            continue
+        if isinstance(value, np.ndarray):
+            if value.dtype == object:
+                layout['objects'].append(name)
+                value = value.astype(str)
+            arrays[name] = value
+        elif isinstance(value, dict):
+            layout['dicts'][name] = [int(code) for code in value]
+            for code, positions in value.items():
+                arrays[f"{name}.{code}"] = positions
+        else:
+            layout['scalars'][name] = value
+    return arrays, layout
+
+
+def restore_store(cls, arrays, layout):
+    """Rebuild a store from ``store_state`` output without recomputing anything; arrays are used as given"""
+    store = cls.__new__(cls)
+    for name, value in layout['scalars'].items():
+        setattr(store, name, value)
+    objects = set(layout['objects'])
+    for name, value in arrays.items():
+        if '.' in name:
+            continue
+        setattr(store, name, value.astype(object) if name in objects else value)
+    for name, codes in layout['dicts'].items():
+        setattr(store, name, {code: arrays[f"{name}.{code}"] for code in codes})
+    return store
@@ -0,0 +1,187 @@
+import argparse
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from geocoding import CITIES_PATH, unit_vectors
+from geodesic import haversine_km
+from timeline_loader import JOURNEY_START
+
+# Towns the van drives between, drawn from the bundled GeoNames places
+WAYPOINTS = 3000
+# Each waypoint's next stop is one of its nearest waypoints
+_NEIGHBOURS = 12
+
+# (mode, speed range in km/h, share of local trips) for trips around a stop
+_LOCAL_MODES = (('WALKING', (3, 5.5), 0.55), ('CYCLING', (12, 22), 0.25), ('RUNNING', (8, 12), 0.05),
+                ('IN_BUS', (25, 45), 0.15))
+_DRIVE_KMH = (45, 85)
+# Seconds between recorded path points
+_PATH_INTERVAL = 300
+_MAX_PATH_POINTS = 60
+
+
+def _lat_lng(lat, lng):
+    return f"{lat:.7f}°, {lng:.7f}°"
+
+
+def _time(moment):
+    return moment.isoformat(timespec='milliseconds')
+
+
+class _Trip:
+    """State of the synthetic journey as it is generated"""
+
+    def __init__(self, rng):
+        cities = pd.read_csv(CITIES_PATH, usecols=['lat', 'lng'])
+        rows = rng.choice(len(cities), size=min(WAYPOINTS, len(cities)), replace=False)
+        self.lats, self.lngs = cities['lat'].to_numpy()[rows], cities['lng'].to_numpy()[rows]
+        _, self.neighbours = cKDTree(unit_vectors(self.lats, self.lngs)).query(
+            unit_vectors(self.lats, self.lngs), k=_NEIGHBOURS + 1)
+        self.rng = rng
+        self.town = int(rng.integers(len(rows)))
+        # One campsite per town, so towns visited again give repeated stops at one place
+        self.campsites = {}
+        self.lat, self.lng = self.campsite(self.town)
+        self.time = datetime.fromisoformat(f'{JOURNEY_START}T08:00:00+00:00')
+
+    def campsite(self, town):
+        if town not in self.campsites:
+            lat, lng = self.offset(self.lats[town], self.lngs[town], 3.0)
+            self.campsites[town] = (lat, lng, f'ChIJsynth{town:06d}')
+        return self.campsites[town][:2]
+
+    def offset(self, lat, lng, km):
+        """A random point up to ``km`` from a point"""
+        distance, bearing = km * np.sqrt(self.rng.random()), self.rng.uniform(0, 2 * np.pi)
+        return (lat + distance * np.cos(bearing) / 111.32,
+                lng + distance * np.sin(bearing) / (111.32 * np.cos(np.radians(lat))))
+
+    def visit(self, hours, place_id, semantic_type='UNKNOWN'):
+        end = self.time + timedelta(hours=hours)
+        segment = {
+            'startTime': _time(self.time),
+            'endTime': _time(end),
+            'visit': {
+                'hierarchyLevel': 0,
+                'probability': round(float(self.rng.uniform(0.6, 0.99)), 3),
+                'topCandidate': {
+                    'placeId': place_id,
+                    'semanticType': semantic_type,
+                    'probability': round(float(self.rng.uniform(0.4, 0.95)), 3),
+                    'placeLocation': {'latLng': _lat_lng(self.lat, self.lng)}
+                }
+            }
+        }
+        self.time = end
+        return [segment]
+
+    def move(self, lat, lng, mode, speed_kmh, detour=None):
+        """An activity and its timelinePath from the current point to another"""
+        straight = float(haversine_km(self.lat, self.lng, lat, lng))
+        distance = straight * (detour or self.rng.uniform(1.1, 1.4))
+        seconds = max(distance / speed_kmh * 3600, 60)
+        end = self.time + timedelta(seconds=seconds)
+        activity = {
+            'startTime': _time(self.time),
+            'endTime': _time(end),
+            'activity': {
+                'start': {'latLng': _lat_lng(self.lat, self.lng)},
+                'end': {'latLng': _lat_lng(lat, lng)},
+                'distanceMeters': round(distance * 1000, 1),
+                'probability': round(float(self.rng.uniform(0.7, 0.99)), 3),
+                'topCandidate': {'type': mode, 'probability': round(float(self.rng.uniform(0.5, 0.99)), 3)}
+            }
+        }
+        count = int(min(max(seconds // _PATH_INTERVAL, 1), _MAX_PATH_POINTS - 1)) + 1
+        share = np.linspace(0, 1, count)
+        # Points wander off the straight line by up to a tenth of the trip
+        wobble = np.sin(share * np.pi) * self.rng.normal(0, straight / 10 / 111.32, 2)[:, None]
+        path_lats = self.lat + (lat - self.lat) * share + wobble[0]
+        path_lngs = self.lng + (lng - self.lng) * share + wobble[1]
+        path = {
+            'startTime': activity['startTime'],
+            'endTime': activity['endTime'],
+            'timelinePath': [
+                {'point': _lat_lng(path_lat, path_lng), 'time': _time(self.time + timedelta(seconds=seconds * f))}
+                for path_lat, path_lng, f in zip(path_lats.tolist(), path_lngs.tolist(), share.tolist())
+            ]
+        }
+        self.lat, self.lng, self.time = lat, lng, end
+        return [activity, path]
+
+    def day(self, outlier_rate):
+        """Segments of one day: a drive to a nearby town (or a rest day), trips around it and the night's stop"""
+        segments = []
+        rng = self.rng
+        if rng.random() < outlier_rate:
+            # A flight recorded as a car ride, like the misclassified segments in real exports
+            self.town = int(rng.integers(len(self.lats)))
+            segments += self.move(*self.campsite(self.town), 'IN_PASSENGER_VEHICLE', 700, detour=1.05)
+        elif rng.random() < 0.7:
+            self.town = int(rng.choice(self.neighbours[self.town][1:]))
+            segments += self.move(*self.campsite(self.town), 'IN_PASSENGER_VEHICLE', rng.uniform(*_DRIVE_KMH))
+
+        modes, speeds, shares = zip(*_LOCAL_MODES)
+        for _ in range(int(rng.integers(1, 8))):
+            # Out to a sight, a stop there, and back
+            camp_lat, camp_lng = self.lat, self.lng
+            mode = int(rng.choice(len(modes), p=shares))
+            speed = rng.uniform(*speeds[mode])
+            segments += self.visit(rng.uniform(0.2, 1.0), self.campsites[self.town][2])
+            segments += self.move(*self.offset(camp_lat, camp_lng, speed * 0.75), modes[mode], speed)
+            segments += self.visit(rng.uniform(0.3, 2.5), f'ChIJsight{int(rng.integers(10 ** 9)):09d}')
+            segments += self.move(camp_lat, camp_lng, modes[mode], speed)
+
+        # Sleep until the next morning, between 7 and 11
+        morning = self.time.replace(hour=int(rng.integers(7, 11)), minute=int(rng.integers(60))) + timedelta(days=1)
+        night = (morning - self.time).total_seconds() / 3600
+        segments += self.visit(max(night, 1.0), self.campsites[self.town][2], 'INFERRED_HOME')
+        return segments
+
+
+def generate_segments(count, seed=0, outlier_rate=0.002):
+    """Yield ``count`` semanticSegments of a van trip between European towns, in time order.
+
+    Days alternate between driving to a nearby town and resting; around each
+    stop there are walks, rides and bus trips out to sights and back. Every
+    activity is followed by its timelinePath, distances are the straight
+    line plus a detour and speeds fit the mode, except for a share of
+    ``outlier_rate`` days with a flight recorded as a car ride. A day has
+    about 20 segments, so a million of them span about 140 years (timestamps
+    have to stay before 2262).
+    """
+    trip = _Trip(np.random.default_rng(seed))
+    produced = 0
+    while produced < count:
+        for segment in trip.day(outlier_rate)[:count - produced]:
+            produced += 1
+            yield segment
+
+
+def write_timeline(path, count, seed=0, outlier_rate=0.002):
+    """Write a synthetic export of ``count`` segments to ``path``, one segment at a time"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"semanticSegments": [')
+        for i, segment in enumerate(generate_segments(count, seed, outlier_rate)):
+            f.write(('\n' if not i else ',\n') + json.dumps(segment, ensure_ascii=False))
+        f.write('\n], "rawSignals": [], "userLocationProfile": {}}\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic Google Timeline export")
+    parser.add_argument('output', help="JSON file to write")
+    parser.add_argument('--segments', type=int, default=10_000, help="Number of semanticSegments")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--outlier-rate', type=float, default=0.002,
+                        help="Share of days with a flight recorded as a car ride")
+    args = parser.parse_args()
+    write_timeline(args.output, args.segments, args.seed, args.outlier_rate)
+    print(f"Wrote {args.segments} segments to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
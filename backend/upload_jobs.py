@@ -0,0 +1,341 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from pathlib import Path
+
+from processed_cache import cache_path_for, file_lock, load_frames, resolve_countries, save_processed
+from shared_snapshot import build_lock_for, remove_stale, save_snapshot, shared_path_for
+from timeline_ingest import apply_additions, dataset_version, export_version
+from timeline_loader import DATA_DIR
+from timeline_snapshot import TimelineSnapshot
+
+# One JSON file per job, so every worker can report on jobs another one queued
+JOBS_DIR = Path(os.environ.get('UPLOAD_JOBS_DIR', DATA_DIR / "jobs"))
+# Processes that parse uploads, and jobs a worker queues before turning uploads away
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', 2))
+MAX_PENDING_UPLOADS = int(os.environ.get('MAX_PENDING_UPLOADS', 8))
+
+ACTIVE = ('queued', 'running')
+# The part of the progress each stage covers
+_STAGES = {'parsing': (0.0, 0.7), 'countries': (0.7, 0.85), 'aggregates': (0.85, 0.95), 'publishing': (0.95, 1.0)}
+# Seconds between progress writes while parsing
+_PROGRESS_INTERVAL = 0.5
+# Fields of a job that stay on the server
+_PRIVATE = ('upload_path', 'json_path', 'cache_dir', 'additions_dir', 'shared')
+_JOB_ID = re.compile(r'^[0-9a-f]{24}$')
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def save_stream(stream, directory, chunk_size=1 << 20):
+    """Copy a request body to a temporary file in ``directory`` in chunks; returns (path, sha256, size)"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(dir=directory, suffix='.upload')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: stream.read(chunk_size), b''):
+                digest.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return Path(path), digest.hexdigest(), size
+
+
+def job_id_for(journey_id, start_date, sha256):
+    """The same file uploaded for the same journey and start date is one job"""
+    return hashlib.sha256(f"{journey_id}:{start_date}:{sha256}".encode('utf-8')).hexdigest()[:24]
+
+
+def _job_path(job_id, jobs_dir=None):
+    return Path(jobs_dir or JOBS_DIR) / f"{job_id}.json"
+
+
+def read_job(job_id, jobs_dir=None):
+    """A job's state, or None if there is no such job"""
+    if not _JOB_ID.match(job_id or ''):
+        return None
+    try:
+        with open(_job_path(job_id, jobs_dir), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_job(path, job):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(job, f)
+    os.replace(tmp, path)
+
+
+def update_job(job_id, jobs_dir=None, **changes):
+    """Apply changes to a job's file under its lock (the web workers and the job's process both write it)"""
+    path = _job_path(job_id, jobs_dir)
+    with file_lock(path.with_suffix('.lock')):
+        with open(path, 'r') as f:
+            job = json.load(f)
+        job.update(changes, updated=_now())
+        _write_job(path, job)
+    return job
+
+
+def public_job(job):
+    return {name: value for name, value in job.items() if name not in _PRIVATE}
+
+
+class _Progress:
+    """Writes a running job's stage and progress, and stops it once a cancel is requested"""
+
+    def __init__(self, job_id, jobs_dir, total):
+        self.job_id, self.jobs_dir, self.total = job_id, jobs_dir, max(total, 1)
+        self._last = 0.0
+
+    def stage(self, name, done=0.0):
+        start, end = _STAGES[name]
+        job = update_job(self.job_id, self.jobs_dir, stage=name, progress=round(start + (end - start) * done, 4))
+        self._last = time.monotonic()
+        if job.get('cancel_requested'):
+            raise JobCancelled()
+
+    def parsed(self, characters):
+        # Characters of a mostly ASCII file are close enough to its bytes
+        if time.monotonic() - self._last >= _PROGRESS_INTERVAL:
+            self.stage('parsing', min(characters / self.total, 1.0))
+
+
+def run_job(job_id, jobs_dir=None):
+    """Process an uploaded export into the journey's caches, then put it in place of its export.
+
+    Runs in a pool process. The processed cache is written before the export
+    is moved in, under the cache's lock file, so web workers that notice the
+    new export read the cache instead of reprocessing it; with shared arrays
+    the snapshot file is built here too. Returns the final job state.
+    """
+    job = update_job(job_id, jobs_dir, status='running', started=_now())
+    upload_path, json_path = Path(job['upload_path']), Path(job['json_path'])
+    started = time.perf_counter()
+    try:
+        if job.get('cancel_requested'):
+            raise JobCancelled()
+        progress = _Progress(job_id, jobs_dir, job['size'])
+        progress.stage('parsing')
+        frames = load_frames(upload_path, job['start_date'], progress.parsed)
+        progress.stage('countries')
+        resolve_countries(frames)
+
+        stat = os.stat(upload_path)
+        # The rename keeps mtime and size, so the fingerprint still matches once the file is in place
+        fingerprint = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': job['sha256']}
+        snapshot = None
+        if job.get('shared'):
+            # Stores, spatial indexes and per-day totals, for the workers to map instead of building
+            progress.stage('aggregates')
+            version = dataset_version(export_version(fingerprint), job['additions_dir'])
+            snapshot = TimelineSnapshot(apply_additions(frames, job['additions_dir']), version)
+        progress.stage('publishing')
+
+        cache_path = cache_path_for(json_path, job['cache_dir'])
+        with file_lock(cache_path.with_suffix('.lock')):
+            save_processed(cache_path, frames, fingerprint, job['start_date'])
+            if snapshot is not None:
+                path = shared_path_for(json_path, snapshot.version, job['cache_dir'])
+                with file_lock(build_lock_for(json_path, job['cache_dir'])):
+                    save_snapshot(path, snapshot)
+                    remove_stale(json_path, path, job['cache_dir'])
+            os.replace(upload_path, json_path)
+        result = {
+            'activities': len(frames['activities']),
+            'visits': len(frames['visits']),
+            'paths': len(frames['paths']),
+            'seconds': round(time.perf_counter() - started, 2)
+        }
+        return update_job(job_id, jobs_dir, status='done', stage=None, progress=1.0, finished=_now(), result=result)
+    except JobCancelled:
+        return update_job(job_id, jobs_dir, status='cancelled', finished=_now())
+    except Exception as e:
+        print(f"Upload job {job_id} failed: {e}")
+        return update_job(job_id, jobs_dir, status='failed', finished=_now(), error=str(e))
+    finally:
+        if upload_path.exists():
+            upload_path.unlink()
+
+
+class InlineExecutor:
+    """Runs each job in the submitting thread: the stand-in queue for tests and local runs"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def create_executor(kind=None):
+    """The pool selected by UPLOAD_EXECUTOR: 'process' (default) or 'inline'"""
+    kind = (kind or os.environ.get('UPLOAD_EXECUTOR', 'process')).lower()
+    if kind == 'inline':
+        return InlineExecutor()
+    # Spawned rather than forked, as the web worker has threads running; one job per
+    # process, so the memory a large export took goes back to the OS
+    return ProcessPoolExecutor(max_workers=max(UPLOAD_WORKERS, 1), mp_context=multiprocessing.get_context('spawn'),
+                               max_tasks_per_child=1)
+
+
+class UploadQueue:
+    """Queues uploaded exports for processing off the web workers, one job per distinct upload.
+
+    ``submit`` returns the existing job when the same file was already
+    uploaded for the journey, unless that job failed or was cancelled. The
+    pool is created on first use, so a preloading gunicorn master never
+    starts one. ``on_done(job)`` is called in this process when a job it
+    queued finishes.
+    """
+
+    def __init__(self, executor=None, jobs_dir=None, max_pending=None, on_done=None):
+        self._executor = executor
+        self.jobs_dir = Path(jobs_dir or JOBS_DIR)
+        self.max_pending = max_pending if max_pending is not None else MAX_PENDING_UPLOADS
+        self.on_done = on_done
+        self._pending = {}  # job id -> future, for jobs queued by this process
+        self._lock = threading.Lock()
+        self.counters = {'submitted': 0, 'duplicates': 0, 'done': 0, 'failed': 0, 'cancelled': 0}
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = create_executor()
+            return self._executor
+
+    def submit(self, journey, upload_path, sha256, size):
+        """Queue an upload saved by save_stream for a journey's settings; returns (job, created).
+
+        Raises OverflowError when this worker already has ``max_pending`` jobs queued.
+        """
+        job_id = job_id_for(journey['id'], journey['start_date'], sha256)
+        path = _job_path(job_id, self.jobs_dir)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(path.with_suffix('.lock')):
+            existing = read_job(job_id, self.jobs_dir)
+            if existing is not None and existing['status'] not in ('failed', 'cancelled'):
+                upload_path.unlink()
+                with self._lock:
+                    self.counters['duplicates'] += 1
+                return existing, False
+            with self._lock:
+                if len(self._pending) >= self.max_pending:
+                    upload_path.unlink()
+                    raise OverflowError(f'{len(self._pending)} uploads are already being processed')
+            job = {
+                'id': job_id,
+                'journey_id': journey['id'],
+                'start_date': journey['start_date'],
+                'status': 'queued',
+                'stage': None,
+                'progress': 0.0,
+                'sha256': sha256,
+                'size': size,
+                'created': _now(),
+                'updated': _now(),
+                'upload_path': str(upload_path),
+                'json_path': str(journey['json_path']),
+                'cache_dir': str(journey['cache_dir']),
+                'additions_dir': str(journey['additions_dir']),
+                'shared': os.environ.get('SHARED_ARRAYS', '0').lower() in ('1', 'true', 'yes')
+            }
+            _write_job(path, job)
+
+        with self._lock:
+            self._pending[job_id] = None
+            self.counters['submitted'] += 1
+        try:
+            future = self._queue_job(job_id)
+        except Exception as e:
+            with self._lock:
+                self._pending.pop(job_id, None)
+            update_job(job_id, self.jobs_dir, status='failed', finished=_now(), error=str(e))
+            upload_path.unlink()
+            raise
+        with self._lock:
+            if job_id in self._pending:
+                self._pending[job_id] = future
+        future.add_done_callback(lambda future: self._finished(job_id, future))
+        # An inline executor has finished the job by now
+        return read_job(job_id, self.jobs_dir) or job, True
+
+    def _queue_job(self, job_id):
+        try:
+            return self._pool().submit(run_job, job_id, str(self.jobs_dir))
+        except BrokenProcessPool:
+            # A pool process died; its jobs failed, and later ones get a new pool
+            with self._lock:
+                self._executor = None
+            return self._pool().submit(run_job, job_id, str(self.jobs_dir))
+
+    def _finished(self, job_id, future):
+        with self._lock:
+            self._pending.pop(job_id, None)
+        try:
+            job = future.result()
+        except BaseException as e:
+            # Cancelled before it started, or the pool process died
+            job = read_job(job_id, self.jobs_dir)
+            if job is not None and job['status'] in ACTIVE:
+                cancelled = job.get('cancel_requested', False)
+                job = update_job(job_id, self.jobs_dir, status='cancelled' if cancelled else 'failed',
+                                 finished=_now(), error=None if cancelled else str(e) or type(e).__name__)
+                upload_path = Path(job['upload_path'])
+                if upload_path.exists():
+                    upload_path.unlink()
+        if job is None:
+            return
+        with self._lock:
+            if job['status'] in self.counters:
+                self.counters[job['status']] += 1
+        if self.on_done is not None:
+            try:
+                self.on_done(job)
+            except Exception as e:
+                print(f"Error after upload job {job_id}: {e}")
+
+    def cancel(self, job_id):
+        """Ask a job to stop; one still queued here stops straight away. Returns the job, or None"""
+        if read_job(job_id, self.jobs_dir) is None:
+            return None
+        job = update_job(job_id, self.jobs_dir, cancel_requested=True)
+        if job['status'] not in ACTIVE:
+            return job
+        with self._lock:
+            future = self._pending.get(job_id)
+        # A job already running stops at its next progress report
+        if future is not None and future.cancel():
+            job = read_job(job_id, self.jobs_dir)
+        return job
+
+    def status(self):
+        with self._lock:
+            status = dict(self.counters)
+            status['pending'] = len(self._pending)
+        status['max_pending'] = self.max_pending
+        return status
@@ -0,0 +1,107 @@
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+
+def _post(url, email):
+    request = urllib.request.Request(url, data=json.dumps({'email': email, 'source': 'load-test'}).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def _worker(worker, args, db_path, results):
+    from waitlist_store import JsonWaitlistStore, SqliteWaitlistStore
+    if args.url:
+        submit = lambda email: _post(args.url, email) == 201
+    elif args.backend == 'json':
+        store = JsonWaitlistStore(Path(db_path))
+        submit = lambda email: store.add(email, 'load-test')
+    else:
+        store = SqliteWaitlistStore(db_path)
+        submit = lambda email: store.add(email, 'load-test')
+
+    counts = {'added': 0, 'duplicate': 0, 'failed': 0}
+    lock = threading.Lock()
+
+    def signups(thread):
+        for i in range(args.signups):
+            # Every other worker repeats the previous worker's emails in other case, so half the
+            # signups race a duplicate from another process
+            owner = worker - worker % 2
+            email = f"user{owner}-{thread}-{i}@example.com"
+            try:
+                outcome = 'added' if submit(email.upper() if worker % 2 else email) else 'duplicate'
+            except Exception as e:
+                print(f"Signup failed: {e}")
+                outcome = 'failed'
+            with lock:
+                counts[outcome] += 1
+
+    threads = [threading.Thread(target=signups, args=(thread,)) for thread in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fire concurrent waitlist signups from several processes "
+                                                 "and check that none is lost or duplicated")
+    parser.add_argument('--processes', type=int, default=4, help="Processes, like gunicorn workers")
+    parser.add_argument('--threads', type=int, default=8, help="Concurrent signups per process")
+    parser.add_argument('--signups', type=int, default=250, help="Signups per thread")
+    parser.add_argument('--backend', choices=('sqlite', 'json'), default='sqlite',
+                        help="Store to write to directly, in a temporary file")
+    parser.add_argument('--url', help="POST to a running server's /api/waitlist instead, "
+                                      "e.g. http://localhost:5001/api/waitlist")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'waitlist.json' if args.backend == 'json' else 'waitlist.sqlite3')
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        processes = [context.Process(target=_worker, args=(worker, args, db_path, results))
+                     for worker in range(args.processes)]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        counts = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        total = {name: sum(c[name] for c in counts) for name in ('added', 'duplicate', 'failed')}
+        attempted = args.processes * args.threads * args.signups
+        # Pairs of processes share emails, so an odd last process has its emails to itself
+        expected = (args.processes + 1) // 2 * args.threads * args.signups
+        report = {
+            'backend': 'http' if args.url else args.backend,
+            'signups': attempted,
+            'seconds': round(elapsed, 2),
+            'signups_per_second': round(attempted / elapsed, 1),
+            **total,
+            'expected_added': expected
+        }
+        if not args.url:
+            from waitlist_store import JsonWaitlistStore, SqliteWaitlistStore
+            store = JsonWaitlistStore(Path(db_path)) if args.backend == 'json' else SqliteWaitlistStore(db_path)
+            report['stored'] = store.count()
+        print(json.dumps(report))
+        if total['added'] != expected or report.get('stored', expected) != expected:
+            raise SystemExit("Signups were lost or duplicated")
+
+
+if __name__ == '__main__':
+    main()
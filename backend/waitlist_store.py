@@ -0,0 +1,235 @@
+import argparse
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from processed_cache import file_lock
+from timeline_loader import DATA_DIR
+
+WAITLIST_DB_PATH = DATA_DIR / "waitlist.sqlite3"
+# The file the waitlist was kept in before; copied into SQLite by ``python waitlist_store.py``
+LEGACY_WAITLIST_PATH = DATA_DIR / "waitlist.json"
+
+# Signups written in one transaction at most
+MAX_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS waitlist (
+    id INTEGER PRIMARY KEY,
+    email TEXT NOT NULL,
+    email_normalized TEXT NOT NULL,
+    source TEXT,
+    timestamp TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS waitlist_email ON waitlist (email_normalized);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def normalize_email(email):
+    """The form emails are compared in, so 'Ana@Mail.com ' and 'ana@mail.com' are one signup"""
+    return email.strip().lower()
+
+
+class SqliteWaitlistStore:
+    """Waitlist signups in a SQLite file (WAL mode) shared by every worker.
+
+    A unique index on the normalized email makes duplicate checks an index
+    lookup and keeps concurrent signups from different workers from ever
+    adding one email twice. Signups are handed to one writer thread per
+    process, which commits whatever has queued up while the previous
+    transaction ran in a single transaction (group commit), so a burst costs
+    a few commits instead of one per request.
+    """
+
+    def __init__(self, path=None):
+        self.path = str(path or os.environ.get('WAITLIST_DB_PATH', WAITLIST_DB_PATH))
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        self._connect().executescript(_SCHEMA)
+        self._queue = queue.Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Writers from other workers wait for the lock instead of failing
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _start_writer(self):
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_batches, name='waitlist-writer', daemon=True)
+                self._writer.start()
+
+    def add(self, email, source='homepage', timestamp=None):
+        """Add a signup; returns True if it is new, False if the email was already on the waitlist"""
+        self._start_writer()
+        done = threading.Event()
+        entry = {'row': (email, normalize_email(email), source, timestamp or datetime.now().isoformat()), 'done': done}
+        self._queue.put(entry)
+        done.wait()
+        if 'error' in entry:
+            raise entry['error']
+        return entry['added']
+
+    def _write_batches(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                added = self.insert_many([entry['row'] for entry in batch])
+                for entry, is_new in zip(batch, added):
+                    entry['added'] = is_new
+            except Exception as e:
+                print(f"Error writing {len(batch)} waitlist signups: {e}")
+                for entry in batch:
+                    entry['error'] = e
+            for entry in batch:
+                entry['done'].set()
+
+    def _transaction(self, write):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = write(conn)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    @staticmethod
+    def _insert(conn, rows):
+        return [conn.execute(
+            'INSERT INTO waitlist (email, email_normalized, source, timestamp) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (email_normalized) DO NOTHING', row
+        ).rowcount == 1 for row in rows]
+
+    def insert_many(self, rows):
+        """Insert (email, normalized, source, timestamp) rows in one transaction; returns whether each was new"""
+        return self._transaction(lambda conn: self._insert(conn, rows))
+
+    def import_once(self, key, rows):
+        """Insert rows unless ``key`` is recorded in the meta table, recording it in the same transaction.
+
+        Returns the number of signups added, or None if ``key`` was imported before.
+        """
+        def write(conn):
+            if conn.execute('SELECT 1 FROM meta WHERE key = ?', (key,)).fetchone():
+                return None
+            added = sum(self._insert(conn, rows))
+            conn.execute('INSERT INTO meta (key, value) VALUES (?, ?)',
+                         (key, json.dumps({'imported_at': datetime.now().isoformat(), 'added': added})))
+            return added
+        return self._transaction(write)
+
+    def meta(self, key):
+        row = self._connect().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def count(self):
+        return self._connect().execute('SELECT COUNT(*) FROM waitlist').fetchone()[0]
+
+    def entries(self):
+        """Every signup in the order it was added, as the JSON file listed them"""
+        rows = self._connect().execute('SELECT email, timestamp, source FROM waitlist ORDER BY id')
+        return [{'email': email, 'timestamp': timestamp, 'source': source} for email, timestamp, source in rows]
+
+
+class JsonWaitlistStore:
+    """The original waitlist.json file, rewritten in full on every signup.
+
+    Kept for local development; a lock file serializes signups across
+    workers, but every one still costs a read and a write of the whole file.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path or LEGACY_WAITLIST_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _load(self):
+        if not self.path.exists():
+            return []
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def add(self, email, source='homepage', timestamp=None):
+        with file_lock(self.path.with_suffix('.lock')):
+            waitlist = self._load()
+            normalized = normalize_email(email)
+            if any(normalize_email(entry['email']) == normalized for entry in waitlist):
+                return False
+            waitlist.append({'email': email, 'timestamp': timestamp or datetime.now().isoformat(), 'source': source})
+            with open(self.path, 'w') as f:
+                json.dump(waitlist, f, indent=2)
+            return True
+
+    def count(self):
+        return len(self._load())
+
+    def entries(self):
+        return self._load()
+
+
+def migrate_json(store, json_path=None):
+    """Copy the signups of a waitlist.json file into a SQLite store, once per file content.
+
+    The file is left in place; its SHA-256 is recorded in the store's meta
+    table in the same transaction as the signups, so running the migration
+    again (or on every deploy) adds nothing until the file changes, and then
+    only the emails not in the store yet. Returns the number of signups added.
+    """
+    json_path = Path(json_path or LEGACY_WAITLIST_PATH)
+    if not json_path.exists():
+        print(f"No waitlist file at {json_path}, nothing to migrate")
+        return 0
+    content = json_path.read_bytes()
+    waitlist = json.loads(content)
+    rows = [(entry['email'], normalize_email(entry['email']), entry.get('source'),
+             entry.get('timestamp') or datetime.now().isoformat())
+            for entry in waitlist if entry.get('email')]
+    added = store.import_once(f"migrated:{hashlib.sha256(content).hexdigest()}", rows)
+    if added is None:
+        print(f"{json_path} was already migrated")
+        return 0
+    print(f"Migrated {added} of {len(waitlist)} waitlist signups from {json_path}")
+    return added
+
+
+def create_waitlist_store(backend=None):
+    """Build the store selected by WAITLIST_BACKEND ('sqlite' or 'json')"""
+    backend = (backend or os.environ.get('WAITLIST_BACKEND', 'sqlite')).lower()
+    if backend == 'json':
+        return JsonWaitlistStore()
+    return SqliteWaitlistStore()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy a waitlist.json file into the SQLite waitlist; run on deploy")
+    parser.add_argument('json_path', nargs='?', default=str(LEGACY_WAITLIST_PATH), help="waitlist.json to migrate")
+    args = parser.parse_args()
+    store = SqliteWaitlistStore()
+    migrate_json(store, args.json_path)
+    print(f"{store.count()} signups in {store.path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -140,7 +140,9 @@ export class DashboardComponent implements OnInit, AfterViewInit {
       {
         label: 'Days On The Road',
         primary: `${stats.days_on_road}`,
-        secondary: 'Since June 10, 2025',
+        secondary: `Since ${new Date(`${stats.journey_start}T00:00:00Z`).toLocaleDateString('en-US', {
+          month: 'long', day: 'numeric', year: 'numeric', timeZone: 'UTC'
+        })}`,
         icon: '<path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M8 7V3m8 4V3m-9 8h10M5 21h14a2 2 0 002-2V7a2 2 0 00-2-2H5a2 2 0 00-2 2v12a2 2 0 002 2z"/>'
       }
     ];
@@ -1,6 +1,6 @@
 import { Injectable } from '@angular/core';
 import { HttpClient, HttpParams } from '@angular/common/http';
-import { Observable } from 'rxjs';
+import { Observable, map, shareReplay } from 'rxjs';
 import { environment } from '../../environments/environment';
 
 export interface DashboardStats {
@@ -9,10 +9,12 @@ export interface DashboardStats {
   cycling_distance: number;
   countries_visited: number;
   days_on_road: number;
+  journey_start: string; // YYYY-MM-DD, the day days_on_road counts from
   current_location: string;
   total_activities: number;
   avg_distance_per_day: number;
   most_common_activity: string;
+  outlier_activities: number; // implausibly fast for their type, see getOutliers
 }
 
 export interface MapDataPoint {
@@ -36,6 +38,46 @@ export interface RecentStop {
   end_time: string;
   duration_hours: number;
   coordinates?: [number, number];
+  distance_km?: number; // nearest/within queries only
+  pending?: boolean;
+  place_id?: number;
+  visit_count?: number; // consecutive visits merged into this stop
+}
+
+export interface Place {
+  place_id: number;
+  name: string;
+  pending: boolean;
+  coordinates: [number, number];
+  visit_count: number;
+  stay_count: number;
+  dwell_hours: number;
+  first_visit: string;
+  last_visit: string;
+}
+
+export interface PlacePage {
+  places: Place[];
+  total: number;
+}
+
+export interface StopPage {
+  stops: RecentStop[];
+  total: number; // stops matching before the limit was applied
+}
+
+export interface Journey {
+  id: string;
+  name: string;
+  start_date: string;
+  loaded: boolean;
+}
+
+export interface JourneyList {
+  journeys: Journey[];
+  default: string;
+  loaded: number;
+  max_loaded: number;
 }
 
 export interface HealthCheck {
@@ -53,16 +95,100 @@ export interface FilterOptions {
   };
 }
 
-interface PlotlyFilters {
-  country?: string;
-  transport_mode?: string;
+export interface PathDay {
+  date: string;
+  paths: number;
+  points: number;
+  distance_km: number; // great-circle length along the points
+}
+
+export interface OutlierActivity {
+  start_time: string;
+  end_time: string;
+  activity_type: string;
+  distance_km: number; // as reported in the export
+  straight_km: number; // between the start and end points
+  speed_kmh: number | null; // null when the distance was covered in no time
+  plausibility: number; // 0-1, below the server's threshold
+}
+
+export interface OutlierPage {
+  outliers: OutlierActivity[];
+  total: number;
+}
+
+export interface PathIndex {
+  days: PathDay[];
+  precision: number;
+  total_points: number;
+}
+
+export interface EncodedPath {
+  start_time: string;
+  end_time: string;
+  polyline: string;
+}
+
+export interface DayPath {
+  date: string;
+  precision: number;
+  paths: EncodedPath[];
+}
+
+// One day of paths decoded from the binary format: path i is points offsets[i]..offsets[i + 1]
+export interface PackedDayPath {
+  offsets: Int32Array;
+  lats: Float64Array;
+  lngs: Float64Array;
+}
+
+export interface StatsSeries {
+  key: string | null; // activity type or country; null for unknown
+  distance_km: number[];
+  duration_hours: number[];
+  count: number[];
+}
+
+// One value per bucket, bucket i starting on buckets[i] (YYYY-MM-DD)
+export interface StatsTimeseries {
+  granularity: 'day' | 'week' | 'month';
+  group_by: 'mode' | 'country' | null;
+  buckets: string[];
+  series: StatsSeries[];
+  visits: { dwell_hours: number[]; count: number[] };
+}
+
+export interface MapDataPage {
+  activities: MapDataPoint[];
+  next_cursor: string | null;
+}
+
+// Activity filters shared by the map and stats endpoints; every given filter must match
+interface ActivityFilters {
+  country?: string; // comma-separated for several
+  transport_mode?: string; // comma-separated for several
   start_date?: string;
   end_date?: string;
+  bbox?: string; // 'min_lng,min_lat,max_lng,max_lat'
+  min_distance?: number; // meters
+  min_duration?: number; // hours
+  exclude_outliers?: boolean;
+}
+
+interface TimeseriesFilters extends ActivityFilters {
+  granularity?: 'day' | 'week' | 'month';
+  group_by?: 'mode' | 'country';
+}
+
+interface PlotlyFilters extends ActivityFilters {
+  zoom?: number;
 }
 
 @Injectable({ providedIn: 'root' })
 export class ApiService {
   private readonly baseUrl = this.getApiUrl();
+  // Day chunks are fetched on first use and shared by later subscribers
+  private readonly dayPaths = new Map<string, Observable<DayPath>>();
 
   constructor(private readonly http: HttpClient) {}
 
@@ -75,8 +201,24 @@ export class ApiService {
     return environment.apiUrl;
   }
 
-  getDashboardStats(): Observable<DashboardStats> {
-    return this.http.get<DashboardStats>(`${this.baseUrl}/dashboard/stats`);
+  private filterParams(filters: object): HttpParams {
+    let params = new HttpParams();
+    Object.entries(filters).forEach(([key, value]) => {
+      if (value !== undefined && value !== null && value !== '') params = params.set(key, String(value));
+    });
+    return params;
+  }
+
+  getDashboardStats(excludeOutliers: boolean = false): Observable<DashboardStats> {
+    return this.http.get<DashboardStats>(`${this.baseUrl}/dashboard/stats`, {
+      params: this.filterParams({ exclude_outliers: excludeOutliers || undefined })
+    });
+  }
+
+  // Activities moving implausibly fast for their type, least plausible first
+  getOutliers(limit: number = 100): Observable<OutlierPage> {
+    const params = new HttpParams().set('limit', limit.toString());
+    return this.http.get<OutlierPage>(`${this.baseUrl}/stats/outliers`, { params });
   }
 
   getMapData(startDate?: string, endDate?: string): Observable<MapDataPoint[]> {
@@ -86,24 +228,129 @@ export class ApiService {
     return this.http.get<MapDataPoint[]>(`${this.baseUrl}/map/data`, { params });
   }
 
+  // One page of map data; pass the previous page's next_cursor to continue
+  getMapDataPage(filters: ActivityFilters = {}, limit: number = 1000, cursor?: string): Observable<MapDataPage> {
+    let params = this.filterParams(filters).set('limit', limit.toString());
+    if (cursor) params = params.set('cursor', cursor);
+    return this.http.get<MapDataPage>(`${this.baseUrl}/map/data`, { params });
+  }
+
   getRecentStops(limit: number = 10): Observable<RecentStop[]> {
     const params = new HttpParams().set('limit', limit.toString());
     return this.http.get<RecentStop[]>(`${this.baseUrl}/recent-stops`, { params });
   }
 
+  // Stops inside the visible map area, most recent first
+  getStopsInView(bbox: string, limit: number = 1000): Observable<StopPage> {
+    const params = new HttpParams().set('bbox', bbox).set('limit', limit.toString());
+    return this.http.get<StopPage>(`${this.baseUrl}/stops`, { params });
+  }
+
+  getNearestStops(lat: number, lng: number, k: number = 10): Observable<RecentStop[]> {
+    const params = new HttpParams().set('lat', lat.toString()).set('lng', lng.toString()).set('k', k.toString());
+    return this.http.get<RecentStop[]>(`${this.baseUrl}/stops/nearest`, { params });
+  }
+
+  getStopsWithin(lat: number, lng: number, radiusKm: number, limit: number = 1000): Observable<StopPage> {
+    const params = new HttpParams()
+      .set('lat', lat.toString())
+      .set('lng', lng.toString())
+      .set('radius_km', radiusKm.toString())
+      .set('limit', limit.toString());
+    return this.http.get<StopPage>(`${this.baseUrl}/stops/within`, { params });
+  }
+
+  // Stops clustered into places, sorted by last visit, total dwell time or number of visits
+  getPlaces(sort: 'recent' | 'dwell' | 'visits' = 'recent', limit: number = 100): Observable<PlacePage> {
+    const params = new HttpParams().set('sort', sort).set('limit', limit.toString());
+    return this.http.get<PlacePage>(`${this.baseUrl}/places`, { params });
+  }
+
   getHealth(): Observable<HealthCheck> {
     return this.http.get<HealthCheck>(`${this.baseUrl}/health`);
   }
 
+  // Every journey is also served under `${baseUrl}/<id>/...`
+  getJourneys(): Observable<JourneyList> {
+    return this.http.get<JourneyList>(`${this.baseUrl}/journeys`);
+  }
+
   getPlotlyMap(filters: PlotlyFilters = {}): Observable<unknown> {
-    let params = new HttpParams();
-    Object.entries(filters).forEach(([key, value]) => {
-      if (value) params = params.set(key, value);
-    });
-    return this.http.get(`${this.baseUrl}/map/plotly`, { params });
+    return this.http.get(`${this.baseUrl}/map/plotly`, { params: this.filterParams(filters) });
+  }
+
+  getStatsTimeseries(filters: TimeseriesFilters = {}): Observable<StatsTimeseries> {
+    return this.http.get<StatsTimeseries>(`${this.baseUrl}/stats/timeseries`, { params: this.filterParams(filters) });
   }
 
   getFilterOptions(): Observable<FilterOptions> {
     return this.http.get<FilterOptions>(`${this.baseUrl}/filters`);
   }
+
+  getPathIndex(): Observable<PathIndex> {
+    return this.http.get<PathIndex>(`${this.baseUrl}/paths`);
+  }
+
+  getDayPath(date: string): Observable<DayPath> {
+    let request = this.dayPaths.get(date);
+    if (!request) {
+      request = this.http.get<DayPath>(`${this.baseUrl}/paths/${date}`).pipe(shareReplay(1));
+      this.dayPaths.set(date, request);
+    }
+    return request;
+  }
+
+  getDayPathBinary(date: string): Observable<PackedDayPath> {
+    const params = new HttpParams().set('format', 'binary');
+    return this.http
+      .get(`${this.baseUrl}/paths/${date}`, { params, responseType: 'arraybuffer' })
+      .pipe(map(buffer => ApiService.unpackPaths(buffer)));
+  }
+
+  // Decode a Google encoded polyline into [lat, lng] pairs
+  static decodePolyline(encoded: string, precision: number = 5): [number, number][] {
+    const factor = Math.pow(10, precision);
+    const points: [number, number][] = [];
+    let index = 0;
+    let lat = 0;
+    let lng = 0;
+    while (index < encoded.length) {
+      const deltas = [0, 0];
+      for (let i = 0; i < 2; i++) {
+        let shift = 0;
+        let result = 0;
+        let byte: number;
+        do {
+          byte = encoded.charCodeAt(index++) - 63;
+          result |= (byte & 0x1f) << shift;
+          shift += 5;
+        } while (byte >= 0x20);
+        deltas[i] = result & 1 ? ~(result >> 1) : result >> 1;
+      }
+      lat += deltas[0];
+      lng += deltas[1];
+      points.push([lat / factor, lng / factor]);
+    }
+    return points;
+  }
+
+  // Layout: path count, point count, offsets, then (lat, lng) deltas in 1e-5 degrees
+  static unpackPaths(buffer: ArrayBuffer): PackedDayPath {
+    const data = new Int32Array(buffer);
+    const pathCount = data[0];
+    const pointCount = data[1];
+    const offsets = data.subarray(2, 3 + pathCount);
+    const deltas = data.subarray(3 + pathCount);
+    const lats = new Float64Array(pointCount);
+    const lngs = new Float64Array(pointCount);
+    let lat = 0;
+    let lng = 0;
+    for (let i = 0; i < pointCount; i++) {
+      lat += deltas[2 * i];
+      lng += deltas[2 * i + 1];
+      lats[i] = lat / 1e5;
+      lngs[i] = lng / 1e5;
+    }
+    return { offsets, lats, lngs };
+  }
 }